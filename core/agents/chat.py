@@ -3,11 +3,11 @@ from pathlib import Path
 from agno.agent import Agent
 from agno.memory.v2.db.sqlite import SqliteMemoryDb
 from agno.memory.v2.memory import Memory
-from agno.models.google import Gemini
 from agno.storage.sqlite import SqliteStorage
-from agno.tools.googlesheets import GoogleSheetsTools
 
+from agents.gemini import RateLimitedGemini
 from config.settings import settings
+from tools.sheets import CachedGoogleSheetsTools
 
 
 def create_agent(user: str | None = None, session: str | None = None):
@@ -21,9 +21,9 @@ def create_agent(user: str | None = None, session: str | None = None):
     agent = Agent(
         user_id=user,
         session_id=session,
-        model=Gemini(id="gemini-2.0-flash", api_key=settings.GEMINI_API_KEY),
+        model=RateLimitedGemini(id="gemini-2.0-flash", api_key=settings.GEMINI_API_KEY),
         tools=[
-            GoogleSheetsTools(
+            CachedGoogleSheetsTools(
                 creds_path=settings.GOOGLE_APPLICATION_CREDENTIALS,
                 token_path=Path(settings.CACHE_DIR) / "token.json",
             )
@@ -1,38 +1,34 @@
-from datetime import date, datetime
+import threading
+from datetime import date
+from pathlib import Path
 from textwrap import dedent
 
 from agno.agent import Agent
 from agno.memory.v2.memory import Memory
-from agno.models.google import Gemini
 from agno.team import Team
-from agno.tools.duckdb import DuckDbTools
-from pydantic import BaseModel
 from rich.prompt import Prompt
 
+from agents.expense_parser import parse_expense
+from agents.gemini import RateLimitedGemini
+from agents.query_cache import RecordingDuckDbTools, query_cache
+from agents.receipt_parser import parse_receipt
+from agents.schema import Expense, ExpenseResult
 from config.settings import settings
+from db.catalog import catalog_cache
+from db.connection import get_manager
+from db.sandbox import QuerySandbox
 from db.schema import (
     SQL_CATEGORY_SCHEMA,
     SQL_FUND_SCHEMA,
+    SQL_MONTHLY_SPENDING_SCHEMA,
     SQL_TRANSACTION_SCHEMA,
 )
-
-
-class Expense(BaseModel):
-    date: datetime | None
-    category: str | None
-    name: str | None
-    amount: float | None
-    currency: str | None
-
-
-class ExpenseResult(BaseModel):
-    data: Expense | None
-    continue_question: str | None
+from tools.ledger import LedgerTools
 
 
 def create_agent():
     agent = Agent(
-        model=Gemini(
+        model=RateLimitedGemini(
             id="gemini-2.0-flash",
             api_key=settings.GEMINI_API_KEY,
         ),
@@ -52,23 +48,39 @@ def create_agent():
     return agent
 
 
+# Teams reused per (database, username), rebuilt when the catalog or the day
+# embedded in their description changes
+_teams: dict[tuple[str, str], tuple[tuple, Team, RecordingDuckDbTools]] = {}
+_teams_lock = threading.Lock()
+
+
 def create_agent_v2(db_path: str, username: str):
-    duckdb_tool = DuckDbTools(db_path=db_path)
-    category_table = duckdb_tool.run_query(
-        """
-        SELECT
-            category.id AS category_id,
-            category.category_name,
-            fund.id AS fund_id,
-            fund.fund_name
-        FROM
-            fund
-            LEFT OUTER JOIN category ON (fund.id = category.fund_id)
-        """
+    return _get_team(db_path, username)[0]
+
+
+def _get_team(db_path: str, username: str) -> tuple[Team, RecordingDuckDbTools]:
+    catalog = catalog_cache.get(db_path)
+    key = (str(Path(db_path).resolve()), username)
+    version = (catalog.version, date.today())
+    with _teams_lock:
+        cached = _teams.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1], cached[2]
+
+    # Share the process-wide database handle instead of opening the file again,
+    # its memory and thread limits were set when it was opened.
+    # Model-written SQL runs read-only with a deadline and a row cap, and is
+    # recorded so answered questions can be cached as templates.
+    sandbox = QuerySandbox(
+        get_manager(db_path).cursor(),
+        timeout=settings.SQL_TIMEOUT,
+        max_rows=settings.SQL_MAX_ROWS,
     )
+    duckdb_tool = RecordingDuckDbTools(sandbox)
+    category_table = catalog.as_text()
     team = Team(
         name="Expense Team",
-        model=Gemini(
+        model=RateLimitedGemini(
             id="gemini-2.0-flash-exp",
             api_key=settings.GEMINI_API_KEY,
         ),
@@ -86,6 +98,11 @@ def create_agent_v2(db_path: str, username: str):
         {SQL_FUND_SCHEMA}
         {SQL_CATEGORY_SCHEMA}
         {SQL_TRANSACTION_SCHEMA}
+        {SQL_MONTHLY_SPENDING_SCHEMA}
+
+        monthly_spending holds pre-aggregated totals of transaction per month
+        (month is the first day of the month). Answer totals/aggregate questions
+        from it instead of scanning transaction.
         
         Created Categories/Funds
         {category_table}
@@ -98,7 +115,7 @@ def create_agent_v2(db_path: str, username: str):
         members=[
             Agent(
                 name="Think",
-                model=Gemini(
+                model=RateLimitedGemini(
                     id="gemini-2.0-flash-exp",
                     api_key=settings.GEMINI_API_KEY,
                 ),
@@ -116,16 +133,18 @@ def create_agent_v2(db_path: str, username: str):
             ),
             Agent(
                 name="Executor",
-                model=Gemini(
+                model=RateLimitedGemini(
                     id="gemini-2.0-flash-exp",
                     api_key=settings.GEMINI_API_KEY,
                 ),
                 description="Run the SQL using DuckDB and return clean results or confirmation.",
-                tools=[duckdb_tool],
+                tools=[duckdb_tool, LedgerTools(db_path, username)],
                 instructions=dedent("""
                     You receive SQL queries to run on the database via DuckDB.
                     - If it's a SELECT query, format the output in a readable table.
-                    - If it's an INSERT or UPDATE, confirm execution and describe what changed.
+                    - run_query only runs a single read-only SELECT and returns at most a few hundred rows; aggregate instead of listing many rows, and rewrite a query that timed out to be cheaper.
+                    - For monthly totals use get_monthly_spending instead of aggregating transactions.
+                    - To insert, update or delete transactions use the ledger tools, not SQL, so the monthly totals stay correct. Create a missing category with add_category. Confirm execution and describe what changed.
                 """),
             ),
         ],
@@ -138,7 +157,51 @@ def create_agent_v2(db_path: str, username: str):
         markdown=True,
     )
 
-    return team
+    with _teams_lock:
+        _teams[key] = (version, team, duckdb_tool)
+    return team, duckdb_tool
+
+
+async def answer_question(db_path: str, username: str, message: str) -> str:
+    """Answer a message with the expense team, reusing cached queries
+
+    Repeated or paraphrased analytical questions are answered by re-running
+    the SQL the team wrote the first time (see `QueryCache`), without any
+    LLM call. A question answered by a cacheable query gets the query
+    result as its answer the first time too, so the answer does not change
+    form once it comes from the cache.
+
+    Args:
+        db_path: ledger database
+        username: user asking
+        message: a chat message
+
+    Returns:
+        The answer
+    """
+    catalog_version = catalog_cache.version(db_path)
+    answer = query_cache.get(db_path, username, message, catalog_version)
+    if answer is not None:
+        return answer
+
+    team, duckdb_tool = _get_team(db_path, username)
+    ledger_version = query_cache.ledger_version(db_path, username)
+    duckdb_tool.reset()
+    response = await team.arun(message, user_id=username)
+    # Only a question answered by a single SELECT makes a reusable template
+    if len(duckdb_tool.queries) == 1 and duckdb_tool.results[0] is not None:
+        answer = query_cache.put(
+            db_path,
+            username,
+            message,
+            duckdb_tool.queries[0],
+            duckdb_tool.results[0],
+            catalog_version,
+            ledger_version,
+        )
+        if answer is not None:
+            return answer
+    return response.content
 
 
 async def extract_expense_info(message: str) -> Expense | None:
@@ -150,6 +213,11 @@ async def extract_expense_info(message: str) -> Expense | None:
     Returns:
         expense: an expense detail or None if cannot be extracted
     """
+    # Simple messages like "cafe 45k" are parsed without a model call
+    expense = parse_expense(message)
+    if expense is not None:
+        return expense
+
     agent = create_agent()
 
     # TODO: add a more clever way to ask question
@@ -173,3 +241,28 @@ async def extract_expense_info(message: str) -> Expense | None:
     if resp:
         return resp.data
     return None
+
+
+async def extract_receipt_expenses(text: str) -> list[Expense]:
+    """Extract the expenses of a receipt from its OCR text
+
+    Receipts are parsed by rules (see `parse_receipt`), giving one expense
+    per item when the items add up to the total; only a receipt parsed with
+    a confidence below `RECEIPT_MIN_CONFIDENCE` is sent to the LLM.
+
+    Args:
+        text: OCR output of the receipt, markdown
+
+    Returns:
+        expenses: the receipt's expenses, empty if none could be extracted
+    """
+    receipt = parse_receipt(text)
+    if receipt.confidence >= settings.RECEIPT_MIN_CONFIDENCE:
+        return receipt.expenses()
+
+    agent = create_agent()
+    result = await agent.arun(f"Extract the expense paid on this receipt:\n\n{text}")
+    resp: ExpenseResult | None = result.content
+    if resp is None or resp.data is None:
+        return []
+    return [resp.data]
@@ -0,0 +1,278 @@
+import re
+import unicodedata
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from agents.schema import Expense
+from config.settings import settings
+
+# Keyword -> (category, name). Matched on whole words of the lowercased message,
+# longest keyword first.
+CATEGORY_GAZETTEER: dict[str, tuple[str, str]] = {
+    # food
+    "cafe": ("food", "coffee"),
+    "café": ("food", "coffee"),
+    "coffee": ("food", "coffee"),
+    "cà phê": ("food", "coffee"),
+    "cafê": ("food", "coffee"),
+    "trà sữa": ("food", "milk tea"),
+    "milk tea": ("food", "milk tea"),
+    "lunch": ("food", "lunch"),
+    "ăn trưa": ("food", "lunch"),
+    "bữa trưa": ("food", "lunch"),
+    "an trua": ("food", "lunch"),
+    "breakfast": ("food", "breakfast"),
+    "ăn sáng": ("food", "breakfast"),
+    "an sang": ("food", "breakfast"),
+    "dinner": ("food", "dinner"),
+    "ăn tối": ("food", "dinner"),
+    "an toi": ("food", "dinner"),
+    "phở": ("food", "pho"),
+    "pho": ("food", "pho"),
+    "bún": ("food", "noodles"),
+    "cơm": ("food", "rice"),
+    "bánh mì": ("food", "banh mi"),
+    "pizza": ("food", "pizza"),
+    "ăn uống": ("food", "food"),
+    "nhà hàng": ("food", "restaurant"),
+    "restaurant": ("food", "restaurant"),
+    # grocery
+    "đi chợ": ("grocery", "market"),
+    "chợ": ("grocery", "market"),
+    "siêu thị": ("grocery", "supermarket"),
+    "supermarket": ("grocery", "supermarket"),
+    "groceries": ("grocery", "groceries"),
+    "grocery": ("grocery", "groceries"),
+    "market": ("grocery", "market"),
+    # transport
+    "grab": ("transport", "grab"),
+    "taxi": ("transport", "taxi"),
+    "xe ôm": ("transport", "motorbike taxi"),
+    "xăng": ("transport", "fuel"),
+    "đổ xăng": ("transport", "fuel"),
+    "gas": ("transport", "fuel"),
+    "bus": ("transport", "bus"),
+    "gửi xe": ("transport", "parking"),
+    "parking": ("transport", "parking"),
+    # clothing
+    "t-shirt": ("clothing", "t-shirt"),
+    "shirt": ("clothing", "shirt"),
+    "áo": ("clothing", "shirt"),
+    "quần": ("clothing", "pants"),
+    "giày": ("clothing", "shoes"),
+    "shoes": ("clothing", "shoes"),
+    # entertainment
+    "movie": ("entertainment", "movie"),
+    "xem phim": ("entertainment", "movie"),
+    "netflix": ("entertainment", "netflix"),
+    "spotify": ("entertainment", "spotify"),
+    # bills
+    "tiền điện": ("bills", "electricity"),
+    "electricity": ("bills", "electricity"),
+    "tiền nước": ("bills", "water"),
+    "internet": ("bills", "internet"),
+    "wifi": ("bills", "internet"),
+    "tiền nhà": ("bills", "rent"),
+    "rent": ("bills", "rent"),
+    # health
+    "thuốc": ("health", "medicine"),
+    "medicine": ("health", "medicine"),
+    "pharmacy": ("health", "pharmacy"),
+}
+
+# Phrase -> day offset from today
+RELATIVE_DAYS: dict[str, int] = {
+    "hôm nay": 0,
+    "hom nay": 0,
+    "today": 0,
+    "sáng nay": 0,
+    "trưa nay": 0,
+    "tối nay": 0,
+    "tonight": 0,
+    "this morning": 0,
+    "hôm qua": -1,
+    "hom qua": -1,
+    "yesterday": -1,
+    "tối qua": -1,
+    "đêm qua": -1,
+    "last night": -1,
+    "hôm kia": -2,
+    "hom kia": -2,
+    "day before yesterday": -2,
+}
+
+# Anything that is not a plain past expense is left to the LLM
+REJECT_MARKERS = [
+    "bao nhiêu",
+    "how much",
+    "how many",
+    "tổng",
+    "total",
+    "show",
+    "xem lại",
+    "ngày mai",
+    "tomorrow",
+    "will",
+    "sẽ",
+    "next",
+    "tuần sau",
+    "last week",
+    "tuần trước",
+    "last monday",
+    "xóa",
+    "delete",
+    "sửa",
+    "change",
+]
+
+# Suffix -> (multiplier, currency)
+AMOUNT_SUFFIXES: dict[str, tuple[float, str]] = {
+    "k": (1_000, "VND"),
+    "nghìn": (1_000, "VND"),
+    "ngàn": (1_000, "VND"),
+    "ng": (1_000, "VND"),
+    "tr": (1_000_000, "VND"),
+    "triệu": (1_000_000, "VND"),
+    "củ": (1_000_000, "VND"),
+    "đ": (1, "VND"),
+    "đồng": (1, "VND"),
+    "vnd": (1, "VND"),
+    "vnđ": (1, "VND"),
+    "$": (1, "USD"),
+    "usd": (1, "USD"),
+    "đô": (1, "USD"),
+}
+# Bare numbers at least this large are taken as VND, smaller ones are ambiguous
+MIN_BARE_VND = 1_000
+
+_SUFFIX_PATTERN = "|".join(
+    re.escape(suffix) for suffix in sorted(AMOUNT_SUFFIXES, key=len, reverse=True)
+)
+AMOUNT_RE = re.compile(
+    rf"(?<![\w/:.,-])(?P<prefix>\$)?\s*"
+    rf"(?P<number>\d+(?:[.,]\d+)*)"
+    rf"\s*(?P<suffix>{_SUFFIX_PATTERN})?(?P<fraction>\d)?"
+    rf"(?![\w/:-])",
+)
+NUMBER_RE = re.compile(r"\d")
+
+
+def _phrase_re(phrases) -> re.Pattern:
+    ordered = sorted(phrases, key=len, reverse=True)
+    return re.compile(
+        r"(?<!\w)(" + "|".join(re.escape(phrase) for phrase in ordered) + r")(?!\w)"
+    )
+
+
+CATEGORY_RE = _phrase_re(CATEGORY_GAZETTEER)
+RELATIVE_DAY_RE = _phrase_re(RELATIVE_DAYS)
+REJECT_RE = _phrase_re(REJECT_MARKERS)
+
+
+def _parse_number(number: str, has_multiplier: bool) -> float | None:
+    """Parse "45", "1.500.000", "1,5" or "12.99" """
+    parts = re.split(r"[.,]", number)
+    if len(parts) == 1:
+        return float(number)
+    if len(parts) == 2 and (len(parts[1]) != 3 or has_multiplier):
+        # A decimal separator: 1,5tr / 12.99$
+        return float(f"{parts[0]}.{parts[1]}")
+    if all(len(part) == 3 for part in parts[1:]):
+        # Thousands separators: 1.500.000 / 50,000
+        return float("".join(parts))
+    return None
+
+
+def _parse_amount(text: str) -> tuple[float, str] | None:
+    matches = list(AMOUNT_RE.finditer(text))
+    if len(matches) != 1:
+        return None
+    match = matches[0]
+    suffix = match.group("suffix")
+    if match.group("prefix"):
+        if suffix and AMOUNT_SUFFIXES[suffix][1] != "USD":
+            return None
+        suffix = suffix or "$"
+
+    multiplier, currency = AMOUNT_SUFFIXES.get(suffix, (1, "VND"))
+    value = _parse_number(match.group("number"), multiplier > 1)
+    if value is None:
+        return None
+    if match.group("fraction"):
+        # 1tr5 = 1.5 million, 2k5 = 2.5 thousand
+        if multiplier == 1:
+            return None
+        value += int(match.group("fraction")) / 10
+    if suffix is None and value < MIN_BARE_VND:
+        return None
+
+    # Nothing else number-like may remain, e.g. an explicit date
+    rest = text[: match.start()] + text[match.end() :]
+    if NUMBER_RE.search(rest):
+        return None
+    return value * multiplier, currency
+
+
+def local_time(now: datetime | None = None) -> datetime:
+    """`now`, by default the current time, as a naive local time
+
+    Users talk about their wall clock ("hôm qua", the time printed on a
+    receipt) and the ledger stores naive local timestamps. Local is the
+    `TIMEZONE` setting, or the system's time zone when it is empty.
+    """
+    tz = ZoneInfo(settings.TIMEZONE) if settings.TIMEZONE else None
+    if now is None:
+        return datetime.now(tz).replace(tzinfo=None)
+    if now.tzinfo is not None:
+        return now.astimezone(tz).replace(tzinfo=None)
+    return now
+
+
+def parse_expense(message: str, now: datetime | None = None) -> Expense | None:
+    """Parse simple expense messages without calling a model
+
+    Handles messages like "cafe 45k", "I spent 100$ on lunch" or "Hôm qua đi
+    chợ 500 ngàn": exactly one amount (with k/ngàn/triệu/$/... suffixes), a
+    category keyword from `CATEGORY_GAZETTEER` and optionally a relative day
+    such as "hôm qua"/"yesterday".
+
+    Args:
+        message: a chat message
+        now: current time, defaults to now; converted to local time
+
+    Returns:
+        The expense, or None when the message is not confidently understood
+        and should go to the LLM
+    """
+    now = local_time(now)
+    text = unicodedata.normalize("NFC", message).lower().strip()
+    if not text or "?" in text or REJECT_RE.search(text):
+        return None
+
+    categories = {CATEGORY_GAZETTEER[m] for m in CATEGORY_RE.findall(text)}
+    if len(categories) != 1:
+        return None
+    category, name = categories.pop()
+
+    offsets = {RELATIVE_DAYS[m] for m in RELATIVE_DAY_RE.findall(text)}
+    if len(offsets) > 1:
+        return None
+    offset = offsets.pop() if offsets else 0
+
+    amount = _parse_amount(text)
+    if amount is None:
+        return None
+    value, currency = amount
+
+    date = now
+    if offset:
+        date = (now + timedelta(days=offset)).replace(
+            hour=0, minute=0, second=0, microsecond=0
+        )
+    return Expense(
+        date=date,
+        category=category,
+        name=name,
+        amount=value,
+        currency=currency,
+    )
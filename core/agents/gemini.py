@@ -0,0 +1,64 @@
+from dataclasses import dataclass, field
+from typing import List
+
+from agno.exceptions import ModelProviderError
+from agno.models.google import Gemini
+from agno.models.message import Message
+
+from services.rate_limit import TokenBucket, rate_limits
+
+
+@dataclass
+class RateLimitedGemini(Gemini):
+    """Gemini whose every model call takes a token from the `gemini` budget
+
+    A rate limit error reported by the API slows the budget down for every
+    agent of the process, successes let it recover.
+    """
+
+    limiter: TokenBucket = field(default_factory=lambda: rate_limits["gemini"])
+
+    def _report(self, error: ModelProviderError | None = None):
+        if error is None:
+            self.limiter.succeed()
+        elif error.status_code == 429:
+            self.limiter.throttle()
+
+    def invoke(self, messages: List[Message]):
+        self.limiter.acquire()
+        try:
+            response = super().invoke(messages)
+        except ModelProviderError as e:
+            self._report(e)
+            raise
+        self._report()
+        return response
+
+    def invoke_stream(self, messages: List[Message]):
+        self.limiter.acquire()
+        try:
+            yield from super().invoke_stream(messages)
+        except ModelProviderError as e:
+            self._report(e)
+            raise
+        self._report()
+
+    async def ainvoke(self, messages: List[Message]):
+        await self.limiter.acquire_async()
+        try:
+            response = await super().ainvoke(messages)
+        except ModelProviderError as e:
+            self._report(e)
+            raise
+        self._report()
+        return response
+
+    async def ainvoke_stream(self, messages: List[Message]):
+        await self.limiter.acquire_async()
+        try:
+            async for chunk in super().ainvoke_stream(messages):
+                yield chunk
+        except ModelProviderError as e:
+            self._report(e)
+            raise
+        self._report()
@@ -0,0 +1,105 @@
+import asyncio
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Callable, Generic, TypeVar
+
+from config.logger import logger
+
+T = TypeVar("T")
+
+
+@dataclass
+class PoolStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+
+@dataclass
+class _Entry(Generic[T]):
+    agent: T
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    last_used: float = field(default_factory=time.monotonic)
+    users: int = 0  # tasks holding or waiting for the lock
+
+
+class AgentPool(Generic[T]):
+    """Bounded pool of agents keyed by user/chat
+
+    Each key has its own agent and asyncio lock: different keys run in
+    parallel while messages of one key are handled one at a time, in arrival
+    order. Least recently used agents are evicted when the pool is full, and
+    agents idle for longer than `idle_timeout` seconds are dropped. Agents
+    that are busy or have messages waiting for their lock are never evicted,
+    so a key never has two agents at once.
+
+    Args:
+        factory: creates the agent of a key
+        max_size: maximum number of agents kept
+        idle_timeout: seconds after which an unused agent is dropped
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[str], T],
+        max_size: int = 128,
+        idle_timeout: float = 1800.0,
+    ):
+        self.factory = factory
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.stats = PoolStats()
+        self._entries: OrderedDict[str, _Entry[T]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _evict(self, key: str, reason: str):
+        del self._entries[key]
+        self.stats.evictions += 1
+        logger.debug("Evicted agent %s (%s)", key, reason)
+
+    def _sweep(self, keep: str):
+        now = time.monotonic()
+        # Ordered from least to most recently used
+        # Runs without awaiting, no task can start waiting on an entry between
+        # the check and the eviction
+        for key, entry in list(self._entries.items()):
+            if key == keep or entry.users or entry.lock.locked():
+                continue
+            if now - entry.last_used > self.idle_timeout:
+                self._evict(key, "idle")
+            elif len(self._entries) > self.max_size:
+                self._evict(key, "lru")
+            else:
+                break
+
+    def _get(self, key: str) -> _Entry[T]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self.stats.hits += 1
+            self._entries.move_to_end(key)
+        else:
+            self.stats.misses += 1
+            entry = self._entries[key] = _Entry(agent=self.factory(key))
+        entry.last_used = time.monotonic()
+        self._sweep(keep=key)
+        return entry
+
+    @asynccontextmanager
+    async def acquire(self, key: str) -> AsyncIterator[T]:
+        """Get the agent of `key`, holding its lock for the duration"""
+        entry = self._get(key)
+        # A released lock is not locked until its next waiter runs, the count
+        # keeps the entry from being swept in between
+        entry.users += 1
+        try:
+            async with entry.lock:
+                try:
+                    yield entry.agent
+                finally:
+                    entry.last_used = time.monotonic()
+        finally:
+            entry.users -= 1
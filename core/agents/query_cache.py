@@ -0,0 +1,515 @@
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date, timedelta
+from decimal import Decimal
+from pathlib import Path
+
+import duckdb
+
+from config.settings import settings
+from db.connection import get_manager
+from db.sandbox import QueryRejected, QueryResult, QuerySandbox
+from tools.sql import SandboxedDuckDbTools
+
+# Any insert, delete or touched transaction of the user moves one of these
+LEDGER_FINGERPRINT_QUERY = """
+SELECT COUNT(1), MAX(id), MAX(updated_at) FROM transaction WHERE by = ?
+"""
+
+# Phrases are matched after lowercasing and stripping diacritics
+WINDOW_PHRASES: dict[str, str] = {
+    "today": "today",
+    "hom nay": "today",
+    "yesterday": "yesterday",
+    "hom qua": "yesterday",
+    "this week": "this_week",
+    "tuan nay": "this_week",
+    "last week": "last_week",
+    "tuan truoc": "last_week",
+    "this month": "this_month",
+    "thang nay": "this_month",
+    "last month": "last_month",
+    "thang truoc": "last_month",
+    "this year": "this_year",
+    "nam nay": "this_year",
+    "last year": "last_year",
+    "nam ngoai": "last_year",
+    "nam truoc": "last_year",
+}
+# Only questions are cached, never requests that may write
+QUESTION_WORDS = {
+    "how",
+    "what",
+    "which",
+    "when",
+    "where",
+    "show",
+    "list",
+    "total",
+    "bao",
+    "nhieu",
+    "gi",
+    "nao",
+    "dau",
+    "xem",
+    "liet",
+    "tong",
+}
+SYNONYMS: dict[str, str] = {
+    "spend": "spend",
+    "spent": "spend",
+    "spending": "spend",
+    "paid": "spend",
+    "pay": "spend",
+    "chi": "spend",
+    "tieu": "spend",
+    "xai": "spend",
+    "much": "amount",
+    "nhieu": "amount",
+    "total": "amount",
+    "tong": "amount",
+    "sum": "amount",
+    "many": "count",
+    "times": "count",
+    "lan": "count",
+    "count": "count",
+    "show": "list",
+    "list": "list",
+    "liet": "list",
+    "ke": "list",
+    "xem": "list",
+}
+# Tokens (after `SYNONYMS`) of a question about spending or transaction counts
+LEDGER_TOKENS = {"amount", "spend", "count"}
+STOPWORDS = {
+    "i",
+    "me",
+    "my",
+    "we",
+    "our",
+    "did",
+    "do",
+    "does",
+    "have",
+    "has",
+    "had",
+    "the",
+    "a",
+    "an",
+    "on",
+    "for",
+    "in",
+    "of",
+    "to",
+    "at",
+    "is",
+    "was",
+    "are",
+    "so",
+    "far",
+    "how",
+    "what",
+    "which",
+    "please",
+    "all",
+    "there",
+    "toi",
+    "minh",
+    "em",
+    "anh",
+    "da",
+    "bao",
+    "cho",
+    "vao",
+    "la",
+    "trong",
+    "cua",
+    "roi",
+    "het",
+    "duoc",
+    "nhung",
+    "cac",
+    "gi",
+    "nao",
+    "vay",
+    "khoan",
+    "tien",
+    "oi",
+    "nhe",
+}
+
+DATE_LITERAL_RE = (
+    r"(?:DATE\s+|TIMESTAMP\s+)?'{day}(?: 00:00:00)?'(?:::(?:DATE|TIMESTAMP))?"
+)
+ANY_DATE_LITERAL_RE = re.compile(r"'\d{4}-\d{2}-\d{2}")
+
+
+def _strip_accents(text: str) -> str:
+    text = unicodedata.normalize("NFD", text.lower()).replace("đ", "d")
+    return "".join(c for c in text if unicodedata.category(c) != "Mn")
+
+
+def _window(label: str, today: date) -> tuple[date, date]:
+    """Bounds of a named date window, the end is exclusive"""
+    if label == "today":
+        return today, today + timedelta(days=1)
+    if label == "yesterday":
+        return today - timedelta(days=1), today
+    if label == "this_week":
+        start = today - timedelta(days=today.weekday())
+        return start, start + timedelta(days=7)
+    if label == "last_week":
+        start = today - timedelta(days=today.weekday() + 7)
+        return start, start + timedelta(days=7)
+    if label == "this_month":
+        start = today.replace(day=1)
+        return start, (start + timedelta(days=32)).replace(day=1)
+    if label == "last_month":
+        end = today.replace(day=1)
+        return (end - timedelta(days=1)).replace(day=1), end
+    if label == "this_year":
+        return date(today.year, 1, 1), date(today.year + 1, 1, 1)
+    if label == "last_year":
+        return date(today.year - 1, 1, 1), date(today.year, 1, 1)
+    raise ValueError(f"Unknown date window {label}")
+
+
+@dataclass(frozen=True)
+class Intent:
+    """Normalized question: paraphrases share the same tokens and window"""
+
+    tokens: tuple[str, ...]
+    window: str | None = None
+
+    def params(self, username: str, today: date) -> dict:
+        params = {"username": username}
+        if self.window is not None:
+            start, end = _window(self.window, today)
+            params.update(start=start, end=end, last_day=end - timedelta(days=1))
+        return params
+
+
+def normalize_intent(message: str) -> Intent | None:
+    """Reduce an analytical question to its intent
+
+    "How much did I spend on food this month?" and "tháng này tôi chi bao
+    nhiêu cho food" both become `Intent(("amount", "food", "spend"),
+    "this_month")`.
+
+    Returns:
+        The intent, or None if the message does not look like a question
+    """
+    text = _strip_accents(message)
+    words = set(re.findall(r"[a-z0-9]+", text))
+    if "?" not in message and not words & QUESTION_WORDS:
+        return None
+
+    window = None
+    for phrase in sorted(WINDOW_PHRASES, key=len, reverse=True):
+        if re.search(rf"\b{phrase}\b", text):
+            if window is not None and window != WINDOW_PHRASES[phrase]:
+                return None
+            window = WINDOW_PHRASES[phrase]
+            text = re.sub(rf"\b{phrase}\b", " ", text)
+
+    tokens = set()
+    for word in re.findall(r"[a-z0-9]+", text):
+        word = SYNONYMS.get(word, word)
+        if word not in STOPWORDS:
+            tokens.add(word)
+    if not tokens:
+        return None
+    return Intent(tuple(sorted(tokens)), window)
+
+
+def is_ledger_question(message: str) -> bool:
+    """Whether a message asks for ledger amounts or counts over a date window
+
+    "how much did I spend on food this month" is one, "list my sheets" or
+    "what is in my google sheet" are not: the chat agent answers those.
+    """
+    intent = normalize_intent(message)
+    return (
+        intent is not None
+        and intent.window is not None
+        and bool(set(intent.tokens) & LEDGER_TOKENS)
+    )
+
+
+def to_template(sql: str, intent: Intent, username: str, today: date) -> str | None:
+    """Replace the user and date window literals of a query by parameters
+
+    Returns:
+        The template, or None if the query is not a single SELECT or still
+        holds dates that the window cannot reproduce
+    """
+    try:
+        statements = duckdb.extract_statements(sql)
+    except duckdb.Error:
+        return None
+    if len(statements) != 1 or statements[0].type != duckdb.StatementType.SELECT:
+        return None
+
+    template = sql.strip().rstrip(";")
+    template = template.replace(f"'{username}'", "$username")
+    if intent.window is not None:
+        params = intent.params(username, today)
+        for name in ("start", "end", "last_day"):
+            pattern = DATE_LITERAL_RE.format(day=params[name].isoformat())
+            template = re.sub(pattern, f"${name}", template, flags=re.IGNORECASE)
+    if ANY_DATE_LITERAL_RE.search(template):
+        return None
+    return template
+
+
+def _format_value(value) -> str:
+    if value is None:
+        return "-"
+    if isinstance(value, (float, Decimal)):
+        return f"{value:,.0f}" if value % 1 == 0 else f"{value:,.2f}"
+    if isinstance(value, int):
+        return f"{value:,}"
+    return str(value)
+
+
+def render(columns: list[str], rows: list[tuple]) -> str:
+    """Format a query result as the chat answer
+
+    A single value reads "total: 1,250,000", other results are one line per
+    row under a header.
+    """
+    if not rows:
+        return "No matching transactions."
+    if len(columns) == 1 and len(rows) == 1:
+        return f"{columns[0]}: {_format_value(rows[0][0])}"
+    lines = [" | ".join(columns)]
+    lines += [" | ".join(_format_value(value) for value in row) for row in rows]
+    return "\n".join(lines)
+
+
+class RecordingDuckDbTools(SandboxedDuckDbTools):
+    """Sandboxed DuckDbTools that remember the queries run since the last `reset`
+
+    `results` holds the result of each query of `queries`, None for those
+    that were rejected or failed.
+    """
+
+    def __init__(self, sandbox: QuerySandbox, **kwargs):
+        super().__init__(sandbox, **kwargs)
+        self.queries: list[str] = []
+        self.results: list[QueryResult | None] = []
+
+    def reset(self):
+        self.queries = []
+        self.results = []
+
+    def _execute(self, query: str) -> QueryResult:
+        self.queries.append(query.split(";")[0])
+        self.results.append(None)
+        result = super()._execute(query)
+        self.results[-1] = result
+        return result
+
+
+@dataclass
+class QueryCacheStats:
+    hits: int = 0
+    misses: int = 0
+    stores: int = 0
+    refreshes: int = 0  # hits re-run because the ledger changed
+    evictions: int = 0
+    expirations: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / max(self.hits + self.misses, 1)
+
+
+@dataclass
+class _Entry:
+    template: str
+    catalog_version: tuple
+    ledger_version: tuple
+    answer: str
+    day: date
+    created_at: float
+
+
+class QueryCache:
+    """Cache of analytical questions to SQL templates, per user
+
+    Entries are keyed by database, user and normalized intent (see
+    `normalize_intent`), and hold a SQL template whose user and date window
+    are parameters, so paraphrases and the same question on another day
+    reuse it without asking the LLM to plan again. The last answer is kept
+    along with a fingerprint of the user's transactions; a write to the
+    ledger changes the fingerprint and the template is re-run, through a
+    `QuerySandbox` like the queries the model writes. Entries are
+    dropped when the fund/category catalog changes, after `ttl` seconds, or
+    least recently used first beyond `max_size`.
+
+    Args:
+        max_size: maximum number of entries
+        ttl: seconds an entry is kept
+    """
+
+    def __init__(self, max_size: int = 256, ttl: float = 86400.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.stats = QueryCacheStats()
+        self._entries: OrderedDict[tuple, _Entry] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _key(db_path: str | Path, username: str, intent: Intent) -> tuple:
+        return (str(Path(db_path).resolve()), username, intent)
+
+    @staticmethod
+    def ledger_version(db_path: str | Path, username: str) -> tuple:
+        with get_manager(db_path).reader() as cursor:
+            return cursor.execute(LEDGER_FINGERPRINT_QUERY, (username,)).fetchone()
+
+    @staticmethod
+    def _execute(db_path: str | Path, template: str, params: dict) -> QueryResult:
+        """Run a template with the same limits as the queries the model writes"""
+        cursor = get_manager(db_path).cursor()
+        try:
+            sandbox = QuerySandbox(
+                cursor, timeout=settings.SQL_TIMEOUT, max_rows=settings.SQL_MAX_ROWS
+            )
+            return sandbox.execute(template, params)
+        finally:
+            cursor.close()
+
+    def get(
+        self,
+        db_path: str | Path,
+        username: str,
+        message: str,
+        catalog_version: tuple,
+        today: date | None = None,
+    ) -> str | None:
+        """Answer `message` from the cache
+
+        Returns:
+            The query result, or None on a miss
+        """
+        today = today or date.today()
+        intent = normalize_intent(message)
+        if intent is None:
+            return None
+        key = self._key(db_path, username, intent)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (
+                time.monotonic() - entry.created_at > self.ttl
+                or entry.catalog_version != catalog_version
+            ):
+                del self._entries[key]
+                self.stats.expirations += 1
+                entry = None
+            if entry is None:
+                self.stats.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+
+        ledger_version = self.ledger_version(db_path, username)
+        if entry.ledger_version == ledger_version and entry.day == today:
+            return entry.answer
+
+        params = intent.params(username, today)
+        params = {
+            name: value
+            for name, value in params.items()
+            if f"${name}" in entry.template
+        }
+        try:
+            result = self._execute(db_path, entry.template, params)
+        except (QueryRejected, TimeoutError, duckdb.Error):
+            # Let the team plan the question again
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+            return None
+        answer = render(result.columns, result.rows)
+        with self._lock:
+            entry.answer = answer
+            entry.ledger_version = ledger_version
+            entry.day = today
+            self.stats.refreshes += 1
+        return answer
+
+    def put(
+        self,
+        db_path: str | Path,
+        username: str,
+        message: str,
+        sql: str,
+        result: QueryResult,
+        catalog_version: tuple,
+        ledger_version: tuple,
+        today: date | None = None,
+    ) -> str | None:
+        """Remember the query that answered `message`
+
+        Args:
+            sql: the query
+            result: its result, as the recording tool captured it; a
+                truncated result is not cached
+            ledger_version: `ledger_version` taken before the query was planned;
+                a different current version means the run wrote to the ledger
+                and nothing is stored
+
+        Returns:
+            The answer later hits return, None if the query was not cached
+        """
+        today = today or date.today()
+        intent = normalize_intent(message)
+        if intent is None:
+            return None
+        template = to_template(sql, intent, username, today)
+        if (
+            template is None
+            or result.truncated
+            or self.ledger_version(db_path, username) != ledger_version
+        ):
+            return None
+
+        answer = render(result.columns, result.rows)
+        key = self._key(db_path, username, intent)
+        with self._lock:
+            self._entries[key] = _Entry(
+                template=template,
+                catalog_version=catalog_version,
+                ledger_version=ledger_version,
+                answer=answer,
+                day=today,
+                created_at=time.monotonic(),
+            )
+            self._entries.move_to_end(key)
+            self.stats.stores += 1
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.stats.evictions += 1
+        return answer
+
+    def invalidate(self, db_path: str | Path, username: str | None = None):
+        """Drop the entries of a database, or of one of its users"""
+        db_key = str(Path(db_path).resolve())
+        with self._lock:
+            for key in list(self._entries):
+                if key[0] == db_key and username in (None, key[1]):
+                    del self._entries[key]
+
+
+query_cache = QueryCache(
+    max_size=settings.QUERY_CACHE_SIZE, ttl=settings.QUERY_CACHE_TTL
+)
@@ -0,0 +1,338 @@
+import re
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+from agents.expense_parser import (
+    AMOUNT_RE,
+    AMOUNT_SUFFIXES,
+    CATEGORY_GAZETTEER,
+    CATEGORY_RE,
+    MIN_BARE_VND,
+    _parse_number,
+    _phrase_re,
+    local_time,
+)
+from agents.schema import Expense
+
+# Lines giving the amount paid, the last one wins
+TOTAL_MARKERS = [
+    "total",
+    "grand total",
+    "amount due",
+    "tổng",
+    "tổng cộng",
+    "tổng tiền",
+    "tổng thanh toán",
+    "thanh toán",
+    "thành tiền",
+    "cộng",
+]
+# Lines that are neither items nor the total
+SUBTOTAL_MARKERS = [
+    "subtotal",
+    "sub total",
+    "sub-total",
+    "tạm tính",
+    "tổng tiền hàng",
+    "cộng tiền hàng",
+]
+# Amounts added to, or taken off, the items
+SURCHARGE_MARKERS = [
+    "vat",
+    "tax",
+    "thuế",
+    "service charge",
+    "phí dịch vụ",
+    "phí phục vụ",
+]
+DISCOUNT_MARKERS = [
+    "discount",
+    "giảm giá",
+    "chiết khấu",
+    "khuyến mãi",
+    "voucher",
+]
+# Header and payment lines carrying numbers that are not amounts
+SKIP_MARKERS = [
+    "tel",
+    "phone",
+    "hotline",
+    "đt",
+    "sđt",
+    "điện thoại",
+    "mst",
+    "tax code",
+    "mã số thuế",
+    "invoice no",
+    "bill no",
+    "receipt no",
+    "số hđ",
+    "số hóa đơn",
+    "table",
+    "bàn",
+    "cash",
+    "tiền mặt",
+    "tiền khách đưa",
+    "khách đưa",
+    "change",
+    "tiền thừa",
+    "tiền thối",
+    "trả lại",
+    "card",
+    "thẻ",
+]
+# Titles printed above the merchant's name
+TITLE_MARKERS = [
+    "receipt",
+    "invoice",
+    "bill",
+    "hóa đơn",
+    "hoá đơn",
+    "phiếu thanh toán",
+    "phiếu tính tiền",
+]
+
+TOTAL_RE = _phrase_re(TOTAL_MARKERS)
+SUBTOTAL_RE = _phrase_re(SUBTOTAL_MARKERS)
+SURCHARGE_RE = _phrase_re(SURCHARGE_MARKERS)
+DISCOUNT_RE = _phrase_re(DISCOUNT_MARKERS)
+SKIP_RE = _phrase_re(SKIP_MARKERS)
+TITLE_RE = _phrase_re(TITLE_MARKERS)
+
+# Receipts print day first: 15/03/2025, 15-03-25, 15.03.2025 or 2025-03-15,
+# optionally followed by a time
+DATE_RE = re.compile(
+    r"(?<!\d)(?:(?P<year>\d{4})-(?P<month>\d{1,2})-(?P<day>\d{1,2})"
+    r"|(?P<d>\d{1,2})([/.-])(?P<m>\d{1,2})\5(?P<y>\d{4}|\d{2}))(?!\d)"
+    r"(?:[\sT,]+(?P<hour>\d{1,2})[:h](?P<minute>\d{2})(?::\d{2})?)?"
+)
+TABLE_RULE_RE = re.compile(r"^\|?[\s:|-]+\|?$")
+# Item numbers, quantities and markdown left around an item's name
+QUANTITY_RE = re.compile(r"(?<!\w)(?:x\s*\d+|\d+\s*x|\d+)(?!\w)")
+MARKUP_RE = re.compile(r"[|*#_`>]+")
+NEGATIVE_RE = re.compile(r"(?<!\w)-(?=\d)")
+
+
+@dataclass
+class ReceiptLine:
+    name: str
+    amount: float
+
+
+@dataclass
+class ReceiptExtraction:
+    merchant: str | None = None
+    date: datetime | None = None
+    currency: str = "VND"
+    category: str | None = None
+    items: list[ReceiptLine] = field(default_factory=list)
+    subtotal: float | None = None
+    adjustments: float = 0.0  # taxes and charges minus discounts
+    total: float | None = None
+    confidence: float = 0.0
+
+    @property
+    def reconciled(self) -> bool:
+        """Whether the items, taxes and discounts add up to the total"""
+        if self.total is None or not (self.items or self.subtotal is not None):
+            return False
+        items = sum(item.amount for item in self.items)
+        return _close((self.subtotal or items) + self.adjustments, self.total)
+
+    def expenses(self, now: datetime | None = None) -> list[Expense]:
+        """The receipt's expenses, one per item when the items add up
+
+        Taxes and discounts are spread over the items in proportion to their
+        amounts, so the expenses add up to the total paid. Receipts whose
+        items do not add up give one expense for the total.
+        """
+        if self.total is None:
+            return []
+        date = self.date or local_time(now)
+        items = sum(item.amount for item in self.items)
+        if self.items and _close(items + self.adjustments, self.total):
+            digits = 0 if self.currency == "VND" else 2
+            amounts = [
+                round(item.amount * self.total / items, digits) for item in self.items
+            ]
+            # The rounding goes to the last item
+            amounts[-1] = round(self.total - sum(amounts[:-1]), digits)
+            return [
+                Expense(
+                    date=date,
+                    category=_category(item.name.lower())[0] or self.category,
+                    name=item.name,
+                    amount=amount,
+                    currency=self.currency,
+                )
+                for item, amount in zip(self.items, amounts)
+            ]
+        return [
+            Expense(
+                date=date,
+                category=self.category,
+                name=self.merchant,
+                amount=self.total,
+                currency=self.currency,
+            )
+        ]
+
+
+def _close(value: float, total: float) -> bool:
+    # Rounding of the printed prices
+    return abs(value - total) <= max(1.0, total * 0.005)
+
+
+def _category(text: str) -> tuple[str | None, str | None]:
+    found = Counter(CATEGORY_GAZETTEER[m] for m in CATEGORY_RE.findall(text))
+    if not found:
+        return None, None
+    return found.most_common(1)[0][0]
+
+
+def _amounts(line: str) -> list[tuple[float, str | None]]:
+    """Money amounts of a receipt line with their currency if printed
+
+    Unlike chat messages, a line holds several numbers: quantities and item
+    numbers are told apart from prices because they are small bare integers.
+    Bare numbers with a leading zero are phone numbers.
+    """
+    amounts = []
+    # Discounts are printed as -10,000
+    line = NEGATIVE_RE.sub(" ", line)
+    for match in AMOUNT_RE.finditer(line):
+        number, suffix = match.group("number"), match.group("suffix")
+        if match.group("prefix"):
+            suffix = suffix or "$"
+        multiplier, currency = AMOUNT_SUFFIXES.get(suffix, (1, None))
+        value = _parse_number(number, multiplier > 1)
+        if value is None or match.group("fraction"):
+            continue
+        if suffix is None and (
+            number.startswith("0") or (number.isdigit() and value < MIN_BARE_VND)
+        ):
+            continue
+        amounts.append((value * multiplier, currency))
+    return amounts
+
+
+def _date(line: str, now: datetime) -> datetime | None:
+    """First valid date of a line that is not in the future"""
+    for match in DATE_RE.finditer(line):
+        year = match.group("year") or match.group("y")
+        month = match.group("month") or match.group("m")
+        day = match.group("day") or match.group("d")
+        year = int(year) + 2000 if len(year) == 2 else int(year)
+        hour, minute = int(match.group("hour") or 0), int(match.group("minute") or 0)
+        # Month first (US receipts) only when day first is not a date
+        for m, d in ((int(month), int(day)), (int(day), int(month))):
+            try:
+                date = datetime(year, m, d, hour, minute)
+            except ValueError:
+                continue
+            if date <= now + timedelta(days=1):
+                return date
+            break
+    return None
+
+
+def _lines(text: str):
+    """Lines of OCR markdown, table rows flattened, with whether they were rows"""
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or TABLE_RULE_RE.match(line):
+            continue
+        is_row = line.startswith("|")
+        yield " ".join(MARKUP_RE.sub(" ", line).split()), is_row
+
+
+def _item_name(line: str) -> str:
+    line = AMOUNT_RE.sub(" ", line)
+    line = QUANTITY_RE.sub(" ", line)
+    return " ".join(line.split()).strip(" .:;,-")
+
+
+def parse_receipt(text: str, now: datetime | None = None) -> ReceiptExtraction:
+    """Extract the expenses of a receipt from its OCR text without a model
+
+    Reads the merchant (the first line of text above any price), the date,
+    the line items (a name followed by prices, the last one being the line's
+    amount), taxes and discounts and the total (the last line marked
+    "Total"/"Tổng cộng"/...; items are no longer looked for after it) from
+    the markdown and tables returned by OCR.
+
+    The confidence adds up what was found: a total (0.5), items, taxes and
+    discounts that add up to it (0.3) or no items at all (0.15), a date
+    (0.1) and a category (0.1).
+
+    Args:
+        text: OCR output of the receipt
+        now: current time, defaults to now; dates printed on the receipt are
+            read as local time (see `local_time`)
+
+    Returns:
+        What was extracted, see `ReceiptExtraction.expenses`
+    """
+    now = local_time(now)
+    receipt = ReceiptExtraction()
+    currencies: Counter[str] = Counter()
+    header = True
+    for raw, is_row in _lines(unicodedata.normalize("NFC", text)):
+        line = raw.lower()
+        date = _date(line, now)
+        if date is not None:
+            receipt.date = receipt.date or date
+            header = False
+            continue
+
+        amounts = _amounts(line)
+        currencies.update(currency for _, currency in amounts if currency)
+        if not amounts:
+            if (
+                header
+                and receipt.merchant is None
+                and not is_row
+                and any(c.isalpha() for c in line)
+                and not TITLE_RE.search(line)
+                and not SKIP_RE.search(line)
+            ):
+                receipt.merchant = _item_name(raw)
+            continue
+        if SKIP_RE.search(line):
+            continue
+        header = False
+        amount = amounts[-1][0]
+        if SUBTOTAL_RE.search(line):
+            receipt.subtotal = amount
+        elif SURCHARGE_RE.search(line):
+            receipt.adjustments += amount
+        elif DISCOUNT_RE.search(line):
+            receipt.adjustments -= amount
+        elif TOTAL_RE.search(line):
+            receipt.total = amount
+        elif receipt.total is not None:
+            continue
+        else:
+            name = _item_name(raw)
+            if any(c.isalpha() for c in name):
+                receipt.items.append(ReceiptLine(name, amount))
+
+    if currencies:
+        receipt.currency = currencies.most_common(1)[0][0]
+    names = [receipt.merchant or ""] + [item.name for item in receipt.items]
+    receipt.category = _category(" \n ".join(names).lower())[0]
+
+    if receipt.total is not None:
+        receipt.confidence += 0.5
+        if receipt.reconciled:
+            receipt.confidence += 0.3
+        elif not receipt.items and receipt.subtotal is None:
+            receipt.confidence += 0.15
+    if receipt.date is not None:
+        receipt.confidence += 0.1
+    if receipt.category is not None:
+        receipt.confidence += 0.1
+    receipt.confidence = round(receipt.confidence, 2)
+    return receipt
@@ -0,0 +1,16 @@
+from datetime import datetime
+
+from pydantic import BaseModel
+
+
+class Expense(BaseModel):
+    date: datetime | None
+    category: str | None
+    name: str | None
+    amount: float | None
+    currency: str | None
+
+
+class ExpenseResult(BaseModel):
+    data: Expense | None
+    continue_question: str | None
@@ -11,9 +11,12 @@ from rich.prompt import Prompt
 
 from agents.chat import create_agent
 from auth.google import auth_google_installed_app_flow
+from services.sheet_cache import DRIVE_METADATA_SCOPE
 
 console = Console()
-auth_google_installed_app_flow(scopes=[GoogleSheetsTools.DEFAULT_SCOPES["read"]])
+auth_google_installed_app_flow(
+    scopes=[GoogleSheetsTools.DEFAULT_SCOPES["read"], DRIVE_METADATA_SCOPE]
+)
 
 
 def print_messages(agent: Agent):
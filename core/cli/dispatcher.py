@@ -0,0 +1,144 @@
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Hashable
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from config.logger import logger
+
+
+@dataclass
+class DispatcherMetrics:
+    submitted: int = 0
+    processed: int = 0
+    failed: int = 0
+    in_flight: int = 0
+    # Time spent waiting in the queue and running the handlers, in seconds
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+    total_latency: float = 0.0
+    max_latency: float = 0.0
+
+
+class QueuedUpdateProcessor(BaseUpdateProcessor):
+    """Process updates with a fixed set of workers, one update per chat at a time
+
+    The application hands updates over one at a time (the base processor is
+    created with `max_concurrent_updates=1`), and `do_process_update` only
+    queues them behind the earlier updates of their chat. A worker takes the
+    next chat with waiting updates, handles one update and puts the chat
+    back at the end of the line, so updates of a chat run in arrival order
+    while a busy chat never holds more than one worker: the other workers
+    keep serving the other chats instead of waiting on its lock.
+
+    Once `max_queue_size` updates are waiting, queueing blocks, which stops
+    the application from reading its update queue; in webhook mode that in
+    turn delays the HTTP responses to Telegram, which then slows down
+    delivery.
+
+    Args:
+        workers: number of updates processed concurrently
+        max_queue_size: number of updates waiting for a worker before
+            backpressure kicks in
+    """
+
+    def __init__(self, workers: int = 8, max_queue_size: int = 100):
+        super().__init__(max_concurrent_updates=1)
+        self.workers = workers
+        self.metrics = DispatcherMetrics()
+        # Waiting updates of each chat, present while the chat is ready or busy
+        self._chats: dict[Hashable, deque[tuple[float, Awaitable[Any]]]] = {}
+        # Chats with waiting updates and no worker on them, in turn order
+        self._ready: asyncio.Queue[Hashable] = asyncio.Queue()
+        self._slots = asyncio.Semaphore(max_queue_size)
+        self._depth = 0
+        self._tasks: list[asyncio.Task] = []
+
+    @property
+    def queue_depth(self) -> int:
+        return self._depth
+
+    def snapshot(self) -> dict:
+        processed = max(self.metrics.processed + self.metrics.failed, 1)
+        return {
+            "queue_depth": self.queue_depth,
+            "busy_chats": len(self._chats),
+            "in_flight": self.metrics.in_flight,
+            "processed": self.metrics.processed,
+            "failed": self.metrics.failed,
+            "avg_wait_ms": 1000 * self.metrics.total_wait / processed,
+            "max_wait_ms": 1000 * self.metrics.max_wait,
+            "avg_latency_ms": 1000 * self.metrics.total_latency / processed,
+            "max_latency_ms": 1000 * self.metrics.max_latency,
+        }
+
+    @staticmethod
+    def _chat_key(update: object) -> Hashable:
+        if isinstance(update, Update) and update.effective_chat is not None:
+            return update.effective_chat.id
+        # No chat to keep in order with
+        return object()
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]):
+        self.metrics.submitted += 1
+        await self._slots.acquire()
+        self._depth += 1
+        key = self._chat_key(update)
+        waiting = self._chats.get(key)
+        if waiting is None:
+            self._chats[key] = deque([(time.monotonic(), coroutine)])
+            self._ready.put_nowait(key)
+        else:
+            # A worker picks it up after the chat's earlier updates
+            waiting.append((time.monotonic(), coroutine))
+
+    async def _worker(self):
+        while True:
+            key = await self._ready.get()
+            waiting = self._chats[key]
+            enqueued_at, coroutine = waiting.popleft()
+            self._depth -= 1
+            self._slots.release()
+            started = time.monotonic()
+            self.metrics.in_flight += 1
+            try:
+                await coroutine
+                self.metrics.processed += 1
+            except Exception:
+                # Handler errors are normally dealt with by the application
+                self.metrics.failed += 1
+                logger.exception("Failed to process update")
+            finally:
+                finished = time.monotonic()
+                self.metrics.in_flight -= 1
+                self.metrics.total_wait += started - enqueued_at
+                self.metrics.max_wait = max(
+                    self.metrics.max_wait, started - enqueued_at
+                )
+                self.metrics.total_latency += finished - enqueued_at
+                self.metrics.max_latency = max(
+                    self.metrics.max_latency, finished - enqueued_at
+                )
+                if waiting:
+                    # Back of the line, the other ready chats go first
+                    self._ready.put_nowait(key)
+                else:
+                    del self._chats[key]
+                self._ready.task_done()
+
+    async def initialize(self):
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"update-worker-{i}")
+            for i in range(self.workers)
+        ]
+
+    async def shutdown(self):
+        # Let the accepted updates finish before stopping the workers
+        await self._ready.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
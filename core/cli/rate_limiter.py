@@ -0,0 +1,45 @@
+from typing import Any, Callable, Coroutine
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from services.rate_limit import TokenBucket
+
+
+class TokenBucketRateLimiter(BaseRateLimiter):
+    """Spend every Bot API request from a shared `TokenBucket`
+
+    Requests wait for a token instead of being sent in a burst; a `RetryAfter`
+    from Telegram slows the bucket down and is raised to the caller as before,
+    e.g. `TelegramStreamWriter` skips or retries the edit.
+
+    Args:
+        limiter: budget of the Bot API
+    """
+
+    def __init__(self, limiter: TokenBucket):
+        self.limiter = limiter
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Any]],
+        args: Any,
+        kwargs: dict[str, Any],
+        endpoint: str,
+        data: dict[str, Any],
+        rate_limit_args: None,
+    ) -> Any:
+        await self.limiter.acquire_async()
+        try:
+            result = await callback(*args, **kwargs)
+        except RetryAfter as e:
+            self.limiter.throttle(e.retry_after)
+            raise
+        self.limiter.succeed()
+        return result
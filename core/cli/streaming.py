@@ -0,0 +1,86 @@
+import asyncio
+import time
+
+from telegram import Bot, Message
+from telegram.error import BadRequest, RetryAfter
+
+from config.logger import logger
+
+# Telegram rejects longer message texts
+MAX_MESSAGE_LENGTH = 4096
+
+
+class TelegramStreamWriter:
+    """Show a streamed answer by editing a Telegram message as text arrives
+
+    A placeholder is sent right away, the first chunk replaces it as soon as
+    it arrives, and later chunks are batched into at most one edit every
+    `edit_interval` seconds, which keeps a chat within Telegram's edit rate
+    limits. Answers longer than one message continue in new messages.
+
+    Args:
+        bot: bot used to send and edit messages
+        chat_id: chat to answer in
+        edit_interval: minimum number of seconds between two edits
+        placeholder: text shown until the first chunk arrives
+        empty_text: text left by `finish` when no text was written, e.g. the
+            agent failed or streamed nothing
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        chat_id: int,
+        edit_interval: float = 1.0,
+        placeholder: str = "…",
+        empty_text: str = "Sorry, I could not answer that.",
+    ):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.edit_interval = edit_interval
+        self.placeholder = placeholder
+        self.empty_text = empty_text
+        self._message: Message | None = None
+        self._text = ""  # text of the current message
+        self._shown = ""  # text last sent to Telegram for the current message
+        self._last_edit = 0.0
+
+    async def start(self):
+        self._message = await self.bot.send_message(self.chat_id, self.placeholder)
+
+    async def write(self, delta: str):
+        self._text += delta
+        while len(self._text) > MAX_MESSAGE_LENGTH:
+            head = self._text[:MAX_MESSAGE_LENGTH]
+            self._text = self._text[MAX_MESSAGE_LENGTH:]
+            await self._edit(head, force=True)
+            self._message = await self.bot.send_message(self.chat_id, self.placeholder)
+            self._shown = ""
+        if time.monotonic() - self._last_edit >= self.edit_interval:
+            await self._edit(self._text)
+
+    async def finish(self):
+        """Show the rest of the text, never leave the placeholder behind"""
+        if not self._text.strip():
+            self._text = self.empty_text
+        await self._edit(self._text, force=True)
+
+    async def _edit(self, text: str, force: bool = False):
+        if text == self._shown or not text.strip():
+            return
+        while True:
+            try:
+                await self._message.edit_text(text)
+                break
+            except RetryAfter as e:
+                if not force:
+                    # Skip this edit, a later one carries the same text
+                    return
+                await asyncio.sleep(e.retry_after)
+            except BadRequest as e:
+                if "not modified" not in str(e).lower():
+                    raise
+                logger.debug("Skipped unchanged edit in chat %s", self.chat_id)
+                break
+        self._shown = text
+        self._last_edit = time.monotonic()
@@ -1,6 +1,9 @@
-from agno.run.response import RunResponse
+import asyncio
+from argparse import ArgumentParser
+
 from telegram import Update
 from telegram.ext import (
+    Application,
     ApplicationBuilder,
     CommandHandler,
     ContextTypes,
@@ -9,18 +12,141 @@ from telegram.ext import (
 )
 
 from agents.chat import create_agent
+from agents.expense import answer_question, extract_receipt_expenses
+from agents.expense_parser import parse_expense
+from agents.pool import AgentPool
+from agents.query_cache import is_ledger_question
+from agents.schema import Expense
+from cli.dispatcher import QueuedUpdateProcessor
+from cli.rate_limiter import TokenBucketRateLimiter
+from cli.streaming import TelegramStreamWriter
 from config.logger import logger
 from config.settings import settings
+from db.shards import ShardDirectory, shard_directory
+from services.rate_limit import rate_limits
+from services.write_queue import WriteQueueWorker, create_worker
+from tools.ocr import OcrPipeline, create_pipeline
 
 # NOTE: In telegram, we cannot have multiple chat sessions natively
-# Therefore, we need to set to only 1 session and will consider workarounds.
-agent = create_agent(session="telegram")
+# Therefore, each chat gets its own agent and session, kept in a bounded pool.
+agent_pool = AgentPool(
+    lambda chat_id: create_agent(session=f"telegram-{chat_id}"),
+    max_size=settings.TELEGRAM_AGENT_POOL_SIZE,
+    idle_timeout=settings.TELEGRAM_AGENT_IDLE_TIMEOUT,
+)
+# Receipts are parsed concurrently through one LlamaParse client
+ocr_pipeline = create_pipeline()
+# Confirmed expenses are answered once queued, and written in the background
+write_queue_worker = create_worker()
 
 
 async def start_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("Welcome to my awesome bot!")
 
 
+async def stats_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    processor: QueuedUpdateProcessor = context.application.update_processor
+    pool: AgentPool = context.bot_data["agent_pool"]
+    stats = {
+        **processor.snapshot(),
+        "update_queue_depth": context.application.update_queue.qsize(),
+        "agents": len(pool),
+        "pool_hits": pool.stats.hits,
+        "pool_misses": pool.stats.misses,
+        "pool_evictions": pool.stats.evictions,
+    }
+    ocr: OcrPipeline = context.bot_data["ocr"]
+    stats["ocr_parsed"] = ocr.stats.parsed
+    stats["ocr_failed"] = ocr.stats.failed + ocr.stats.timeouts
+    stats["ocr_cache_hits"] = ocr.stats.cache_hits
+    writes: WriteQueueWorker = context.bot_data["writes"]
+    for name, value in (await asyncio.to_thread(writes.snapshot)).items():
+        stats[f"write_queue_{name}"] = value
+    for service, limit in rate_limits.snapshot().items():
+        stats[f"{service}_rate"] = limit["rate"]
+        stats[f"{service}_utilization_pct"] = 100 * limit["utilization"]
+        stats[f"{service}_throttled"] = limit["throttled"]
+    await update.message.reply_text(
+        "\n".join(
+            f"{name}: {value:.1f}" if isinstance(value, float) else f"{name}: {value}"
+            for name, value in stats.items()
+        )
+    )
+
+
+async def receipt_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    pipeline: OcrPipeline = context.bot_data["ocr"]
+    writer = TelegramStreamWriter(
+        context.bot,
+        update.message.chat_id,
+        edit_interval=settings.TELEGRAM_STREAM_EDIT_INTERVAL,
+        placeholder="Reading the receipt…",
+    )
+    await writer.start()
+    try:
+        photo = update.message.photo[-1]  # largest size
+        file = await photo.get_file()
+        data = await file.download_as_bytearray()
+        result = await pipeline.parse(bytes(data), f"{photo.file_unique_id}.jpg")
+        if not result.ok:
+            await writer.write(f"Could not read the receipt: {result.error}")
+        elif expenses := await extract_receipt_expenses(result.text):
+            await queue_expenses(update, context, expenses)
+            await writer.write(f"Saved:\n{format_expenses(expenses)}")
+        else:
+            await writer.write(result.text or "No text found on the receipt.")
+    except Exception:
+        # A background task, nothing else would tell the user
+        logger.exception("Failed to handle the receipt of chat %s", writer.chat_id)
+        await writer.write("Sorry, the receipt could not be processed.")
+    finally:
+        await writer.finish()
+
+
+async def queue_expenses(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, expenses: list[Expense]
+):
+    """Durably queue the expenses of a message for the ledger
+
+    Keyed by chat and message id, so a redelivered update is queued once.
+    """
+    worker: WriteQueueWorker = context.bot_data["writes"]
+    await asyncio.to_thread(
+        worker.queue.append,
+        str(update.message.from_user.id),
+        expenses,
+        f"telegram-{update.message.chat_id}-{update.message.message_id}",
+    )
+    worker.notify()
+
+
+async def start_writes(application: Application):
+    """Start the write queue worker with the bot"""
+    application.bot_data["writes"].start()
+
+
+def format_expenses(expenses: list[Expense]) -> str:
+    """One line per expense, and their total when there are several"""
+
+    def money(amount: float | None, currency: str | None) -> str:
+        if amount is None:
+            return "?"
+        decimals = 0 if currency == "VND" else 2
+        return f"{amount:,.{decimals}f} {currency or ''}".strip()
+
+    lines = []
+    for expense in expenses:
+        day = f"{expense.date:%Y-%m-%d} " if expense.date else ""
+        lines.append(
+            f"{day}{expense.name or '?'} ({expense.category or 'uncategorized'}): "
+            f"{money(expense.amount, expense.currency)}"
+        )
+    if len(expenses) > 1:
+        total = sum(expense.amount or 0 for expense in expenses)
+        lines.append(f"Total: {money(total, expenses[0].currency)}")
+    return "\n".join(lines)
+
+
 async def message_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     logger.debug(
         "%s", update
@@ -37,25 +163,61 @@ async def message_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         update.message.text,
     )
 
+    if update.message.photo:
+        # Parsing a receipt takes seconds, answer from a background task so
+        # the worker moves on to the next update
+        context.application.create_task(receipt_callback(update, context), update)
+        return
+
+    # Simple expenses such as "cafe 45k" are confirmed without the agent
+    if expense := parse_expense(update.message.text or ""):
+        await queue_expenses(update, context, [expense])
+        await update.message.reply_text(f"Saved: {format_expenses([expense])}")
+        return
+
     user_id = str(update.message.from_user.id)
-    response: RunResponse = await agent.arun(message=update.message.text, user_id=user_id)
-    await context.bot.send_message(
-        update.message.chat_id,
-        response.content,
-    )
+    chat_id = str(update.message.chat_id)
 
-    # if update.message.photo:
-    #     await context.bot.send_message(
-    #         update.message.chat_id,
-    #         "Processing...",
-    #         # To preserve the markdown, we attach entities (bold, italic...)
-    #         entities=update.message.entities,
-    #     )
+    # Spending questions over a date window are answered from the user's
+    # shard, repeated ones from the query cache without the LLM. Anything
+    # else, e.g. about their sheets, goes to the chat agent and its history
+    if is_ledger_question(update.message.text or ""):
+        shards: ShardDirectory = context.bot_data["shards"]
+        writer = TelegramStreamWriter(
+            context.bot,
+            update.message.chat_id,
+            edit_interval=settings.TELEGRAM_STREAM_EDIT_INTERVAL,
+        )
+        await writer.start()
+        try:
+            db_path = await asyncio.to_thread(shards.path_for, user_id)
+            answer = await answer_question(str(db_path), user_id, update.message.text)
+            await writer.write(answer or "")
+        finally:
+            await writer.finish()
+        return
 
-    #     for i, photo in enumerate(update.message.photo, 1):
-    #         file = await photo.get_file()
-    #         downloaded_path = await file.download_to_drive()
-    #         print(f"{i:02d}", str(downloaded_path))
+    pool: AgentPool = context.bot_data["agent_pool"]
+    # Messages of one chat are answered in order, other chats run in parallel
+    async with pool.acquire(chat_id) as agent:
+        # Show a placeholder right away and fill it in as the answer streams
+        writer = TelegramStreamWriter(
+            context.bot,
+            update.message.chat_id,
+            edit_interval=settings.TELEGRAM_STREAM_EDIT_INTERVAL,
+        )
+        await writer.start()
+        try:
+            stream = await agent.arun(
+                message=update.message.text, user_id=user_id, stream=True
+            )
+            async for chunk in stream:
+                if isinstance(chunk.content, str):
+                    await writer.write(chunk.content)
+        finally:
+            # An error still reaches the dispatcher, the user gets a reply
+            await writer.finish()
+    logger.debug("Agent pool: %d agents, %s", len(pool), pool.stats)
 
     # if update.message.text:
     #     # Reply with upper case
@@ -67,20 +229,90 @@ async def message_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     #     )
 
 
-def create_bot():
+def create_bot(
+    pool: AgentPool | None = None,
+    base_url: str | None = None,
+    ocr: OcrPipeline | None = None,
+    writes: WriteQueueWorker | None = None,
+    shards: ShardDirectory | None = None,
+):
+    """Create the bot application
+
+    Args:
+        pool: agents to answer with, defaults to the module's `agent_pool`
+        base_url: Bot API base URL, e.g. a local fake server for testing
+        ocr: receipt parser for photos, defaults to the module's `ocr_pipeline`
+        writes: queue of confirmed expenses, defaults to the module's
+            `write_queue_worker`
+        shards: ledgers that questions are answered from, defaults to
+            `db.shards.shard_directory`
+    """
     logger.info("Creating bot")
-    bot = ApplicationBuilder().token(settings.TELEGRAM_BOT_TOKEN).build()
+    builder = (
+        ApplicationBuilder()
+        .token(settings.TELEGRAM_BOT_TOKEN)
+        # Bounded so that a full dispatcher pushes back on the webhook
+        .update_queue(asyncio.Queue(maxsize=settings.TELEGRAM_UPDATE_QUEUE_SIZE))
+        .rate_limiter(TokenBucketRateLimiter(rate_limits["telegram"]))
+        # Updates of a chat are processed one at a time, in order
+        .concurrent_updates(
+            QueuedUpdateProcessor(
+                workers=settings.TELEGRAM_MAX_CONCURRENT_UPDATES,
+                max_queue_size=settings.TELEGRAM_UPDATE_QUEUE_SIZE,
+            )
+        )
+        # Entries left pending by a previous run are written right away
+        .post_init(start_writes)
+        # Write what is still queued before exiting
+        .post_shutdown(lambda app: app.bot_data["writes"].stop())
+    )
+    if base_url:
+        builder = builder.base_url(base_url).base_file_url(f"{base_url}/file")
+    bot = builder.build()
+    bot.bot_data["agent_pool"] = pool if pool is not None else agent_pool
+    bot.bot_data["ocr"] = ocr if ocr is not None else ocr_pipeline
+    bot.bot_data["writes"] = writes if writes is not None else write_queue_worker
+    bot.bot_data["shards"] = shards if shards is not None else shard_directory
     bot.add_handler(CommandHandler("start", start_callback))
+    bot.add_handler(CommandHandler("stats", stats_callback))
     bot.add_handler(MessageHandler(~filters.COMMAND, message_callback))
     return bot
 
 
+def parse_args():
+    parser = ArgumentParser()
+    parser.add_argument(
+        "--webhook",
+        action="store_true",
+        help="Receive updates through a webhook instead of long polling",
+    )
+    args = parser.parse_args()
+    return vars(args)
+
+
 # run normal
 def main():
+    args = parse_args()
     bot = create_bot()
 
-    logger.info("Listening for updates...")
-    bot.run_polling()
+    if args["webhook"]:
+        logger.info(
+            "Listening for updates on %s:%d/%s...",
+            settings.TELEGRAM_WEBHOOK_LISTEN,
+            settings.TELEGRAM_WEBHOOK_PORT,
+            settings.TELEGRAM_WEBHOOK_PATH,
+        )
+        bot.run_webhook(
+            listen=settings.TELEGRAM_WEBHOOK_LISTEN,
+            port=settings.TELEGRAM_WEBHOOK_PORT,
+            url_path=settings.TELEGRAM_WEBHOOK_PATH,
+            webhook_url=f"{settings.TELEGRAM_WEBHOOK_URL.rstrip('/')}/{settings.TELEGRAM_WEBHOOK_PATH}",
+            secret_token=settings.TELEGRAM_WEBHOOK_SECRET or None,
+            max_connections=settings.TELEGRAM_MAX_CONCURRENT_UPDATES,
+        )
+    else:
+        logger.info("Listening for updates...")
+        bot.run_polling()
     logger.info("Shutdown")
 
 
@@ -7,15 +7,86 @@ class Settings(BaseSettings):
     # Globals
     CACHE_DIR: str = ".cache"
     DATA_DIR: str = "data"
+    # Local time of the users, e.g. "Asia/Ho_Chi_Minh", empty for the system's.
+    # Relative days and receipt times are read, and stored, in it
+    TIMEZONE: str = ""
+    # Ledger files by user under DATA_DIR/LEDGER_SHARD_DIR (see db/shards.py)
+    LEDGER_SHARD_DIR: str = "shards"
+    LEDGER_SHARD_BUCKETS: int = 0  # 0 for one file per user
+    # Confirmed expenses are queued in DATA_DIR/WRITE_QUEUE_FILE and written to
+    # the ledger, and LEDGER_SHEET_ID when set, in the background
+    WRITE_QUEUE_FILE: str = "write_queue.sqlite"
+    WRITE_QUEUE_BATCH_SIZE: int = 100
+    WRITE_QUEUE_INTERVAL: float = 1.0  # seconds between polls when idle
+    WRITE_QUEUE_MAX_ATTEMPTS: int = 8
+    WRITE_QUEUE_RETENTION: float = 7 * 86400.0  # seconds written entries are kept
+    LEDGER_FUND: str = "Chi tiêu"  # fund of queued expenses
+    LEDGER_SHEET_ID: str = ""  # a tab per user
 
     # Google
     GOOGLE_APPLICATION_CREDENTIALS: str = ""
+    SHEETS_BATCH_SIZE: int = 100  # pending operations that trigger a flush
+    SHEETS_FLUSH_INTERVAL: float = 0.5  # seconds
+    # Local copies of sheet ranges under CACHE_DIR/sheets
+    SHEETS_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    SHEETS_CACHE_MEMORY_BYTES: int = 8 * 1024 * 1024
+    SHEETS_CACHE_REVALIDATE_AFTER: float = 0.0  # seconds, 0 checks every read
+    # Outbound budgets in calls per second (see services/rate_limit.py),
+    # the rates back off on 429s and recover on successes
+    SHEETS_RATE_LIMIT: float = 1.0  # 60 requests/min per user
+    SHEETS_RATE_BURST: float = 10
 
     # LLM
     GEMINI_API_KEY: str = ""
+    GEMINI_RATE_LIMIT: float = 0.25  # 15 requests/min, gemini-2.0-flash free tier
+    GEMINI_RATE_BURST: float = 5
+    # Analytical questions answered from cached SQL templates
+    QUERY_CACHE_SIZE: int = 256
+    QUERY_CACHE_TTL: float = 86400.0  # seconds
+    # Model-written SQL runs read-only in a sandbox (see db/sandbox.py)
+    SQL_TIMEOUT: float = 10.0  # seconds before a query is interrupted
+    SQL_MAX_ROWS: int = 500
+    # DuckDB limits of every database file this process opens, set once when
+    # the file is opened (db/connection.py). They are per database, not per
+    # query: the bot's ledger writes, the sheet sync and model-written SQL all
+    # share them. "" or 0 keeps DuckDB's default (one thread per CPU); threads
+    # are capped at the CPU count, more workers than CPUs can stall scans of
+    # registered frames
+    DUCKDB_MEMORY_LIMIT: str = "1GB"
+    DUCKDB_THREADS: int = 0
+
+    # OCR
+    LLAMA_CLOUD_API_KEY: str = ""
+    OCR_MAX_CONCURRENCY: int = 4  # receipts parsed at once
+    OCR_TIMEOUT: float = 120.0  # seconds per receipt
+    # Photos are cropped, deskewed and shrunk to OCR_TARGET_DPI before upload
+    OCR_PREPROCESS: bool = True
+    OCR_TARGET_DPI: int = 300
+    # Parsed texts under CACHE_DIR/ocr, by file content and near-duplicate image
+    OCR_CACHE_MAX_BYTES: int = 16 * 1024 * 1024
+    # Differing bits of 1024 for a near-duplicate hit, e.g. 40; 0 for exact only,
+    # since a near hit answers with the text of another photo
+    OCR_CACHE_MAX_DISTANCE: int = 0
+    LLAMAPARSE_RATE_LIMIT: float = 0.5
+    LLAMAPARSE_RATE_BURST: float = 2
+    # Receipts parsed by rules below this confidence are read by the LLM
+    RECEIPT_MIN_CONFIDENCE: float = 0.7
 
     # Bot
     TELEGRAM_BOT_TOKEN: str = ""
+    TELEGRAM_RATE_LIMIT: float = 30.0  # Bot API messages/s across chats
+    TELEGRAM_RATE_BURST: float = 30
+    TELEGRAM_AGENT_POOL_SIZE: int = 128
+    TELEGRAM_AGENT_IDLE_TIMEOUT: float = 1800.0  # seconds
+    TELEGRAM_MAX_CONCURRENT_UPDATES: int = 8
+    TELEGRAM_UPDATE_QUEUE_SIZE: int = 100
+    TELEGRAM_STREAM_EDIT_INTERVAL: float = 1.0  # seconds between message edits
+    # Webhook mode, Telegram posts to TELEGRAM_WEBHOOK_URL/TELEGRAM_WEBHOOK_PATH
+    TELEGRAM_WEBHOOK_URL: str = ""
+    TELEGRAM_WEBHOOK_LISTEN: str = "0.0.0.0"
+    TELEGRAM_WEBHOOK_PORT: int = 8443
+    TELEGRAM_WEBHOOK_PATH: str = "telegram"
+    TELEGRAM_WEBHOOK_SECRET: str = ""
 
 
 settings = Settings()
@@ -0,0 +1,77 @@
+import datetime
+
+import duckdb
+
+
+def apply_spending_delta(
+    conn: duckdb.DuckDBPyConnection,
+    source: str,
+    sign: int = 1,
+    params=None,
+):
+    """Add or subtract a set of transactions to/from `monthly_spending`
+
+    Must run in the same database transaction as the write it mirrors.
+
+    Args:
+        conn: DuckDB connection to the ledger
+        source: SELECT query (or table name) yielding `by`, `fund_id`,
+            `category_id`, `currency`, `datetime` and `amount`
+        sign: 1 for inserted rows, -1 for deleted rows (and the old version of
+            updated rows)
+        params: parameters of `source`
+    """
+    if not source.lstrip().upper().startswith("SELECT"):
+        source = f"SELECT * FROM {source}"
+    conn.execute(
+        f"""
+        INSERT INTO monthly_spending (by, fund_id, category_id, currency, month, total, transaction_count)
+        SELECT
+            by,
+            fund_id,
+            category_id,
+            currency,
+            CAST(date_trunc('month', CAST(datetime AS TIMESTAMP)) AS DATE),
+            {int(sign)} * SUM(amount),
+            {int(sign)} * COUNT(1)
+        FROM ({source})
+        GROUP BY ALL
+        ON CONFLICT (by, fund_id, category_id, currency, month) DO UPDATE SET
+            total = total + excluded.total,
+            transaction_count = transaction_count + excluded.transaction_count
+        """,
+        params,
+    )
+    conn.execute("DELETE FROM monthly_spending WHERE transaction_count <= 0")
+
+
+def rebuild_monthly_spending(conn: duckdb.DuckDBPyConnection):
+    """Recompute `monthly_spending` from scratch, e.g. after raw SQL writes"""
+    conn.execute("DELETE FROM monthly_spending")
+    apply_spending_delta(conn, "transaction")
+
+
+def spending_summary(
+    conn: duckdb.DuckDBPyConnection,
+    username: str,
+    month: datetime.date,
+    category_name: str | None = None,
+) -> list[tuple]:
+    """Totals of a user for one month, grouped by fund, category and currency
+
+    Reads only the summary rows of that user and month, so the cost does not
+    depend on the number of transactions.
+    """
+    query = """
+        SELECT fund.fund_name, category.category_name, s.currency, s.total, s.transaction_count
+        FROM monthly_spending s
+            JOIN fund ON (fund.id = s.fund_id)
+            JOIN category ON (category.id = s.category_id)
+        WHERE s.by = ? AND s.month = ?
+    """
+    params = [username, month.replace(day=1)]
+    if category_name:
+        query += " AND category.category_name = ?"
+        params.append(category_name)
+    query += " ORDER BY s.total DESC"
+    return conn.execute(query, params).fetchall()
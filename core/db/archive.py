@@ -0,0 +1,361 @@
+import datetime
+import json
+import shutil
+import time
+from argparse import ArgumentParser
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import duckdb
+
+from config.logger import logger
+from db.aggregates import apply_spending_delta
+from db.connection import get_manager
+
+# Exported tables by their key, in foreign key order. monthly_spending and the
+# Sheets sync state are derived and rebuilt instead. applied_write goes with
+# the transactions it records, so a retried write is still skipped after a move.
+LEDGER_TABLES = {
+    "user": "username",
+    "fund": "id",
+    "category": "id",
+    "transaction": "id",
+    "applied_write": "key",
+}
+FORMAT = "parquet"
+MANIFEST = "manifest.json"
+HIVE_TYPES = "{'by': VARCHAR, 'month': DATE}"
+IMPORTED_TABLE = "_imported_transaction"
+# PARTITION_BY writes no file for no rows, an empty table is this file instead
+EMPTY_TRANSACTIONS = "empty.parquet"
+
+
+@dataclass
+class ArchiveResult:
+    rows: dict[str, int] = field(default_factory=dict)  # by table
+    bytes: int = 0  # size of the archive files
+    seconds: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        total = sum(self.rows.values())
+        if self.seconds <= 0:
+            return float(total)
+        return total / self.seconds
+
+
+def _schema_version(conn: duckdb.DuckDBPyConnection) -> int:
+    # Not `migrations.current_version`, which creates the table
+    return conn.execute(
+        "SELECT COALESCE(MAX(version), 0) FROM schema_version"
+    ).fetchone()[0]
+
+
+def _path(path: Path) -> str:
+    """A path as a SQL string literal"""
+    return "'" + str(path).replace("'", "''") + "'"
+
+
+def _table_query(table: str, usernames: list[str] | None) -> tuple[str, list]:
+    """Rows of a ledger table to export, transactions with their month"""
+    if table == "transaction":
+        query = """
+            SELECT *, CAST(date_trunc('month', datetime) AS DATE) AS month
+            FROM transaction
+        """
+        column = "by"
+    elif table == "applied_write":
+        query = "SELECT * FROM applied_write"
+        column = "transaction_id"
+    else:
+        query = f"SELECT * FROM {table}"
+        column = "username" if table == "user" else None
+    params = []
+    if usernames and column:
+        placeholders = ", ".join("?" * len(usernames))
+        if table == "applied_write":
+            placeholders = f"SELECT id FROM transaction WHERE by IN ({placeholders})"
+        query += f" WHERE {column} IN ({placeholders})"
+        params += usernames
+        if table == "user":
+            # The creators of the funds and categories, which are exported whole
+            query += (
+                " OR username IN (SELECT by FROM fund UNION SELECT by FROM category)"
+            )
+    if table == "transaction":
+        # Row groups sorted by date, so date filters skip them
+        query += " ORDER BY by, datetime"
+    return query, params
+
+
+def _size(path: Path) -> int:
+    if path.is_file():
+        return path.stat().st_size
+    return sum(file.stat().st_size for file in path.rglob("*") if file.is_file())
+
+
+def export_ledger(
+    conn: duckdb.DuckDBPyConnection,
+    archive_dir: str | Path,
+    usernames: list[str] | None = None,
+) -> ArchiveResult:
+    """Write the ledger tables to a directory of Parquet files
+
+    Parquet transactions are partitioned Hive-style by user and month
+    (`transaction/by=alice/month=2025-03-01/data_0.parquet`) and sorted by
+    date, so `scan_transactions` reads only the files and row groups of the
+    users and months asked for. user, fund and category are one file each.
+
+    A `manifest.json` records the format, schema version and row counts.
+    The archive is written next to `archive_dir` and then replaces it, a
+    directory that is not an archive is never replaced.
+
+    Args:
+        conn: DuckDB connection to the ledger, the tables are read in one
+            snapshot
+        archive_dir: directory to write, missing, empty or a previous archive
+        usernames: only export the transactions, applied writes and user rows
+            of these users, funds and categories are always exported whole,
+            with the users who created them
+
+    Returns:
+        Rows written per table, archive size and the elapsed time
+
+    Raises:
+        ValueError: if `archive_dir` has files but no manifest
+    """
+    started = time.perf_counter()
+    target = Path(archive_dir)
+    if target.is_file() or (
+        target.exists() and any(target.iterdir()) and not (target / MANIFEST).exists()
+    ):
+        raise ValueError(f"{target} is not an archive, refusing to replace it")
+    archive_dir = target.with_name(f".{target.name}.partial")
+    shutil.rmtree(archive_dir, ignore_errors=True)
+    archive_dir.mkdir(parents=True)
+    result = ArchiveResult()
+
+    for table in LEDGER_TABLES:
+        query, params = _table_query(table, usernames)
+        result.rows[table] = conn.execute(
+            f"SELECT COUNT(1) FROM ({query})", params
+        ).fetchone()[0]
+        if table == "transaction":
+            conn.execute(
+                f"""
+                COPY ({query}) TO {_path(archive_dir / table)}
+                (FORMAT PARQUET, PARTITION_BY (by, month), COMPRESSION ZSTD)
+                """,
+                params,
+            )
+            if result.rows[table] == 0:
+                (archive_dir / table).mkdir(exist_ok=True)
+                conn.execute(
+                    f"COPY ({query}) TO {_path(archive_dir / table / EMPTY_TRANSACTIONS)} "
+                    "(FORMAT PARQUET)",
+                    params,
+                )
+        else:
+            conn.execute(
+                f"COPY ({query}) TO {_path(archive_dir / f'{table}.parquet')} "
+                "(FORMAT PARQUET, COMPRESSION ZSTD)",
+                params,
+            )
+
+    manifest = {
+        "format": FORMAT,
+        "schema_version": _schema_version(conn),
+        "exported_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "rows": result.rows,
+    }
+    (archive_dir / MANIFEST).write_text(json.dumps(manifest, indent=2))
+    shutil.rmtree(target, ignore_errors=True)
+    archive_dir.rename(target)
+    archive_dir = target
+    result.bytes = _size(archive_dir)
+    result.seconds = time.perf_counter() - started
+    logger.info(
+        "Exported %d rows to %s in %.3fs (%.0f rows/s)",
+        sum(result.rows.values()),
+        archive_dir,
+        result.seconds,
+        result.rows_per_second,
+    )
+    return result
+
+
+def read_manifest(archive_dir: str | Path) -> dict:
+    return json.loads((Path(archive_dir) / MANIFEST).read_text())
+
+
+def scan_table(
+    conn: duckdb.DuckDBPyConnection, archive_dir: str | Path, table: str
+) -> duckdb.DuckDBPyRelation:
+    """A ledger table of an archive, read lazily
+
+    Filters on the relation are pushed down to the files: partitions of
+    other users and months are not opened, row groups outside a date range
+    are skipped by their statistics.
+    """
+    archive_dir = Path(archive_dir)
+    manifest = read_manifest(archive_dir)
+    if manifest["format"] != FORMAT:
+        raise ValueError(f"Unsupported archive format {manifest['format']!r}")
+    if table == "transaction" and manifest["rows"][table] == 0:
+        return conn.read_parquet(str(archive_dir / table / EMPTY_TRANSACTIONS))
+    if table == "transaction":
+        return conn.sql(
+            f"""
+            SELECT * FROM read_parquet(
+                {_path(archive_dir / table / "**" / "*.parquet")},
+                hive_partitioning = true,
+                hive_types = {HIVE_TYPES}
+            )
+            """
+        )
+    return conn.read_parquet(str(archive_dir / f"{table}.parquet"))
+
+
+def scan_transactions(
+    conn: duckdb.DuckDBPyConnection,
+    archive_dir: str | Path,
+    usernames: list[str] | None = None,
+    start: datetime.datetime | None = None,
+    end: datetime.datetime | None = None,
+) -> duckdb.DuckDBPyRelation:
+    """Transactions of an archive for some users in [start, end)
+
+    The month of `start` and `end` is also filtered on, so only the matching
+    partitions of a Parquet archive are read.
+    """
+    relation = scan_table(conn, archive_dir, "transaction")
+    if usernames:
+        names = ", ".join("'" + name.replace("'", "''") + "'" for name in usernames)
+        relation = relation.filter(f"by IN ({names})")
+    if start is not None:
+        relation = relation.filter(f"datetime >= TIMESTAMP '{start}'")
+        relation = relation.filter(f"month >= DATE '{start.date().replace(day=1)}'")
+    if end is not None:
+        last_day = (end - datetime.timedelta(microseconds=1)).date()
+        relation = relation.filter(f"datetime < TIMESTAMP '{end}'")
+        relation = relation.filter(f"month <= DATE '{last_day}'")
+    return relation
+
+
+def _next_id(conn: duckdb.DuckDBPyConnection, table: str):
+    """Move `{table}_id_seq` past the ids of the table
+
+    DuckDB sequences cannot be restarted while a column default uses them,
+    they are advanced instead.
+    """
+    sequence = f"{table}_id_seq"
+    max_id = conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]
+    next_id = conn.execute(f"SELECT nextval('{sequence}')").fetchone()[0]
+    if next_id < max_id:
+        conn.execute(
+            f"SELECT MAX(nextval('{sequence}')) FROM range({int(max_id - next_id)})"
+        )
+
+
+def import_ledger(
+    conn: duckdb.DuckDBPyConnection, archive_dir: str | Path
+) -> ArchiveResult:
+    """Add the rows of an archive to the ledger in a single database transaction
+
+    Rows keep their ids; rows whose key is already in the ledger are skipped,
+    so importing the same archive twice adds nothing. The id sequences are
+    moved past the imported ids and `monthly_spending` gets the imported
+    transactions.
+
+    Args:
+        conn: DuckDB connection to a migrated ledger, e.g. `init_blank_db`
+        archive_dir: directory written by `export_ledger`
+
+    Returns:
+        Rows added per table, archive size and the elapsed time
+
+    Raises:
+        ValueError: if the archive is from another schema version
+    """
+    started = time.perf_counter()
+    manifest = read_manifest(archive_dir)
+    version = _schema_version(conn)
+    if manifest["schema_version"] != version:
+        raise ValueError(
+            f"Archive has schema version {manifest['schema_version']}, "
+            f"the ledger {version}"
+        )
+    result = ArchiveResult(bytes=_size(Path(archive_dir)))
+
+    conn.begin()
+    try:
+        for table, key in LEDGER_TABLES.items():
+            if table not in manifest["rows"]:
+                # Archived before the table was exported
+                continue
+            columns = ", ".join(f'"{column}"' for column in conn.table(table).columns)
+            archived = scan_table(conn, archive_dir, table)
+            archived.create_view("_archived", replace=True)
+            source = IMPORTED_TABLE if table == "transaction" else "_archived"
+            if table == "transaction":
+                conn.execute(
+                    f"""
+                    CREATE TEMP TABLE {IMPORTED_TABLE} AS
+                    SELECT {columns} FROM _archived
+                    WHERE id NOT IN (SELECT id FROM transaction)
+                    ORDER BY by, datetime
+                    """
+                )
+            result.rows[table] = conn.execute(
+                f"""
+                INSERT INTO {table} ({columns})
+                SELECT {columns} FROM {source} a
+                WHERE NOT EXISTS (SELECT 1 FROM {table} t WHERE t.{key} = a.{key})
+                """
+            ).fetchone()[0]
+            if key == "id":
+                _next_id(conn, table)
+        apply_spending_delta(conn, IMPORTED_TABLE)
+        conn.execute(f"DROP TABLE {IMPORTED_TABLE}")
+        conn.execute("DROP VIEW _archived")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    result.seconds = time.perf_counter() - started
+    logger.info(
+        "Imported %d rows from %s in %.3fs (%.0f rows/s)",
+        sum(result.rows.values()),
+        archive_dir,
+        result.seconds,
+        result.rows_per_second,
+    )
+    return result
+
+
+def main():
+    parser = ArgumentParser(description="Export or import the ledger tables")
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("db_path", type=str, help="Path to the .duckdb file")
+    parser.add_argument("archive_dir", type=str, help="Archive directory")
+    parser.add_argument(
+        "--user", action="append", dest="usernames", help="export only this user"
+    )
+    args = parser.parse_args()
+
+    manager = get_manager(args.db_path)
+    if args.command == "export":
+        with manager.reader() as cursor:
+            result = export_ledger(cursor, args.archive_dir, args.usernames)
+    else:
+        with manager.writer() as cursor:
+            result = import_ledger(cursor, args.archive_dir)
+    print(
+        f"{args.command}: {result.rows} in {result.seconds:.2f}s, "
+        f"{result.bytes / 1e6:.1f} MB"
+    )
+
+
+if __name__ == "__main__":
+    main()
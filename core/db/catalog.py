@@ -0,0 +1,84 @@
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+
+from db.connection import get_manager
+
+CATALOG_QUERY = """
+SELECT
+    category.id AS category_id,
+    category.category_name,
+    fund.id AS fund_id,
+    fund.fund_name
+FROM
+    fund
+    LEFT OUTER JOIN category ON (fund.id = category.fund_id)
+ORDER BY fund.id, category.id
+"""
+# Cheap change detection for writes made outside this process/cache, e.g.
+# raw SQL from the agents: any insert, delete or touched row moves one of these
+FINGERPRINT_QUERY = """
+SELECT COUNT(1), MAX(id), MAX(updated_at) FROM fund
+UNION ALL
+SELECT COUNT(1), MAX(id), MAX(updated_at) FROM category
+"""
+
+
+@dataclass(frozen=True)
+class Catalog:
+    version: tuple
+    columns: list[str]
+    rows: list[tuple]
+
+    def as_text(self) -> str:
+        """Render like `DuckDbTools.run_query`, to be embedded in prompts"""
+        lines = [",".join(self.columns)]
+        lines += [",".join(str(value) for value in row) for row in self.rows]
+        return "\n".join(lines)
+
+
+class CatalogCache:
+    """In-process cache of the fund/category catalog of each database
+
+    An entry is keyed by a version made of a local generation counter, bumped
+    by `invalidate`, and a fingerprint of the fund and category tables, so
+    both in-process and out-of-band changes invalidate it.
+    """
+
+    def __init__(self):
+        self._entries: dict[str, Catalog] = {}
+        self._generations: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(db_path: str | Path) -> str:
+        return str(Path(db_path).resolve())
+
+    def version(self, db_path: str | Path) -> tuple:
+        with get_manager(db_path).reader() as cursor:
+            fingerprint = tuple(cursor.execute(FINGERPRINT_QUERY).fetchall())
+        return (self._generations.get(self._key(db_path), 0), fingerprint)
+
+    def get(self, db_path: str | Path) -> Catalog:
+        key = self._key(db_path)
+        version = self.version(db_path)
+        catalog = self._entries.get(key)
+        if catalog is not None and catalog.version == version:
+            return catalog
+
+        with get_manager(db_path).reader() as cursor:
+            result = cursor.execute(CATALOG_QUERY)
+            columns = [column[0] for column in result.description]
+            catalog = Catalog(version=version, columns=columns, rows=result.fetchall())
+        with self._lock:
+            self._entries[key] = catalog
+        return catalog
+
+    def invalidate(self, db_path: str | Path):
+        key = self._key(db_path)
+        with self._lock:
+            self._generations[key] = self._generations.get(key, 0) + 1
+            self._entries.pop(key, None)
+
+
+catalog_cache = CatalogCache()
@@ -0,0 +1,119 @@
+import asyncio
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterator, TypeVar
+
+import duckdb
+
+from config.settings import settings
+
+T = TypeVar("T")
+
+
+class ConnectionManager:
+    """Process-wide access to one DuckDB database file
+
+    DuckDB only allows one process to open a file for writing, and inside that
+    process every connection to the same file should share one database
+    instance. The manager keeps that single handle open and hands out cursors
+    from it:
+
+    - `reader()` yields a cursor inside a READ ONLY transaction, many readers
+      may run concurrently.
+    - `writer()` yields a cursor while holding the single writer lock, so
+      writes are serialized instead of failing on write-write conflicts.
+    - `cursor()` returns a long-lived cursor for callers that manage their own
+      statements, e.g. agent tools.
+
+    Cursors are not thread-safe, each task/thread should use its own. The
+    `run_read`/`run_write` coroutines run the work in a worker thread so
+    asyncio handlers never block the event loop on DuckDB.
+
+    Args:
+        db_path: database file
+        config: DuckDB settings of the database, e.g. `memory_limit`; they
+            apply to every cursor of it
+    """
+
+    def __init__(self, db_path: str | Path, config: dict | None = None):
+        self.db_path = str(db_path)
+        self._conn = duckdb.connect(self.db_path, config=config or {})
+        self._write_lock = threading.Lock()
+
+    def cursor(self) -> duckdb.DuckDBPyConnection:
+        return self._conn.cursor()
+
+    @contextmanager
+    def reader(self) -> Iterator[duckdb.DuckDBPyConnection]:
+        cursor = self._conn.cursor()
+        try:
+            cursor.execute("BEGIN TRANSACTION READ ONLY")
+            yield cursor
+        finally:
+            cursor.execute("ROLLBACK")
+            cursor.close()
+
+    @contextmanager
+    def writer(self) -> Iterator[duckdb.DuckDBPyConnection]:
+        with self._write_lock:
+            cursor = self._conn.cursor()
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+
+    async def run_read(self, fn: Callable[[duckdb.DuckDBPyConnection], T]) -> T:
+        def _run() -> T:
+            with self.reader() as cursor:
+                return fn(cursor)
+
+        return await asyncio.to_thread(_run)
+
+    async def run_write(self, fn: Callable[[duckdb.DuckDBPyConnection], T]) -> T:
+        def _run() -> T:
+            with self.writer() as cursor:
+                return fn(cursor)
+
+        return await asyncio.to_thread(_run)
+
+    def close(self):
+        self._conn.close()
+
+
+_managers: dict[str, ConnectionManager] = {}
+_managers_lock = threading.Lock()
+
+
+def duckdb_config() -> dict:
+    """Database-wide limits, `DUCKDB_MEMORY_LIMIT` and `DUCKDB_THREADS`
+
+    Threads are never more than the CPUs of the host.
+    """
+    config = {}
+    if settings.DUCKDB_MEMORY_LIMIT:
+        config["memory_limit"] = settings.DUCKDB_MEMORY_LIMIT
+    if settings.DUCKDB_THREADS:
+        config["threads"] = min(settings.DUCKDB_THREADS, os.cpu_count() or 1)
+    return config
+
+
+def get_manager(db_path: str | Path) -> ConnectionManager:
+    """Get the shared connection manager of a database file
+
+    The file is opened with `duckdb_config()` the first time.
+    """
+    key = str(Path(db_path).resolve())
+    with _managers_lock:
+        manager = _managers.get(key)
+        if manager is None:
+            manager = _managers[key] = ConnectionManager(db_path, duckdb_config())
+        return manager
+
+
+def close_all():
+    with _managers_lock:
+        for manager in _managers.values():
+            manager.close()
+        _managers.clear()
@@ -0,0 +1,204 @@
+import datetime
+import time
+from dataclasses import dataclass
+from typing import Any, Iterable
+
+import duckdb
+import pandas as pd
+
+from config.logger import logger
+from db.aggregates import apply_spending_delta
+from db.schema import Transaction
+
+# Columns of `db.schema.Transaction` that are stored as-is; `id` is assigned
+# from the sequence and fund/category names are resolved to their ids.
+TRANSACTION_COLUMNS = [
+    "datetime",
+    "amount",
+    "currency",
+    "fund_name",
+    "category_name",
+    "note",
+    "created_at",
+    "updated_at",
+    "by",
+]
+OPTIONAL_COLUMNS = {"note", "created_at", "updated_at"}
+# Optional column of the records: rows whose key is in `applied_write` were
+# ingested before and are skipped
+IDEMPOTENCY_KEY = "idempotency_key"
+
+TRANSACTION_ID_SEQUENCE = "transaction_id_seq"
+STAGING_VIEW = "staged_transaction"
+RESOLVED_TABLE = "_resolved_transaction"
+
+
+@dataclass
+class IngestResult:
+    rows: int
+    seconds: float
+
+    @property
+    def rows_per_second(self) -> float:
+        if self.seconds <= 0:
+            return float(self.rows)
+        return self.rows / self.seconds
+
+
+def _to_frame(records: Any) -> Any:
+    """Turn the supported record containers into something DuckDB can register
+
+    DataFrames and Arrow tables are registered as they are (zero-copy for
+    Arrow), anything else is treated as an iterable of `Transaction`.
+    """
+    if isinstance(records, pd.DataFrame):
+        return records
+    if hasattr(records, "schema") and hasattr(records, "num_rows"):
+        # pyarrow.Table / RecordBatch, without importing pyarrow
+        return records
+    rows = [
+        record.model_dump(exclude={"id"})
+        if isinstance(record, Transaction)
+        else Transaction.model_validate(record).model_dump(exclude={"id"})
+        for record in records
+    ]
+    return pd.DataFrame.from_records(rows, columns=TRANSACTION_COLUMNS)
+
+
+def ensure_transaction_sequence(conn: duckdb.DuckDBPyConnection):
+    """Create the transaction id sequence, starting after the current max id"""
+    exists = conn.execute(
+        "SELECT COUNT(1) FROM duckdb_sequences() WHERE sequence_name = ?",
+        (TRANSACTION_ID_SEQUENCE,),
+    ).fetchone()[0]
+    if exists:
+        return
+    next_id = conn.execute(
+        "SELECT COALESCE(MAX(id), 0) + 1 FROM transaction"
+    ).fetchone()[0]
+    conn.execute(f"CREATE SEQUENCE {TRANSACTION_ID_SEQUENCE} START {int(next_id)}")
+
+
+def ingest_transactions(
+    conn: duckdb.DuckDBPyConnection,
+    records: Iterable[Transaction] | pd.DataFrame | Any,
+) -> IngestResult:
+    """Append many transactions to the ledger in a single database transaction
+
+    Fund and category names are resolved to ids with one join against the
+    catalog, ids are drawn from `transaction_id_seq`, and the whole batch is
+    inserted with one `INSERT ... SELECT` over the registered records. The
+    `monthly_spending` totals are updated in the same transaction.
+
+    Records with an `idempotency_key` column are ingested at most once per
+    key: rows whose key is already in `applied_write` are skipped, and the
+    keys of the new rows are added to it in the same transaction, so a batch
+    can be retried after a failure without duplicating transactions.
+
+    Args:
+        conn: DuckDB connection to the ledger
+        records: iterable of `Transaction`, a pd.DataFrame or a pyarrow Table
+            with the `Transaction` columns (`id` is ignored), and optionally
+            `idempotency_key`
+
+    Returns:
+        Number of rows inserted and the elapsed time
+
+    Raises:
+        ValueError: if required columns are missing or a fund/category pair
+            does not exist in the catalog
+    """
+    started = time.perf_counter()
+    frame = _to_frame(records)
+
+    conn.register(STAGING_VIEW, frame)
+    try:
+        columns = set(conn.table(STAGING_VIEW).columns)
+        missing = set(TRANSACTION_COLUMNS) - OPTIONAL_COLUMNS - columns
+        if missing:
+            raise ValueError(f"Missing transaction columns: {sorted(missing)}")
+
+        now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+        def column(name: str) -> str:
+            if name in columns:
+                return f"s.{name}"
+            if name in ("note", IDEMPOTENCY_KEY):
+                return "NULL"
+            return f"'{now}'"
+
+        ensure_transaction_sequence(conn)
+        conn.begin()
+        try:
+            unresolved = conn.execute(
+                f"""
+                SELECT DISTINCT s.fund_name, s.category_name
+                FROM {STAGING_VIEW} s
+                    LEFT JOIN fund ON (fund.fund_name = s.fund_name)
+                    LEFT JOIN category ON (
+                        category.category_name = s.category_name
+                        AND category.fund_id = fund.id
+                    )
+                WHERE category.id IS NULL
+                """
+            ).fetchall()
+            if unresolved:
+                raise ValueError(f"Unknown fund/category pairs: {unresolved}")
+
+            conn.execute(
+                f"""
+                CREATE TEMP TABLE {RESOLVED_TABLE} AS
+                SELECT
+                    nextval('{TRANSACTION_ID_SEQUENCE}') AS id,
+                    CAST(s.datetime AS TIMESTAMP) AS datetime,
+                    CAST(s.amount AS DECIMAL(18, 2)) AS amount,
+                    s.currency,
+                    fund.id AS fund_id,
+                    category.id AS category_id,
+                    {column("note")} AS note,
+                    {column("created_at")} AS created_at,
+                    {column("updated_at")} AS updated_at,
+                    s.by,
+                    CAST({column(IDEMPOTENCY_KEY)} AS TEXT) AS idempotency_key
+                FROM {STAGING_VIEW} s
+                    JOIN fund ON (fund.fund_name = s.fund_name)
+                    JOIN category ON (
+                        category.category_name = s.category_name
+                        AND category.fund_id = fund.id
+                    )
+                WHERE {column(IDEMPOTENCY_KEY)} IS NULL
+                    OR {column(IDEMPOTENCY_KEY)} NOT IN (SELECT key FROM applied_write)
+                """
+            )
+            rows = conn.execute(
+                f"""
+                INSERT INTO transaction (id, datetime, amount, currency, fund_id, category_id, note, created_at, updated_at, by)
+                SELECT id, datetime, amount, currency, fund_id, category_id, note, created_at, updated_at, by
+                FROM {RESOLVED_TABLE}
+                """
+            ).fetchone()[0]
+            conn.execute(
+                f"""
+                INSERT INTO applied_write (key, transaction_id, applied_at)
+                SELECT idempotency_key, id, '{now}'
+                FROM {RESOLVED_TABLE}
+                WHERE idempotency_key IS NOT NULL
+                """
+            )
+            apply_spending_delta(conn, RESOLVED_TABLE)
+            conn.execute(f"DROP TABLE {RESOLVED_TABLE}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    finally:
+        conn.unregister(STAGING_VIEW)
+
+    result = IngestResult(rows=rows, seconds=time.perf_counter() - started)
+    logger.info(
+        "Ingested %d transactions in %.3fs (%.0f rows/s)",
+        result.rows,
+        result.seconds,
+        result.rows_per_second,
+    )
+    return result
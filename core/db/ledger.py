@@ -0,0 +1,73 @@
+import datetime
+
+import duckdb
+
+from db.aggregates import apply_spending_delta
+
+# Columns of `transaction` that may be changed after insertion
+UPDATABLE_COLUMNS = {
+    "datetime",
+    "amount",
+    "currency",
+    "fund_id",
+    "category_id",
+    "note",
+}
+
+_SELECT_TRANSACTION = "SELECT * FROM transaction WHERE id = ?"
+
+
+def update_transaction(
+    conn: duckdb.DuckDBPyConnection,
+    transaction_id: int,
+    changes: dict,
+) -> bool:
+    """Update one transaction and its `monthly_spending` totals
+
+    Args:
+        conn: DuckDB connection to the ledger
+        transaction_id: ID of the transaction
+        changes: new column values, keys must be in `UPDATABLE_COLUMNS`
+
+    Returns:
+        True if the transaction exists and was updated
+    """
+    unknown = set(changes) - UPDATABLE_COLUMNS
+    if unknown:
+        raise ValueError(f"Cannot update transaction columns: {sorted(unknown)}")
+    if not changes:
+        return False
+
+    assignments = ", ".join(f"{column} = ?" for column in changes)
+    conn.begin()
+    try:
+        apply_spending_delta(conn, _SELECT_TRANSACTION, -1, (transaction_id,))
+        updated = conn.execute(
+            f"UPDATE transaction SET {assignments}, updated_at = ? WHERE id = ?",
+            (*changes.values(), datetime.datetime.now(), transaction_id),
+        ).fetchone()[0]
+        apply_spending_delta(conn, _SELECT_TRANSACTION, 1, (transaction_id,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return updated > 0
+
+
+def delete_transaction(conn: duckdb.DuckDBPyConnection, transaction_id: int) -> bool:
+    """Delete one transaction and subtract it from `monthly_spending`
+
+    Returns:
+        True if the transaction existed
+    """
+    conn.begin()
+    try:
+        apply_spending_delta(conn, _SELECT_TRANSACTION, -1, (transaction_id,))
+        deleted = conn.execute(
+            "DELETE FROM transaction WHERE id = ?", (transaction_id,)
+        ).fetchone()[0]
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return deleted > 0
@@ -0,0 +1,217 @@
+import datetime
+from argparse import ArgumentParser
+from dataclasses import dataclass
+from typing import Callable
+
+import duckdb
+
+from config.logger import logger
+from db.aggregates import rebuild_monthly_spending
+from db.connection import get_manager
+from db.schema import (
+    SQL_APPLIED_WRITE_SCHEMA,
+    SQL_CATEGORY_SCHEMA,
+    SQL_FUND_SCHEMA,
+    SQL_MONTHLY_SPENDING_SCHEMA,
+    SQL_SEQUENCES_SCHEMA,
+    SQL_SHEET_SYNC_SCHEMA,
+    SQL_TRANSACTION_INDEXES,
+    SQL_TRANSACTION_SCHEMA,
+    SQL_USER_SCHEMA,
+)
+
+SQL_SCHEMA_VERSION = """
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INTEGER PRIMARY KEY,
+    description TEXT NOT NULL,
+    applied_at TIMESTAMP NOT NULL,
+)
+"""
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    description: str
+    apply: Callable[[duckdb.DuckDBPyConnection], None]
+
+
+def _create_schema(conn: duckdb.DuckDBPyConnection):
+    """Create the latest schema on a blank database"""
+    conn.execute(SQL_USER_SCHEMA)
+    conn.execute(SQL_SEQUENCES_SCHEMA)
+    conn.execute(SQL_FUND_SCHEMA)
+    conn.execute(SQL_CATEGORY_SCHEMA)
+    conn.execute(SQL_TRANSACTION_SCHEMA)
+    conn.execute(SQL_TRANSACTION_INDEXES)
+    conn.execute(SQL_MONTHLY_SPENDING_SCHEMA)
+    conn.execute(SQL_SHEET_SYNC_SCHEMA)
+    conn.execute(SQL_APPLIED_WRITE_SCHEMA)
+
+
+def _typed_ledger(conn: duckdb.DuckDBPyConnection):
+    """v1: TIMESTAMP/DECIMAL columns, id sequences and transaction indexes
+
+    DuckDB cannot alter columns of tables referenced by foreign keys, so the
+    fund, category and transaction tables are copied aside, dropped and
+    re-created. Transactions are re-inserted ordered by (by, datetime) so the
+    row group zone maps prune per-user date ranges.
+    """
+    tables = ["fund", "category", "transaction"]
+    for table in tables:
+        conn.execute(f"CREATE TEMP TABLE _{table} AS SELECT * FROM {table}")
+    for table in reversed(tables):
+        conn.execute(f"DROP TABLE {table}")
+    for table in tables:
+        start = conn.execute(
+            f"SELECT COALESCE(MAX(id), 0) + 1 FROM _{table}"
+        ).fetchone()[0]
+        conn.execute(f"DROP SEQUENCE IF EXISTS {table}_id_seq")
+        conn.execute(f"CREATE SEQUENCE {table}_id_seq START {int(start)}")
+
+    conn.execute(SQL_FUND_SCHEMA)
+    conn.execute(
+        """
+        INSERT INTO fund (id, fund_name, created_at, updated_at, by, note)
+        SELECT id, fund_name, CAST(created_at AS TIMESTAMP), CAST(updated_at AS TIMESTAMP), by, note
+        FROM _fund
+        """
+    )
+    conn.execute(SQL_CATEGORY_SCHEMA)
+    conn.execute(
+        """
+        INSERT INTO category (id, category_name, fund_id, created_at, updated_at, by, note)
+        SELECT id, category_name, fund_id, CAST(created_at AS TIMESTAMP), CAST(updated_at AS TIMESTAMP), by, note
+        FROM _category
+        """
+    )
+    conn.execute(SQL_TRANSACTION_SCHEMA)
+    conn.execute(
+        """
+        INSERT INTO transaction (id, datetime, amount, currency, fund_id, category_id, created_at, updated_at, by, note)
+        SELECT
+            id,
+            CAST(datetime AS TIMESTAMP) AS ts,
+            CAST(amount AS DECIMAL(18, 2)),
+            currency,
+            fund_id,
+            category_id,
+            CAST(created_at AS TIMESTAMP),
+            CAST(updated_at AS TIMESTAMP),
+            by,
+            note
+        FROM _transaction
+        ORDER BY by, ts
+        """
+    )
+    conn.execute(SQL_TRANSACTION_INDEXES)
+    for table in tables:
+        conn.execute(f"DROP TABLE _{table}")
+
+
+def _monthly_spending(conn: duckdb.DuckDBPyConnection):
+    """v2: monthly_spending summary table, backfilled from transaction"""
+    conn.execute(SQL_MONTHLY_SPENDING_SCHEMA)
+    rebuild_monthly_spending(conn)
+
+
+def _sheet_sync(conn: duckdb.DuckDBPyConnection):
+    """v3: Google Sheets sync watermarks and row positions"""
+    conn.execute(SQL_SHEET_SYNC_SCHEMA)
+
+
+def _applied_write(conn: duckdb.DuckDBPyConnection):
+    """v4: idempotency keys of ingested writes"""
+    conn.execute(SQL_APPLIED_WRITE_SCHEMA)
+
+
+MIGRATIONS = [
+    Migration(
+        1,
+        "Typed timestamps and amounts, id sequences, transaction indexes",
+        _typed_ledger,
+    ),
+    Migration(2, "Monthly spending summary table", _monthly_spending),
+    Migration(3, "Google Sheets sync state", _sheet_sync),
+    Migration(4, "Idempotency keys of ingested writes", _applied_write),
+]
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+def current_version(conn: duckdb.DuckDBPyConnection) -> int:
+    conn.execute(SQL_SCHEMA_VERSION)
+    return conn.execute(
+        "SELECT COALESCE(MAX(version), 0) FROM schema_version"
+    ).fetchone()[0]
+
+
+def _is_blank(conn: duckdb.DuckDBPyConnection) -> bool:
+    return not conn.execute(
+        "SELECT COUNT(1) FROM duckdb_tables() WHERE table_name = 'transaction'"
+    ).fetchone()[0]
+
+
+def _record(conn: duckdb.DuckDBPyConnection, migration: Migration):
+    conn.execute(
+        "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+        (migration.version, migration.description, datetime.datetime.now()),
+    )
+
+
+def migrate(conn: duckdb.DuckDBPyConnection) -> int:
+    """Bring a ledger database up to the latest schema version in place
+
+    A blank database gets the latest schema directly, an existing one has
+    every pending migration applied in order, each in its own transaction.
+
+    Args:
+        conn: DuckDB connection to the ledger, it must be the only writer
+
+    Returns:
+        The schema version after migrating
+    """
+    version = current_version(conn)
+    if version == 0 and _is_blank(conn):
+        conn.begin()
+        try:
+            _create_schema(conn)
+            for migration in MIGRATIONS:
+                _record(conn, migration)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return LATEST_VERSION
+
+    for migration in MIGRATIONS:
+        if migration.version <= version:
+            continue
+        conn.begin()
+        try:
+            migration.apply(conn)
+            _record(conn, migration)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        logger.info(
+            "Migrated schema to version %d: %s",
+            migration.version,
+            migration.description,
+        )
+        version = migration.version
+    return version
+
+
+def main():
+    parser = ArgumentParser(description="Migrate a ledger database file in place")
+    parser.add_argument("db_path", type=str, help="Path to the .duckdb file")
+    args = parser.parse_args()
+
+    with get_manager(args.db_path).writer() as conn:
+        version = migrate(conn)
+    print(f"{args.db_path} is at schema version {version}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+import json
+import threading
+from dataclasses import dataclass
+
+import duckdb
+import pandas as pd
+
+# Table functions a query may call, the others read files or settings
+ALLOWED_TABLE_FUNCTIONS = {"range", "generate_series", "unnest"}
+
+
+class QueryRejected(ValueError):
+    """A statement the sandbox does not run"""
+
+
+@dataclass
+class SandboxStats:
+    executed: int = 0
+    rejected: int = 0
+    timeouts: int = 0
+    truncated: int = 0
+
+
+@dataclass
+class QueryResult:
+    columns: list[str]
+    rows: list[tuple]
+    truncated: bool = False  # more rows than the sandbox's max_rows
+
+    def as_text(self) -> str:
+        """Format like `DuckDbTools.run_query`"""
+        lines = [",".join(self.columns)]
+        lines += [",".join(str(value) for value in row) for row in self.rows]
+        if self.truncated:
+            lines.append(f"... truncated to {len(self.rows)} rows")
+        return "\n".join(lines)
+
+
+def _table_refs(node):
+    """Table references of a serialized query, subqueries and CTEs included"""
+    if isinstance(node, dict):
+        if node.get("type") in ("BASE_TABLE", "TABLE_FUNCTION"):
+            yield node
+        for value in node.values():
+            yield from _table_refs(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from _table_refs(value)
+
+
+class QuerySandbox:
+    """Run model-written SQL without letting it write, read files or run away
+
+    A query must be exactly one SELECT (SHOW/DESCRIBE/SUMMARIZE included),
+    reading tables of the database and only the table functions in
+    `ALLOWED_TABLE_FUNCTIONS`: no `read_csv`, no `FROM 'file.parquet'`. It
+    runs on its own cursor inside a READ ONLY transaction, is interrupted
+    after `timeout` seconds and at most `max_rows` rows are fetched.
+
+    DuckDB only has `memory_limit` and `threads` per database, so a shared
+    ledger gets them once when it is opened (`db.connection.duckdb_config`).
+    Pass them here only for a database of the sandbox's own: they are set
+    with `SET` on the whole database when the sandbox is created.
+
+    Args:
+        connection: connection to the database, a cursor of it is used per query
+        timeout: seconds before a query is interrupted
+        max_rows: rows returned at most
+        memory_limit: DuckDB memory limit of the database, e.g. "1GB", None
+            to keep it
+        threads: DuckDB worker threads of the database, None to keep them
+    """
+
+    def __init__(
+        self,
+        connection: duckdb.DuckDBPyConnection,
+        timeout: float = 10.0,
+        max_rows: int = 500,
+        memory_limit: str | None = None,
+        threads: int | None = None,
+    ):
+        self.connection = connection
+        self.timeout = timeout
+        self.max_rows = max_rows
+        self.stats = SandboxStats()
+        self._lock = threading.Lock()
+        if memory_limit is not None:
+            connection.execute(f"SET memory_limit = '{memory_limit}'")
+        if threads is not None:
+            connection.execute(f"SET threads = {int(threads)}")
+
+    def check(self, sql: str) -> str:
+        """The statement to run, if `sql` is one the sandbox accepts
+
+        Raises:
+            QueryRejected: for any other statement
+        """
+        try:
+            self._check(sql)
+        except QueryRejected:
+            with self._lock:
+                self.stats.rejected += 1
+            raise
+        return sql.strip().rstrip(";")
+
+    def _check(self, sql: str):
+        try:
+            statements = duckdb.extract_statements(sql)
+        except duckdb.Error as e:
+            raise QueryRejected(f"Invalid query: {e}") from e
+        if len(statements) != 1:
+            raise QueryRejected("Run exactly one statement at a time")
+        if statements[0].type != duckdb.StatementType.SELECT:
+            raise QueryRejected(
+                f"Only SELECT queries are allowed, not {statements[0].type.name}"
+            )
+
+        # The parsed query, SHOW/DESCRIBE are SELECTs too
+        with self.connection.cursor() as cursor:
+            (serialized,) = cursor.execute(
+                "SELECT json_serialize_sql(?)", [sql]
+            ).fetchone()
+        tree = json.loads(serialized)
+        if tree["error"]:
+            raise QueryRejected(
+                f"Only SELECT queries are allowed: {tree['error_message']}"
+            )
+        for ref in _table_refs(tree["statements"]):
+            if ref["type"] == "TABLE_FUNCTION":
+                name = ref["function"]["function_name"]
+                if name.lower() not in ALLOWED_TABLE_FUNCTIONS:
+                    raise QueryRejected(f"Table function {name} is not allowed")
+            elif any(char in ref["table_name"] for char in "./\\:"):
+                # A file path scanned as a table
+                raise QueryRejected(f"Table {ref['table_name']!r} is not allowed")
+
+    def _run(self, sql: str, fetch, params: dict | None = None):
+        cursor = self.connection.cursor()
+        timer = threading.Timer(self.timeout, cursor.interrupt)
+        try:
+            cursor.execute("BEGIN TRANSACTION READ ONLY")
+            timer.start()
+            try:
+                result = fetch(cursor.execute(sql, params))
+            except duckdb.InterruptException as e:
+                with self._lock:
+                    self.stats.timeouts += 1
+                raise TimeoutError(
+                    f"Query interrupted after {self.timeout:g}s, make it cheaper"
+                ) from e
+            with self._lock:
+                self.stats.executed += 1
+            return result
+        finally:
+            timer.cancel()
+            cursor.close()
+
+    def explain(self, sql: str) -> str:
+        """Plan of a query, binding it without reading any data"""
+        sql = self.check(sql)
+        rows = self._run(f"EXPLAIN {sql}", lambda cursor: cursor.fetchall())
+        return "\n".join(row[-1] for row in rows)
+
+    def execute(self, sql: str, params: dict | None = None) -> QueryResult:
+        """Run a query, at most `max_rows` of its rows are returned
+
+        Args:
+            sql: the query
+            params: values of its `$name` parameters
+
+        Raises:
+            QueryRejected: the statement is not allowed
+            TimeoutError: the query ran longer than `timeout`
+            duckdb.Error: the query failed
+        """
+        sql = self.check(sql)
+
+        def fetch(cursor: duckdb.DuckDBPyConnection) -> QueryResult:
+            rows = cursor.fetchmany(self.max_rows + 1)
+            return QueryResult(
+                columns=[column[0] for column in cursor.description],
+                rows=rows[: self.max_rows],
+                truncated=len(rows) > self.max_rows,
+            )
+
+        result = self._run(sql, fetch, params)
+        if result.truncated:
+            with self._lock:
+                self.stats.truncated += 1
+        return result
+
+    def execute_df(self, sql: str) -> pd.DataFrame:
+        """`execute` as a DataFrame"""
+        result = self.execute(sql)
+        return pd.DataFrame.from_records(result.rows, columns=result.columns)
@@ -9,12 +9,17 @@ CREATE TABLE IF NOT EXISTS user (
     note TEXT,
 )
 """
+SQL_SEQUENCES_SCHEMA = """
+CREATE SEQUENCE IF NOT EXISTS fund_id_seq START 1;
+CREATE SEQUENCE IF NOT EXISTS category_id_seq START 1;
+CREATE SEQUENCE IF NOT EXISTS transaction_id_seq START 1;
+"""
 SQL_FUND_SCHEMA = """
 CREATE TABLE IF NOT EXISTS fund (
-    id INTEGER PRIMARY KEY,
+    id INTEGER PRIMARY KEY DEFAULT nextval('fund_id_seq'),
     fund_name TEXT NOT NULL UNIQUE,
-    created_at TEXT NOT NULL,
-    updated_at TEXT NOT NULL,
+    created_at TIMESTAMP NOT NULL,
+    updated_at TIMESTAMP NOT NULL,
     by TEXT NOT NULL,
     note TEXT,
     FOREIGN KEY(by) REFERENCES user(username)
@@ -22,11 +27,11 @@ CREATE TABLE IF NOT EXISTS fund (
 """
 SQL_CATEGORY_SCHEMA = """
 CREATE TABLE IF NOT EXISTS category (
-    id INTEGER PRIMARY KEY,
+    id INTEGER PRIMARY KEY DEFAULT nextval('category_id_seq'),
     category_name TEXT NOT NULL UNIQUE,
     fund_id INTEGER NOT NULL,
-    created_at TEXT NOT NULL,
-    updated_at TEXT NOT NULL,
+    created_at TIMESTAMP NOT NULL,
+    updated_at TIMESTAMP NOT NULL,
     by TEXT NOT NULL,
     note TEXT,
     FOREIGN KEY(fund_id) REFERENCES fund(id),
@@ -36,14 +41,14 @@ CREATE TABLE IF NOT EXISTS category (
 
 SQL_TRANSACTION_SCHEMA = """
 CREATE TABLE IF NOT EXISTS transaction (
-    id INTEGER PRIMARY KEY,
-    datetime TEXT NOT NULL,
-    amount REAL NOT NULL,
+    id INTEGER PRIMARY KEY DEFAULT nextval('transaction_id_seq'),
+    datetime TIMESTAMP NOT NULL,
+    amount DECIMAL(18, 2) NOT NULL,
     currency TEXT NOT NULL,
     fund_id INTEGER NOT NULL,
     category_id INTEGER NOT NULL,
-    created_at TEXT NOT NULL,
-    updated_at TEXT NOT NULL,
+    created_at TIMESTAMP NOT NULL,
+    updated_at TIMESTAMP NOT NULL,
     by TEXT NOT NULL,
     note TEXT,
     FOREIGN KEY(fund_id) REFERENCES fund(id),
@@ -51,6 +56,55 @@ CREATE TABLE IF NOT EXISTS transaction (
     FOREIGN KEY(by) REFERENCES user(username)
 )
 """
+# Per-user range scans ("spent this month") and category breakdowns
+SQL_TRANSACTION_INDEXES = """
+CREATE INDEX IF NOT EXISTS transaction_by_datetime_idx ON transaction (by, datetime);
+CREATE INDEX IF NOT EXISTS transaction_category_idx ON transaction (category_id);
+"""
+# Running totals per user/fund/category/currency and calendar month, kept in
+# step with `transaction` by `db.aggregates`
+SQL_MONTHLY_SPENDING_SCHEMA = """
+CREATE TABLE IF NOT EXISTS monthly_spending (
+    by TEXT NOT NULL,
+    fund_id INTEGER NOT NULL,
+    category_id INTEGER NOT NULL,
+    currency TEXT NOT NULL,
+    month DATE NOT NULL,
+    total DECIMAL(18, 2) NOT NULL,
+    transaction_count INTEGER NOT NULL,
+    PRIMARY KEY (by, fund_id, category_id, currency, month)
+)
+"""
+# Google Sheets mirrors of a user's transactions, see `services.sheet_sync`:
+# the last pushed `updated_at` per sheet tab and where each transaction sits
+SQL_SHEET_SYNC_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sheet_sync (
+    sheet_id TEXT NOT NULL,
+    tab TEXT NOT NULL,
+    by TEXT NOT NULL,
+    watermark TIMESTAMP,
+    synced_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (sheet_id, tab),
+    FOREIGN KEY(by) REFERENCES user(username)
+);
+CREATE TABLE IF NOT EXISTS sheet_row (
+    sheet_id TEXT NOT NULL,
+    tab TEXT NOT NULL,
+    transaction_id INTEGER NOT NULL,
+    row_number INTEGER NOT NULL,
+    row_hash TEXT NOT NULL,
+    PRIMARY KEY (sheet_id, tab, transaction_id)
+);
+"""
+# Idempotency keys of ingested writes, e.g. entries of `services.write_queue`,
+# recorded in the same transaction as the rows they added
+SQL_APPLIED_WRITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS applied_write (
+    key TEXT PRIMARY KEY,
+    transaction_id INTEGER NOT NULL,
+    applied_at TIMESTAMP NOT NULL
+)
+"""
 
 
 class User(BaseModel):
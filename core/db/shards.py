@@ -0,0 +1,238 @@
+import asyncio
+import datetime
+import re
+import shutil
+import sqlite3
+import threading
+import zlib
+from argparse import ArgumentParser
+from pathlib import Path
+from typing import Callable, TypeVar
+
+import duckdb
+import pandas as pd
+
+from config.logger import logger
+from config.settings import settings
+from db.archive import export_ledger, import_ledger
+from db.catalog import catalog_cache
+from db.connection import get_manager
+from db.utils import init_blank_db
+
+T = TypeVar("T")
+
+DIRECTORY_FILE = "directory.sqlite"
+
+
+def _slug(username: str) -> str:
+    """A file name for a username, with a hash so distinct names stay distinct"""
+    safe = re.sub(r"[^A-Za-z0-9_-]+", "_", username)[:40]
+    return f"{safe}-{zlib.crc32(username.encode()):08x}"
+
+
+class ShardDirectory:
+    """Which ledger file holds each user's data
+
+    With `buckets=0` every user gets a database of their own
+    (`users/<name>-<hash>.duckdb`), otherwise users are spread over `buckets`
+    files (`shard-007.duckdb`) by a stable hash of the username. The
+    assignment is recorded in a SQLite file under `root` the first time a
+    user is seen, so changing `buckets` later does not move anyone, and
+    `isolate` can move a busy user to a file of their own.
+
+    Each shard is a regular migrated ledger: the agents, tools and services
+    taking a `db_path` work unchanged with `path_for(username)`. Since a
+    DuckDB file is opened for writing by a single process, worker processes
+    scale by owning disjoint shards (`owner`): a user's updates go to the
+    worker owning their shard, which never waits on another worker's lock.
+
+    Args:
+        root: directory of the shard files and the directory database
+        buckets: number of hash buckets, 0 for one file per user
+    """
+
+    def __init__(self, root: str | Path, buckets: int = 0):
+        self.root = Path(root)
+        self.buckets = buckets
+        self._initialized: set[str] = set()
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        # A connection per call, the directory is shared by worker processes
+        self.root.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.root / DIRECTORY_FILE, timeout=30)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS shard (
+                username TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                assigned_at TEXT NOT NULL
+            )
+            """
+        )
+        return conn
+
+    def _assign(self, username: str) -> str:
+        if self.buckets <= 0:
+            return f"users/{_slug(username)}.duckdb"
+        bucket = zlib.crc32(username.encode()) % self.buckets
+        return f"shard-{bucket:03d}.duckdb"
+
+    def _init(self, path: Path) -> Path:
+        key = str(path)
+        with self._lock:
+            if key not in self._initialized:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                init_blank_db(path)
+                self._initialized.add(key)
+        return path
+
+    def lookup(self, username: str) -> Path | None:
+        """The shard of a user, None if they have none yet"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT path FROM shard WHERE username = ?", (username,)
+            ).fetchone()
+        return self.root / row[0] if row else None
+
+    def assign(self, username: str) -> Path:
+        """The shard of a user, assigned on first use without opening it"""
+        path = self.lookup(username)
+        if path is None:
+            now = datetime.datetime.now().isoformat(timespec="seconds")
+            with self._connect() as conn:
+                # Another process may assign the user at the same time
+                conn.execute(
+                    "INSERT OR IGNORE INTO shard VALUES (?, ?, ?)",
+                    (username, self._assign(username), now),
+                )
+            path = self.lookup(username)
+        return path
+
+    def path_for(self, username: str) -> Path:
+        """The ledger file of a user, assigned and migrated on first use"""
+        return self._init(self.assign(username))
+
+    def users(self) -> dict[str, Path]:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT username, path FROM shard").fetchall()
+        return {username: self.root / path for username, path in rows}
+
+    def paths(self) -> list[Path]:
+        """The shard files in use"""
+        return sorted(set(self.users().values()))
+
+    def owner(self, username: str, workers: int) -> int:
+        """Index of the worker process, of `workers`, that writes a user's shard
+
+        All users of a shard have the same owner. The shard is not opened,
+        so a router process can call it for every update.
+        """
+        relative = self.assign(username).relative_to(self.root)
+        return zlib.crc32(relative.as_posix().encode()) % workers
+
+    async def fan_out(
+        self,
+        fn: Callable[[duckdb.DuckDBPyConnection], T],
+        paths: list[Path] | None = None,
+    ) -> dict[Path, T]:
+        """Run a read on every shard in parallel
+
+        Each shard is read in its own worker thread through its
+        `ConnectionManager`, DuckDB releases the GIL while it scans.
+        The shards must not be open for writing in another process.
+
+        Args:
+            fn: read to run, given a READ ONLY cursor of a shard
+            paths: shards to read, all of them by default
+
+        Returns:
+            The result of `fn` by shard
+        """
+        paths = self.paths() if paths is None else paths
+        results = await asyncio.gather(
+            *(get_manager(path).run_read(fn) for path in paths)
+        )
+        return dict(zip(paths, results))
+
+    async def query(self, sql: str, params: list | None = None) -> pd.DataFrame:
+        """A query run on every shard, the rows of all shards concatenated
+
+        Aggregate per shard in `sql` and combine the partial results, e.g.
+        sum the per-shard sums, rather than moving raw rows.
+        """
+        frames = await self.fan_out(lambda cursor: cursor.execute(sql, params).df())
+        frames = [frame for frame in frames.values() if not frame.empty]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+    def isolate(self, username: str) -> Path:
+        """Move a user from a shared bucket to a database file of their own
+
+        The user's rows are copied with `db.archive` (funds and categories of
+        the bucket come along, the ids are kept), then their transactions,
+        applied writes and monthly totals are deleted from the bucket. Writers of the bucket in
+        other processes must be stopped during the move.
+        """
+        source = self.path_for(username)
+        relative = f"users/{_slug(username)}.duckdb"
+        if source == self.root / relative:
+            return source
+        target = self._init(self.root / relative)
+        archive = self.root / "moves" / _slug(username)
+        with get_manager(source).reader() as cursor:
+            export_ledger(cursor, archive, usernames=[username])
+        with get_manager(target).writer() as cursor:
+            import_ledger(cursor, archive)
+        catalog_cache.invalidate(target)
+        shutil.rmtree(archive)
+
+        with get_manager(source).writer() as cursor:
+            cursor.begin()
+            try:
+                # The user row stays, funds of the bucket may reference it
+                cursor.execute(
+                    """
+                    DELETE FROM applied_write WHERE transaction_id IN (
+                        SELECT id FROM transaction WHERE by = ?
+                    )
+                    """,
+                    [username],
+                )
+                for table in ("transaction", "monthly_spending"):
+                    cursor.execute(f"DELETE FROM {table} WHERE by = ?", [username])
+                with self._connect() as conn:
+                    conn.execute(
+                        "UPDATE shard SET path = ? WHERE username = ?",
+                        (relative, username),
+                    )
+                cursor.commit()
+            except Exception:
+                cursor.rollback()
+                raise
+        logger.info("Moved %s from %s to %s", username, source, target)
+        return target
+
+
+shard_directory = ShardDirectory(
+    Path(settings.DATA_DIR) / settings.LEDGER_SHARD_DIR, settings.LEDGER_SHARD_BUCKETS
+)
+
+
+def main():
+    parser = ArgumentParser(description="Show or move ledger shards")
+    parser.add_argument("command", choices=["list", "isolate"])
+    parser.add_argument("usernames", nargs="*")
+    args = parser.parse_args()
+
+    if args.command == "isolate":
+        for username in args.usernames:
+            print(f"{username}: {shard_directory.isolate(username)}")
+        return
+    for username, path in sorted(shard_directory.users().items()):
+        if not args.usernames or username in args.usernames:
+            print(f"{username}: {path.relative_to(shard_directory.root)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,8 @@
 import duckdb
 from tabulate import tabulate
 
-from db.schema import (
-    SQL_CATEGORY_SCHEMA,
-    SQL_FUND_SCHEMA,
-    SQL_TRANSACTION_SCHEMA,
-    SQL_USER_SCHEMA,
-)
+from db.connection import get_manager
+from db.migrations import migrate
 
 
 # write safe excute, add created_at, updated_at, by
@@ -25,15 +21,14 @@ def safe_execute(conn: duckdb.DuckDBPyConnection, command: str, params=None):
 
 
 def display_table(db_path, table_name):
-    conn = duckdb.connect(str(db_path))
-    cursor = conn.cursor()
-    headers = cursor.execute(
-        f"SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_NAME = '{table_name}'"
-    ).fetchall()
-    headers = [header[0] for header in headers]
-    cursor.execute(f"SELECT * FROM {table_name} LIMIT 3")
-    print(tabulate(cursor.fetchall(), headers=headers, tablefmt="fancy_grid"))
-    conn.close()
+    with get_manager(db_path).reader() as cursor:
+        headers = cursor.execute(
+            "SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_NAME = ?",
+            (table_name,),
+        ).fetchall()
+        headers = [header[0] for header in headers]
+        cursor.execute(f"SELECT * FROM {table_name} LIMIT 3")
+        print(tabulate(cursor.fetchall(), headers=headers, tablefmt="fancy_grid"))
 
 
 def display_db(db_path):
@@ -44,11 +39,6 @@ def display_db(db_path):
 
 
 def init_blank_db(db_path):
-    conn = duckdb.connect(str(db_path))
-    cursor = conn.cursor()
-    # Create database tables
-    cursor.execute(SQL_USER_SCHEMA)
-    cursor.execute(SQL_FUND_SCHEMA)
-    cursor.execute(SQL_CATEGORY_SCHEMA)
-    cursor.execute(SQL_TRANSACTION_SCHEMA)
-    conn.close()
+    with get_manager(db_path).writer() as cursor:
+        # Create database tables, or bring an existing file up to date
+        migrate(cursor)
@@ -0,0 +1,108 @@
+import re
+from dataclasses import dataclass
+from typing import Self
+
+CELLS_RE = re.compile(
+    r"(?P<start_col>[A-Z]{1,3})(?P<start_row>\d+)(?::(?P<end_col>[A-Z]{1,3})(?P<end_row>\d+))?"
+)
+
+
+def column_index(letters: str) -> int:
+    """Column letters to a 1-based index, e.g. A -> 1, AA -> 27"""
+    index = 0
+    for letter in letters:
+        index = index * 26 + ord(letter) - ord("A") + 1
+    return index
+
+
+def column_letters(index: int) -> str:
+    """1-based column index to letters, e.g. 27 -> AA"""
+    letters = ""
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord("A") + remainder) + letters
+    return letters
+
+
+def quote_sheet(sheet: str) -> str:
+    if re.fullmatch(r"[A-Za-z0-9_]+", sheet):
+        return sheet
+    return "'" + sheet.replace("'", "''") + "'"
+
+
+@dataclass(frozen=True)
+class A1Range:
+    """A bounded A1 range, e.g. Sheet1!A1:E4; rows and columns are 1-based"""
+
+    sheet: str | None
+    start_col: int
+    start_row: int
+    end_col: int
+    end_row: int
+
+    @classmethod
+    def parse(cls, range_name: str) -> Self | None:
+        """Parse a bounded range
+
+        Returns:
+            The range, or None for ranges this module does not handle such as
+            whole columns (A:C), whole sheets or named ranges
+        """
+        sheet, _, cells = range_name.strip().rpartition("!")
+        match = CELLS_RE.fullmatch(cells.upper())
+        if match is None:
+            return None
+        if sheet.startswith("'") and sheet.endswith("'"):
+            sheet = sheet[1:-1].replace("''", "'")
+        start_col = column_index(match.group("start_col"))
+        start_row = int(match.group("start_row"))
+        end_col = column_index(match.group("end_col") or match.group("start_col"))
+        end_row = int(match.group("end_row") or match.group("start_row"))
+        return cls(
+            sheet=sheet or None,
+            start_col=min(start_col, end_col),
+            start_row=min(start_row, end_row),
+            end_col=max(start_col, end_col),
+            end_row=max(start_row, end_row),
+        )
+
+    @property
+    def rows(self) -> int:
+        return self.end_row - self.start_row + 1
+
+    @property
+    def columns(self) -> int:
+        return self.end_col - self.start_col + 1
+
+    def same_columns(self, other: Self) -> bool:
+        return (
+            self.sheet == other.sheet
+            and self.start_col == other.start_col
+            and self.end_col == other.end_col
+        )
+
+    def touches(self, other: Self) -> bool:
+        """Same columns and overlapping or directly adjacent rows"""
+        return (
+            self.same_columns(other)
+            and self.start_row <= other.end_row + 1
+            and other.start_row <= self.end_row + 1
+        )
+
+    def union(self, other: Self) -> Self:
+        return A1Range(
+            sheet=self.sheet,
+            start_col=min(self.start_col, other.start_col),
+            start_row=min(self.start_row, other.start_row),
+            end_col=max(self.end_col, other.end_col),
+            end_row=max(self.end_row, other.end_row),
+        )
+
+    def __str__(self) -> str:
+        cells = (
+            f"{column_letters(self.start_col)}{self.start_row}:"
+            f"{column_letters(self.end_col)}{self.end_row}"
+        )
+        if self.sheet is None:
+            return cells
+        return f"{quote_sheet(self.sheet)}!{cells}"
@@ -0,0 +1,225 @@
+import hashlib
+import io
+import json
+import os
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+from PIL import Image, UnidentifiedImageError
+
+from config.logger import logger
+from config.settings import settings
+from services.receipt_image import paper_box
+
+HASH_SIZE = 32  # dHash of 32x32 gradients, 1024 bits
+
+
+@dataclass
+class OcrCacheStats:
+    exact_hits: int = 0
+    near_hits: int = 0  # same receipt, different bytes
+    misses: int = 0
+    evictions: int = 0
+
+    @property
+    def hits(self) -> int:
+        return self.exact_hits + self.near_hits
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / max(self.hits + self.misses, 1)
+
+
+@dataclass(frozen=True)
+class OcrCacheKey:
+    digest: str  # sha256 of the bytes and the options
+    options: str  # short hash of the options alone
+    dhash: str | None  # perceptual hash of the image, None for other files
+
+
+def _trim(gray: np.ndarray) -> np.ndarray:
+    """Crop a grayscale photo to the printed area of the receipt
+
+    Cropping to the ink on the paper makes the hash independent of how much
+    background or margin the photo kept.
+    """
+    box = paper_box(gray)
+    if box is not None:
+        left, top, right, bottom = box
+        # Inside the paper's edge, which rescaling blurs into the background
+        dy, dx = (bottom - top) // 50 + 1, (right - left) // 50 + 1
+        gray = gray[top + dy : bottom - dy, left + dx : right - dx]
+    ink = gray < np.median(gray) - 40
+    rows = np.flatnonzero(ink.any(axis=1))
+    cols = np.flatnonzero(ink.any(axis=0))
+    if len(rows) and len(cols):
+        gray = gray[rows[0] : rows[-1] + 1, cols[0] : cols[-1] + 1]
+    return gray
+
+
+def dhash(data: bytes, size: int = HASH_SIZE) -> str | None:
+    """Difference hash of a receipt photo, None if the bytes are not an image
+
+    The printed area is shrunk to `size + 1` x `size` grays and every bit
+    tells whether a pixel is brighter than its right neighbour, so the hash
+    survives recompression, rescaling and re-cropping, not rotation.
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            # JPEGs decode straight at a reduced scale
+            image.draft("L", (512, 512))
+            gray = np.asarray(image.convert("L"))
+    except (UnidentifiedImageError, OSError):
+        return None
+    small = Image.fromarray(_trim(gray)).resize((size + 1, size), Image.Resampling.BOX)
+    pixels = np.asarray(small, dtype=np.int16)
+    return np.packbits(pixels[:, 1:] > pixels[:, :-1]).tobytes().hex()
+
+
+def _hash_words(dhashes: list[str]) -> np.ndarray:
+    """Hex hashes to a (n, words) uint64 array"""
+    return np.frombuffer(
+        b"".join(bytes.fromhex(value) for value in dhashes), dtype=np.uint64
+    ).reshape(len(dhashes), -1)
+
+
+class OcrResultCache:
+    """Disk cache of OCR texts, keyed by the content of the parsed file
+
+    A text is stored in a JSON file named by the sha256 of the file bytes and
+    the parse options (backend, premium mode, result type...), so resending
+    the same photo never reaches the OCR API. Images are also indexed by a perceptual hash:
+    a lookup without an exact match returns the text of the closest image
+    parsed with the same options if its hash differs by at most
+    `max_distance` bits, e.g. the same receipt photo re-cropped or
+    recompressed by the chat app.
+
+    Files are bounded in bytes, least recently used go first.
+
+    Args:
+        cache_dir: directory of the cached texts
+        max_bytes: size of the texts kept
+        max_distance: bits of the 1024-bit perceptual hash that may differ for
+            a near-duplicate hit, 0 (the default) disables near-duplicate
+            lookups. A near hit returns the text of another photo, so only
+            raise it where two different receipts cannot look alike.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str | Path,
+        max_bytes: int = 16 * 1024 * 1024,
+        max_distance: int = 0,
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.max_distance = max_distance
+        self.stats = OcrCacheStats()
+        self._lock = threading.Lock()
+        self._index: dict[str, OcrCacheKey] | None = None
+
+    def _path(self, digest: str) -> Path:
+        return self.cache_dir / f"{digest}.json"
+
+    @property
+    def index(self) -> dict[str, OcrCacheKey]:
+        """Cached entries by digest, read from the files on first use"""
+        if self._index is None:
+            self._index = {}
+            for path in self.cache_dir.glob("*.json"):
+                try:
+                    entry = json.loads(path.read_text(encoding="utf-8"))
+                except (OSError, ValueError):
+                    continue
+                self._index[path.stem] = OcrCacheKey(
+                    path.stem, entry["options"], entry["dhash"]
+                )
+        return self._index
+
+    def key(self, data: bytes, options: dict) -> OcrCacheKey:
+        encoded = json.dumps(options, sort_keys=True).encode()
+        content = hashlib.sha256(data)
+        content.update(b"\0" + encoded)
+        return OcrCacheKey(
+            digest=content.hexdigest(),
+            options=hashlib.sha256(encoded).hexdigest()[:16],
+            dhash=dhash(data) if self.max_distance > 0 else None,
+        )
+
+    def _nearest(self, key: OcrCacheKey) -> OcrCacheKey | None:
+        candidates = [
+            entry
+            for entry in self.index.values()
+            if entry.options == key.options and entry.dhash is not None
+        ]
+        if key.dhash is None or not candidates:
+            return None
+        distances = np.bitwise_count(
+            _hash_words([entry.dhash for entry in candidates])
+            ^ _hash_words([key.dhash])
+        ).sum(axis=1)
+        nearest = int(distances.argmin())
+        if distances[nearest] > self.max_distance:
+            return None
+        logger.debug(
+            "OCR cache: %s matches %s by %d bits",
+            key.digest[:12],
+            candidates[nearest].digest[:12],
+            distances[nearest],
+        )
+        return candidates[nearest]
+
+    def get(self, key: OcrCacheKey) -> str | None:
+        """Cached text of a file, or of a near-duplicate image"""
+        with self._lock:
+            entry = self.index.get(key.digest)
+            exact = entry is not None
+            if not exact:
+                entry = self._nearest(key)
+            if entry is None:
+                self.stats.misses += 1
+                return None
+            path = self._path(entry.digest)
+            try:
+                text = json.loads(path.read_text(encoding="utf-8"))["text"]
+            except FileNotFoundError:
+                # Removed behind our back
+                self.index.pop(entry.digest, None)
+                self.stats.misses += 1
+                return None
+            os.utime(path)  # least recently used goes first
+            if exact:
+                self.stats.exact_hits += 1
+            else:
+                self.stats.near_hits += 1
+            return text
+
+    def put(self, key: OcrCacheKey, text: str):
+        with self._lock:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            entry = {"options": key.options, "dhash": key.dhash, "text": text}
+            self._path(key.digest).write_text(
+                json.dumps(entry, ensure_ascii=False), encoding="utf-8"
+            )
+            self.index[key.digest] = key
+            self._evict()
+
+    def _evict(self):
+        files = [(path, path.stat()) for path in self.cache_dir.glob("*.json")]
+        total = sum(stat.st_size for _, stat in files)
+        for path, stat in sorted(files, key=lambda item: item[1].st_mtime):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            self.index.pop(path.stem, None)
+            total -= stat.st_size
+            self.stats.evictions += 1
+
+
+ocr_cache = OcrResultCache(
+    Path(settings.CACHE_DIR) / "ocr",
+    max_bytes=settings.OCR_CACHE_MAX_BYTES,
+    max_distance=settings.OCR_CACHE_MAX_DISTANCE,
+)
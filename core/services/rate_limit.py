@@ -0,0 +1,234 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+
+from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest
+
+from config.logger import logger
+from config.settings import settings
+
+
+@dataclass
+class RateLimitStats:
+    acquired: int = 0  # calls let through
+    delayed: int = 0  # calls that had to wait for a token
+    wait_seconds: float = 0.0
+    throttled: int = 0  # rate limit responses reported
+    decreases: int = 0  # rate cuts, throttles within the cooldown are folded
+
+
+class TokenBucket:
+    """Token bucket with an additive-increase / multiplicative-decrease rate
+
+    Every call takes a token; tokens refill at the current rate up to
+    `burst`. A call that finds the bucket empty reserves a token anyway and
+    sleeps until it is due, so waiting callers are served in order. When the
+    API answers with a rate limit error the caller reports it with
+    `throttle`: the rate is cut by `decrease` (once per `cooldown`, a burst of
+    429s counts once) and, with a Retry-After, the bucket is drained for that
+    long. Successes then raise the rate back by `increase` calls per second
+    for every second without a throttle, up to the configured `rate`.
+
+    Usable from threads and coroutines alike.
+
+    Args:
+        name: service name, for logs
+        rate: budget in calls per second
+        burst: calls allowed at once after idling, defaults to one second of budget
+        min_rate: floor of the adaptive rate, defaults to a tenth of `rate`
+        increase: calls per second restored per second of successes,
+            defaults to `rate / 10`
+        decrease: factor applied to the rate on a throttle
+        cooldown: seconds after a cut during which throttles are not cut again
+        window: seconds over which utilization is measured
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rate: float,
+        burst: float | None = None,
+        min_rate: float | None = None,
+        increase: float | None = None,
+        decrease: float = 0.5,
+        cooldown: float = 1.0,
+        window: float = 10.0,
+    ):
+        self.name = name
+        self.max_rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self.min_rate = min_rate if min_rate is not None else rate / 10
+        self.increase = increase if increase is not None else rate / 10
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.window = window
+        self.stats = RateLimitStats()
+        self._rate = rate
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._decreased = float("-inf")
+        self._increased = time.monotonic()
+        self._granted: deque[float] = deque()
+        self._waiting = 0
+        self._lock = threading.Lock()
+
+    def __deepcopy__(self, memo: dict) -> "TokenBucket":
+        # Copies of agents and models keep spending the same budget
+        return self
+
+    @property
+    def rate(self) -> float:
+        """Current rate in calls per second"""
+        return self._rate
+
+    def _refill(self, now: float):
+        self._tokens = min(
+            self.burst, self._tokens + (now - self._updated) * self._rate
+        )
+        self._updated = now
+
+    def _reserve(self, tokens: float) -> float:
+        """Take tokens, returns the seconds to wait before using them"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= tokens
+            wait = max(0.0, -self._tokens / self._rate)
+            self._granted.append(now + wait)
+            self.stats.acquired += 1
+            if wait > 0:
+                self.stats.delayed += 1
+                self.stats.wait_seconds += wait
+            return wait
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """Block until a call is allowed, returns the seconds waited"""
+        wait = self._reserve(tokens)
+        if wait > 0:
+            self._waiting += 1
+            try:
+                time.sleep(wait)
+            finally:
+                self._waiting -= 1
+        return wait
+
+    async def acquire_async(self, tokens: float = 1.0) -> float:
+        """Wait until a call is allowed without blocking the event loop"""
+        wait = self._reserve(tokens)
+        if wait > 0:
+            self._waiting += 1
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                self._waiting -= 1
+        return wait
+
+    def succeed(self):
+        """Report a call that went through"""
+        with self._lock:
+            now = time.monotonic()
+            if self._rate < self.max_rate:
+                self._rate = min(
+                    self.max_rate,
+                    self._rate + self.increase * (now - self._increased),
+                )
+            self._increased = now
+
+    def throttle(self, retry_after: float | None = None):
+        """Report a rate limit response (HTTP 429)
+
+        Args:
+            retry_after: seconds the API asked to wait, if it said
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.stats.throttled += 1
+            self._refill(now)
+            self._increased = now
+            if now - self._decreased >= self.cooldown:
+                self._decreased = now
+                self._rate = max(self.min_rate, self._rate * self.decrease)
+                self.stats.decreases += 1
+                logger.warning(
+                    "%s is rate limited, slowing down to %.2f calls/s",
+                    self.name,
+                    self._rate,
+                )
+            if retry_after:
+                self._tokens = min(self._tokens, -retry_after * self._rate)
+
+    def utilization(self) -> float:
+        """Share of the budget used over the last `window` seconds"""
+        with self._lock:
+            now = time.monotonic()
+            while self._granted and self._granted[0] < now - self.window:
+                self._granted.popleft()
+            used = sum(1 for granted in self._granted if granted <= now)
+        return used / (self.max_rate * self.window)
+
+    def snapshot(self) -> dict[str, float]:
+        return {
+            "rate": self._rate,
+            "limit": self.max_rate,
+            "utilization": self.utilization(),
+            "waiting": self._waiting,
+            "throttled": self.stats.throttled,
+        }
+
+
+def google_request_builder(limiter: TokenBucket) -> type[HttpRequest]:
+    """`requestBuilder` for `googleapiclient.discovery.build` spending `limiter`
+
+    Every `execute()` of the built resource, batch requests included, takes a
+    token first and reports 429 responses back to the bucket.
+    """
+
+    class RateLimitedHttpRequest(HttpRequest):
+        def execute(self, http=None, num_retries=0):
+            limiter.acquire()
+            try:
+                result = super().execute(http=http, num_retries=num_retries)
+            except HttpError as e:
+                if e.resp.status == 429:
+                    retry_after = e.resp.get("retry-after", "")
+                    limiter.throttle(
+                        float(retry_after) if retry_after.isdigit() else None
+                    )
+                raise
+            limiter.succeed()
+            return result
+
+    return RateLimitedHttpRequest
+
+
+class RateLimits:
+    """Token buckets of the outbound APIs, by service name
+
+    Args:
+        budgets: service name -> (calls per second, burst)
+    """
+
+    def __init__(self, budgets: dict[str, tuple[float, float]]):
+        self.buckets = {
+            name: TokenBucket(name, rate, burst)
+            for name, (rate, burst) in budgets.items()
+        }
+
+    def __getitem__(self, name: str) -> TokenBucket:
+        return self.buckets[name]
+
+    def snapshot(self) -> dict[str, dict[str, float]]:
+        return {name: bucket.snapshot() for name, bucket in self.buckets.items()}
+
+
+rate_limits = RateLimits(
+    {
+        "gemini": (settings.GEMINI_RATE_LIMIT, settings.GEMINI_RATE_BURST),
+        "sheets": (settings.SHEETS_RATE_LIMIT, settings.SHEETS_RATE_BURST),
+        "llamaparse": (settings.LLAMAPARSE_RATE_LIMIT, settings.LLAMAPARSE_RATE_BURST),
+        "telegram": (settings.TELEGRAM_RATE_LIMIT, settings.TELEGRAM_RATE_BURST),
+    }
+)
@@ -0,0 +1,214 @@
+import io
+import time
+from dataclasses import dataclass, field
+
+import numpy as np
+from PIL import Image, UnidentifiedImageError
+
+# Thermal receipt rolls are 80 mm wide
+RECEIPT_WIDTH_INCHES = 80 / 25.4
+
+
+def paper_box(
+    gray: np.ndarray, coverage: float = 0.5
+) -> tuple[int, int, int, int] | None:
+    """Bounding box (left, top, right, bottom) of the receipt in a photo
+
+    Rows and columns with more than `coverage` of their pixels brighter than
+    the photo's mean are the paper; a low coverage keeps the corners of a
+    rotated receipt.
+    """
+    paper = gray > gray.mean()
+    rows = np.flatnonzero(paper.mean(axis=1) > coverage)
+    cols = np.flatnonzero(paper.mean(axis=0) > coverage)
+    if not len(rows) or not len(cols):
+        return None
+    return int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1
+
+
+def ink_mask(gray: np.ndarray) -> np.ndarray:
+    """Dark pixels lying on the paper, i.e. the printed text
+
+    The paper may be rotated: a pixel is on it when it lies between the
+    first and last paper pixel of its row.
+    """
+    paper = gray > gray.mean()
+    has_paper = paper.any(axis=1)
+    first = paper.argmax(axis=1)
+    last = paper.shape[1] - 1 - paper[:, ::-1].argmax(axis=1)
+    cols = np.arange(gray.shape[1])
+    inside = (cols >= first[:, None]) & (cols <= last[:, None]) & has_paper[:, None]
+    level = np.median(gray[paper]) if paper.any() else 255
+    return inside & (gray < level - 40)
+
+
+def upright_box(
+    width: int, height: int, angle: float, size: tuple[int, int]
+) -> tuple[int, int, int, int]:
+    """Box of a rotated paper once rotated back upright
+
+    The paper, `angle` degrees off, filled a `width` x `height` box; rotated
+    back with `expand` into an image of `size` it is centered in it.
+    """
+    cos, sin = np.cos(np.deg2rad(abs(angle))), np.sin(np.deg2rad(abs(angle)))
+    # width = w cos + h sin, height = w sin + h cos
+    determinant = cos * cos - sin * sin
+    paper_width = (width * cos - height * sin) / determinant
+    paper_height = (height * cos - width * sin) / determinant
+    left = (size[0] - paper_width) / 2
+    top = (size[1] - paper_height) / 2
+    return (
+        max(0, round(left)),
+        max(0, round(top)),
+        min(size[0], round(left + paper_width)),
+        min(size[1], round(top + paper_height)),
+    )
+
+
+def _profile_scores(ys: np.ndarray, xs: np.ndarray, angles: np.ndarray) -> np.ndarray:
+    """Variance of the ink's row profile once rotated by each angle"""
+    radians = np.deg2rad(angles)
+    rows = np.rint(
+        ys[None, :] * np.cos(radians)[:, None] + xs[None, :] * np.sin(radians)[:, None]
+    ).astype(np.int64)
+    rows -= rows.min(axis=1, keepdims=True)
+    width = int(rows.max()) + 1
+    offsets = np.arange(len(angles))[:, None] * width
+    profiles = np.bincount((rows + offsets).ravel(), minlength=len(angles) * width)
+    return profiles.reshape(len(angles), width).astype(np.float64).var(axis=1)
+
+
+def skew_angle(gray: np.ndarray, max_angle: float = 10.0) -> float:
+    """Rotation in degrees, counterclockwise, that levels the text lines
+
+    Projects the ink on rows for candidate angles, every degree then every
+    tenth of a degree around the best: level lines give the sharpest
+    profile, i.e. the largest variance of the row sums.
+    """
+    ys, xs = np.nonzero(ink_mask(gray))
+    if len(ys) < 100:
+        return 0.0
+    # A sample of the ink is enough to find the lines
+    step = max(1, len(ys) // 20_000)
+    ys = ys[::step] - ys.mean()
+    xs = xs[::step] - xs.mean()
+    coarse = np.arange(-np.floor(max_angle), np.floor(max_angle) + 1)
+    best = coarse[_profile_scores(ys, xs, coarse).argmax()]
+    fine = np.clip(best + np.arange(-1.0, 1.05, 0.1), -max_angle, max_angle)
+    angle = float(fine[_profile_scores(ys, xs, fine).argmax()].round(1))
+    # Image rows grow downwards, counterclockwise is the other way round
+    return -angle if angle else 0.0
+
+
+@dataclass
+class PreprocessStats:
+    input_bytes: int = 0
+    output_bytes: int = 0
+    angle: float = 0.0  # degrees the photo was rotated by
+    size: tuple[int, int] = (0, 0)  # pixels sent to OCR
+    seconds: dict[str, float] = field(default_factory=dict)  # by stage
+
+    @property
+    def saved_bytes(self) -> int:
+        return self.input_bytes - self.output_bytes
+
+
+class ReceiptPreprocessor:
+    """Shrink receipt photos to what OCR needs before uploading them
+
+    Stages, each timed in `PreprocessStats.seconds`:
+    decode (as grayscale, JPEGs at a reduced scale when they are larger than
+    needed), crop (to the paper), deskew (the angle that levels the text
+    lines, then the rotation and crop to the upright paper), downscale (the
+    paper to `target_dpi` for an 80 mm roll, before rotating it) and encode
+    (grayscale JPEG). The crop and the angle are found on a copy of at most
+    800 pixels. Files that are not images are passed
+    through.
+
+    Args:
+        target_dpi: resolution of the receipt sent to OCR
+        max_angle: largest skew corrected, in degrees
+        quality: JPEG quality of the output
+    """
+
+    def __init__(
+        self, target_dpi: int = 300, max_angle: float = 10.0, quality: int = 85
+    ):
+        self.target_dpi = target_dpi
+        self.max_angle = max_angle
+        self.quality = quality
+        self.target_width = round(target_dpi * RECEIPT_WIDTH_INCHES)
+
+    @property
+    def options(self) -> dict:
+        return {
+            "target_dpi": self.target_dpi,
+            "max_angle": self.max_angle,
+            "quality": self.quality,
+        }
+
+    def process(self, data: bytes) -> tuple[bytes, PreprocessStats]:
+        """Preprocessed JPEG of a photo, or the bytes as given if not an image"""
+        stats = PreprocessStats(input_bytes=len(data), output_bytes=len(data))
+        started = time.perf_counter()
+
+        def lap(stage: str):
+            nonlocal started
+            now = time.perf_counter()
+            stats.seconds[stage] = stats.seconds.get(stage, 0.0) + now - started
+            started = now
+
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                # The paper fills at least half of a receipt photo
+                image.draft("L", (2 * self.target_width, 2 * self.target_width))
+                gray = image.convert("L")
+        except (UnidentifiedImageError, OSError):
+            return data, stats
+        lap("decode")
+
+        # Found on a small copy, applied to the full image
+        small = gray.copy()
+        small.thumbnail((800, 800), Image.Resampling.BOX)
+        box = paper_box(np.asarray(small), coverage=0.05)
+        if box is not None:
+            scale = gray.width / small.width
+            small = small.crop(box)
+            gray = gray.crop(tuple(round(edge * scale) for edge in box))
+        lap("crop")
+
+        stats.angle = skew_angle(np.asarray(small), self.max_angle)
+        lap("deskew")
+
+        # The paper, once upright, gets the target width
+        left, _, right, _ = upright_box(*gray.size, stats.angle, gray.size)
+        scale = min(1.0, self.target_width / max(right - left, 1))
+        if scale < 1.0:
+            gray = gray.resize(
+                (round(gray.width * scale), round(gray.height * scale)),
+                Image.Resampling.LANCZOS,
+                # Shrinks by whole factors first, then resamples
+                reducing_gap=2.0,
+            )
+        lap("downscale")
+
+        if stats.angle:
+            width, height = gray.size
+            gray = gray.rotate(
+                stats.angle,
+                resample=Image.Resampling.BILINEAR,
+                expand=True,
+                fillcolor=int(np.median(np.asarray(small))),  # the paper's
+            )
+            gray = gray.crop(upright_box(width, height, stats.angle, gray.size))
+        lap("deskew")
+
+        output = io.BytesIO()
+        gray.save(output, "JPEG", quality=self.quality, optimize=True)
+        lap("encode")
+        stats.size = gray.size
+        if output.tell() >= len(data):
+            # Already small, e.g. a scan: keep the original
+            return data, stats
+        stats.output_bytes = output.tell()
+        return output.getvalue(), stats
@@ -0,0 +1,209 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+
+import duckdb
+import pandas as pd
+from googleapiclient.discovery import Resource
+from googleapiclient.errors import HttpError
+
+from config.logger import logger
+from config.settings import settings
+
+DRIVE_METADATA_SCOPE = "https://www.googleapis.com/auth/drive.metadata.readonly"
+
+
+@dataclass
+class SheetCacheStats:
+    memory_hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+    validations: int = 0  # metadata requests
+    bypasses: int = 0  # reads without a usable revision
+    evictions: int = 0
+
+    @property
+    def hits(self) -> int:
+        return self.memory_hits + self.disk_hits
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / max(self.hits + self.misses, 1)
+
+
+class SheetRangeCache:
+    """Read-through cache of spreadsheet range values
+
+    Values are cached per (spreadsheet, range) together with the Drive
+    `version` of the spreadsheet, a number bumped by every change to the
+    file. A read first asks Drive for that version (a small metadata
+    request), then serves the range from memory or from a Parquet file under
+    `cache_dir` if it was cached at that version, and only fetches the values
+    otherwise. Spreadsheets whose version cannot be read, e.g. without the
+    Drive metadata scope, are always fetched.
+
+    Memory and disk are bounded in bytes, least recently used entries go
+    first.
+
+    Args:
+        cache_dir: directory of the Parquet files
+        max_disk_bytes: size of the Parquet files kept
+        max_memory_bytes: approximate size of the values kept in memory
+        revalidate_after: seconds a spreadsheet's version is trusted without
+            asking Drive again; 0 asks before every read
+    """
+
+    def __init__(
+        self,
+        cache_dir: str | Path,
+        max_disk_bytes: int = 64 * 1024 * 1024,
+        max_memory_bytes: int = 8 * 1024 * 1024,
+        revalidate_after: float = 0.0,
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.max_disk_bytes = max_disk_bytes
+        self.max_memory_bytes = max_memory_bytes
+        self.revalidate_after = revalidate_after
+        self.stats = SheetCacheStats()
+        # key -> (version, values, size)
+        self._memory: OrderedDict[str, tuple[str, list[list], int]] = OrderedDict()
+        self._memory_bytes = 0
+        self._versions: dict[str, tuple[str, float]] = {}
+        self._lock = threading.Lock()
+        self._duckdb = duckdb.connect()
+
+    @staticmethod
+    def _key(sheet_id: str, range_name: str) -> str:
+        return hashlib.sha1(f"{sheet_id}\0{range_name}".encode()).hexdigest()
+
+    def _path(self, key: str, version: str) -> Path:
+        return self.cache_dir / f"{key}.{version}.parquet"
+
+    def version(self, drive: Resource, sheet_id: str) -> str | None:
+        """Current Drive version of a spreadsheet, None if unavailable"""
+        checked = self._versions.get(sheet_id)
+        if (
+            checked is not None
+            and time.monotonic() - checked[1] < self.revalidate_after
+        ):
+            return checked[0]
+        try:
+            result: dict = drive.get(fileId=sheet_id, fields="version").execute()
+        except HttpError as e:
+            logger.warning(
+                "Cannot read the version of %s, not caching: %s", sheet_id, e
+            )
+            return None
+        self.stats.validations += 1
+        version = str(result["version"])
+        self._versions[sheet_id] = (version, time.monotonic())
+        return version
+
+    def get(self, sheet_id: str, range_name: str, version: str) -> list[list] | None:
+        key = self._key(sheet_id, range_name)
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached is not None and cached[0] == version:
+                self._memory.move_to_end(key)
+                self.stats.memory_hits += 1
+                return cached[1]
+
+        path = self._path(key, version)
+        if not path.exists():
+            self.stats.misses += 1
+            return None
+        cursor = self._duckdb.cursor()
+        try:
+            values = [row for (row,) in cursor.read_parquet(str(path)).fetchall()]
+        finally:
+            cursor.close()
+        os.utime(path)  # least recently used goes first
+        self.stats.disk_hits += 1
+        self._remember(key, version, values)
+        return values
+
+    def put(self, sheet_id: str, range_name: str, version: str, values: list[list]):
+        key = self._key(sheet_id, range_name)
+        self._remember(key, version, values)
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        for stale in self.cache_dir.glob(f"{key}.*.parquet"):
+            stale.unlink(missing_ok=True)
+        frame = pd.DataFrame({"row": pd.Series(values, dtype=object)})
+        path = self._path(key, version)
+        cursor = self._duckdb.cursor()
+        try:
+            cursor.from_df(frame).write_parquet(str(path))
+        finally:
+            cursor.close()
+        self._evict_disk()
+
+    def read(
+        self, sheets: Resource, drive: Resource, sheet_id: str, range_name: str
+    ) -> list[list]:
+        """Range values, served locally while the spreadsheet is unchanged
+
+        Args:
+            sheets: `spreadsheets()` resource
+            drive: `files()` resource of the Drive v3 API
+            sheet_id: ID of the sheet
+            range_name: Logical range within a sheet. Example: Sheet1!A1:E4
+        """
+        version = self.version(drive, sheet_id)
+        if version is None:
+            self.stats.bypasses += 1
+        else:
+            values = self.get(sheet_id, range_name, version)
+            if values is not None:
+                return values
+
+        result: dict = (
+            sheets.values().get(spreadsheetId=sheet_id, range=range_name).execute()
+        )
+        # Formatted values are strings already, numbers would not fit the
+        # Parquet list<string> column
+        values = [[str(value) for value in row] for row in result.get("values", [])]
+        if version is not None:
+            self.put(sheet_id, range_name, version, values)
+        return values
+
+    def invalidate(self, sheet_id: str):
+        """Forget the trusted version of a spreadsheet, e.g. after writing to it"""
+        self._versions.pop(sheet_id, None)
+
+    def _remember(self, key: str, version: str, values: list[list]):
+        size = len(json.dumps(values))
+        with self._lock:
+            previous = self._memory.pop(key, None)
+            if previous is not None:
+                self._memory_bytes -= previous[2]
+            if size > self.max_memory_bytes:
+                return
+            self._memory[key] = (version, values, size)
+            self._memory_bytes += size
+            while self._memory_bytes > self.max_memory_bytes:
+                _, (_, _, evicted) = self._memory.popitem(last=False)
+                self._memory_bytes -= evicted
+
+    def _evict_disk(self):
+        files = [(path, path.stat()) for path in self.cache_dir.glob("*.parquet")]
+        total = sum(stat.st_size for _, stat in files)
+        for path, stat in sorted(files, key=lambda item: item[1].st_mtime):
+            if total <= self.max_disk_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= stat.st_size
+            self.stats.evictions += 1
+
+
+sheet_cache = SheetRangeCache(
+    Path(settings.CACHE_DIR) / "sheets",
+    max_disk_bytes=settings.SHEETS_CACHE_MAX_BYTES,
+    max_memory_bytes=settings.SHEETS_CACHE_MEMORY_BYTES,
+    revalidate_after=settings.SHEETS_CACHE_REVALIDATE_AFTER,
+)
@@ -0,0 +1,204 @@
+import re
+import unicodedata
+from itertools import zip_longest
+
+import numpy as np
+import pandas as pd
+
+from db.schema import Transaction
+
+# Normalized sheet headers that name a `Transaction` column, besides the
+# column names themselves
+HEADER_ALIASES = {
+    "date": "datetime",
+    "time": "datetime",
+    "timestamp": "datetime",
+    "ngay": "datetime",
+    "thoi gian": "datetime",
+    "value": "amount",
+    "so tien": "amount",
+    "ccy": "currency",
+    "tien te": "currency",
+    "fund": "fund_name",
+    "quy": "fund_name",
+    "category": "category_name",
+    "danh muc": "category_name",
+    "description": "note",
+    "memo": "note",
+    "ghi chu": "note",
+    "user": "by",
+}
+TIMESTAMP_COLUMNS = {"datetime", "created_at", "updated_at"}
+NUMERIC_COLUMNS = {
+    name: "Int64" if field.annotation is int else "float64"
+    for name, field in Transaction.model_fields.items()
+    if field.annotation in (int, float)
+}
+# Thousands separators and currency marks around sheet numbers: "45,000 đ"
+NUMBER_NOISE = [",", " ", "_", "'", "đ", "₫", "$", "€"]
+# "1.500.000", "1.500" or "1.500,5": dots grouping thousands, as Vietnamese
+# amounts are written (see `agents.expense_parser._parse_number`). "1.500" is
+# also a decimal in other currencies, so it is only read as thousands in VND
+# rows; with two groups or more ("1.500.000") it cannot be a decimal.
+DOT_THOUSANDS_RE = r"[-+]?[1-9]\d{0,2}(?:\.\d{3})+(?:,\d+)?"
+GROUPED_THOUSANDS_RE = r"[-+]?[1-9]\d{0,2}(?:\.\d{3}){2,}(?:,\d+)?"
+
+
+def normalize_header(name: object) -> str | None:
+    """`Transaction` column named by a sheet header, None if unknown
+
+    Headers are matched case, accent and separator insensitively:
+    "Fund name", "fund_name" and "Quỹ" all name `fund_name`.
+    """
+    text = unicodedata.normalize("NFKD", str(name or "").lower()).replace("đ", "d")
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"[\s_\-]+", " ", text.strip())
+    column = text.replace(" ", "_")
+    if column in Transaction.model_fields:
+        return column
+    return HEADER_ALIASES.get(text)
+
+
+def _columns(rows: list[list], width: int):
+    """Columns of ragged rows, one at a time, padded with None"""
+    padded = zip_longest(*rows, fillvalue=None) if rows else iter(())
+    for index in range(width):
+        column = next(padded, None)
+        if column is None:
+            column = (None,) * len(rows)
+        yield index, np.array(column, dtype=object)
+
+
+def parse_numbers(
+    column: np.ndarray, dtype: str = "float64", vnd: np.ndarray | None = None
+) -> pd.Series:
+    """Vectorized number parsing, unparseable cells become missing
+
+    Args:
+        column: cells of the column
+        dtype: "float64" or "Int64"
+        vnd: which cells are VND amounts, where "1.500" is 1500 rather
+            than 1.5 (see `DOT_THOUSANDS_RE`)
+    """
+    missing = pd.isna(column) | (column == "")
+    texts = column.astype(str)
+    texts[missing] = "nan"
+    dotted = np.strings.find(texts, ".") >= 0
+    if dotted.any():
+        stripped = np.strings.strip(texts[dotted])
+        cells = pd.Series(stripped)
+        thousands = cells.str.fullmatch(GROUPED_THOUSANDS_RE).to_numpy()
+        if vnd is not None:
+            thousands |= vnd[dotted] & cells.str.fullmatch(DOT_THOUSANDS_RE).to_numpy()
+        stripped = np.strings.replace(np.strings.replace(stripped, ".", ""), ",", ".")
+        texts = texts.astype(object)
+        texts[np.flatnonzero(dotted)[thousands]] = stripped[thousands]
+        texts = texts.astype(str)
+    try:
+        numbers = pd.Series(texts.astype(np.float64))
+    except ValueError:
+        for noise in NUMBER_NOISE:
+            texts = np.strings.replace(texts, noise, "")
+        numbers = pd.to_numeric(pd.Series(texts), errors="coerce")
+    if dtype == "Int64":
+        # Drops fractional ids rather than rounding them
+        numbers = numbers.where(numbers == numbers.round())
+    return numbers.astype(dtype)
+
+
+def parse_timestamps(column: np.ndarray) -> pd.Series:
+    """Vectorized timestamp parsing
+
+    ISO timestamps, as the ledger writes them, are parsed in one pass; the
+    rest are retried as day-first dates ("01/05/2025" is the 1st of May).
+    """
+    values = pd.Series(column, dtype=object, copy=False)
+    timestamps = pd.to_datetime(values, errors="coerce", format="ISO8601")
+    failed = timestamps.isna() & values.notna() & (values != "")
+    if failed.any():
+        timestamps[failed] = pd.to_datetime(
+            values[failed].astype(str), errors="coerce", format="mixed", dayfirst=True
+        )
+    return timestamps.astype("datetime64[us]")
+
+
+def parse_strings(column: np.ndarray) -> pd.Series:
+    """Stripped strings, blank cells become None"""
+    return pd.Series(
+        [None if value is None else (str(value).strip() or None) for value in column],
+        dtype=object,
+    )
+
+
+def to_transaction_frame(
+    values: list[list], header: list | None = None
+) -> pd.DataFrame:
+    """Typed DataFrame of `Transaction` columns from sheet values
+
+    Columns are matched by header (`normalize_header`) and parsed column by
+    column, so at most one extra column is held besides the values: numbers
+    to float64/Int64, timestamps to datetime64 and text to stripped strings.
+    Columns the header does not map to `Transaction` are dropped. The numpy
+    backed columns are scanned in place by DuckDB when the frame is
+    registered, e.g. passed to `db.ingest.ingest_transactions`.
+
+    Args:
+        values: rows of cells as returned by the Sheets API, rows may be
+            shorter than the header
+        header: cell values of the header row, the first row of `values`
+            when omitted
+
+    Returns:
+        A pd.DataFrame with the mapped columns in `Transaction` order
+    """
+    if header is None:
+        if not values:
+            return pd.DataFrame()
+        header, values = values[0], values[1:]
+    names = [normalize_header(name) for name in header]
+    vnd = None
+    if "currency" in names:
+        # Read ahead: the amount column is parsed before the currency one
+        index = names.index("currency")
+        currencies = [row[index] if index < len(row) else None for row in values]
+        vnd = parse_strings(currencies).str.upper().eq("VND").to_numpy()
+
+    parsed: dict[str, pd.Series] = {}
+    for index, column in _columns(values, len(names)):
+        name = names[index]
+        if name is None or name in parsed:
+            continue
+        if name in TIMESTAMP_COLUMNS:
+            parsed[name] = parse_timestamps(column)
+        elif name in NUMERIC_COLUMNS:
+            parsed[name] = parse_numbers(
+                column, NUMERIC_COLUMNS[name], vnd if name == "amount" else None
+            )
+        else:
+            parsed[name] = parse_strings(column)
+    return pd.DataFrame(
+        {name: parsed[name] for name in Transaction.model_fields if name in parsed},
+        copy=False,
+    )
+
+
+def to_sheet_values(frame: pd.DataFrame) -> list[list]:
+    """Rows of JSON-ready cells for a values update
+
+    Converted column by column: timestamps are formatted like the ledger
+    writes them and missing values become None, which the API leaves
+    untouched (NaN is not valid JSON).
+    """
+    columns = []
+    for _, column in frame.items():
+        if pd.api.types.is_datetime64_any_dtype(column.dtype):
+            seconds = column.to_numpy().astype("datetime64[s]")
+            cells = pd.Series(
+                np.strings.replace(np.datetime_as_string(seconds), "T", " "),
+                dtype=object,
+                index=column.index,
+            )
+        else:
+            cells = column.astype(object)
+        columns.append(cells.where(column.notna(), None).tolist())
+    return [list(row) for row in zip(*columns)]
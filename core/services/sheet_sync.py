@@ -0,0 +1,511 @@
+import datetime
+import hashlib
+import json
+from argparse import ArgumentParser
+from dataclasses import dataclass
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+
+import duckdb
+import pandas as pd
+
+from config.logger import logger
+from db.connection import get_manager
+from db.ingest import ingest_transactions
+from db.ledger import delete_transaction, update_transaction
+from db.schema import Transaction
+from services.a1 import quote_sheet
+from services.sheets import GoogleSheetService
+
+# Sheet columns A:H, the header sits on row 1
+SHEET_COLUMNS = [
+    "id",
+    "datetime",
+    "amount",
+    "currency",
+    "fund_name",
+    "category_name",
+    "note",
+    "updated_at",
+]
+# Columns compared to detect edits, `updated_at` is informative only
+HASHED_COLUMNS = SHEET_COLUMNS[:-1]
+LAST_COLUMN = "H"
+FIRST_ROW = 2
+
+LEDGER_QUERY = """
+SELECT
+    transaction.id,
+    strftime(transaction.datetime, '%Y-%m-%d %H:%M:%S') AS datetime,
+    transaction.amount,
+    transaction.currency,
+    fund.fund_name,
+    category.category_name,
+    COALESCE(transaction.note, '') AS note,
+    transaction.updated_at
+FROM transaction
+JOIN fund ON transaction.fund_id = fund.id
+JOIN category ON transaction.category_id = category.id
+WHERE transaction.by = ?
+ORDER BY transaction.datetime, transaction.id
+"""
+CHANGED_QUERY = """
+SELECT transaction.id
+FROM transaction
+LEFT JOIN sheet_row ON (
+    sheet_row.sheet_id = ? AND sheet_row.tab = ?
+    AND sheet_row.transaction_id = transaction.id
+)
+WHERE transaction.by = ?
+    AND (sheet_row.transaction_id IS NULL OR transaction.updated_at > ?)
+"""
+
+
+@dataclass
+class SyncReport:
+    pushed: int = 0  # ledger rows written to the sheet
+    pulled: int = 0  # sheet edits applied to the ledger
+    inserted: int = 0  # new sheet rows added to the ledger
+    deleted: int = 0  # rows removed on either side
+    conflicts: int = 0  # rows changed on both sides, resolved by `resolve`
+    rejected: int = 0  # sheet rows that could not be applied
+    requests: int = 0
+    bytes_sent: int = 0
+    # What reading, clearing and rewriting the whole tab would have cost
+    full_rewrite_requests: int = 0
+    full_rewrite_bytes: int = 0
+
+    @property
+    def requests_saved(self) -> int:
+        return self.full_rewrite_requests - self.requests
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.full_rewrite_bytes - self.bytes_sent
+
+
+def canonical_row(row: list) -> tuple[str, ...]:
+    """Normalize the hashed cells of a sheet or ledger row
+
+    Raises:
+        ValueError: if the id, datetime or amount cannot be parsed
+    """
+    row = list(row) + [None] * (len(SHEET_COLUMNS) - len(row))
+    id_, when, amount, currency, fund_name, category_name, note = [
+        "" if value is None or pd.isna(value) else str(value).strip()
+        for value in row[: len(HASHED_COLUMNS)]
+    ]
+    try:
+        amount = Decimal(amount.replace(",", "")).quantize(Decimal("0.01"))
+    except InvalidOperation:
+        raise ValueError(f"Invalid amount {amount!r}")
+    return (
+        str(int(float(id_))) if id_ else "",
+        pd.Timestamp(when).strftime("%Y-%m-%d %H:%M:%S"),
+        str(amount),
+        currency.upper(),
+        fund_name,
+        category_name,
+        note,
+    )
+
+
+def row_hash(values: tuple[str, ...]) -> str:
+    return hashlib.md5("\x1f".join(values).encode()).hexdigest()
+
+
+def _is_empty(row: list) -> bool:
+    return all(
+        value is None or pd.isna(value) or str(value).strip() == "" for value in row
+    )
+
+
+def _payload_size(values: list[list]) -> int:
+    return len(json.dumps(values, default=str))
+
+
+def resolve(sheet_updated_at: str | None, ledger_updated_at: datetime.datetime) -> str:
+    """Pick the winner of a row edited on both sides since the last sync
+
+    The sheet wins only if its `updated_at` cell was moved past the ledger's,
+    e.g. by an Apps Script stamping edits; otherwise, and on ties, the ledger
+    wins. Returns "sheet" or "ledger".
+    """
+    try:
+        stamped = (
+            pd.Timestamp(sheet_updated_at).to_pydatetime() if sheet_updated_at else None
+        )
+    except ValueError:
+        stamped = None
+    if stamped is not None and stamped > ledger_updated_at:
+        return "sheet"
+    return "ledger"
+
+
+class SheetSync:
+    """Incremental two-way sync of a user's transactions with a sheet tab
+
+    Each transaction owns one row of the tab (columns `SHEET_COLUMNS`).
+    `sheet_row` remembers the row and a hash of the values last written or
+    read for every transaction, and `sheet_sync` a watermark: the latest
+    `updated_at` pushed. A sync
+
+    1. reads the tab once and finds rows whose hash changed (edited in the
+       sheet), mapped rows that were emptied (deleted in the sheet) and rows
+       without an id (added in the sheet);
+    2. finds transactions updated after the watermark or not in the sheet yet,
+       and mapped transactions that no longer exist;
+    3. resolves rows changed on both sides with `resolve`;
+    4. applies sheet changes through the ledger functions, so the monthly
+       totals stay correct, and writes ledger changes to their own rows only.
+
+    Writes and clears go through a `SheetsBatcher`, so adjacent rows are sent
+    as one range. The database writer lock is only held to apply the sheet
+    changes and to record the pushed rows, never during Sheets requests.
+
+    Args:
+        db_path: ledger database
+        service: Google Sheets service
+        sheet_id: spreadsheet ID
+        username: owner of the synced transactions
+        tab: sheet (tab) name
+    """
+
+    def __init__(
+        self,
+        db_path: str | Path,
+        service: GoogleSheetService,
+        sheet_id: str,
+        username: str,
+        tab: str = "Ledger",
+    ):
+        self.manager = get_manager(db_path)
+        self.service = service
+        self.sheet_id = sheet_id
+        self.username = username
+        self.tab = tab
+
+    def _range(self, row_number: int) -> str:
+        return f"{quote_sheet(self.tab)}!A{row_number}:{LAST_COLUMN}{row_number}"
+
+    def _load_state(self, conn: duckdb.DuckDBPyConnection):
+        state = conn.execute(
+            "SELECT watermark FROM sheet_sync WHERE sheet_id = ? AND tab = ?",
+            (self.sheet_id, self.tab),
+        ).fetchone()
+        rows = conn.execute(
+            "SELECT transaction_id, row_number, row_hash FROM sheet_row WHERE sheet_id = ? AND tab = ?",
+            (self.sheet_id, self.tab),
+        ).fetchall()
+        watermark = state[0] if state else None
+        return state is not None, watermark, {tid: (row, h) for tid, row, h in rows}
+
+    def _ledger_rows(self, conn: duckdb.DuckDBPyConnection) -> dict[int, list]:
+        """Every transaction of the user as sheet values, by id"""
+        rows = conn.execute(LEDGER_QUERY, (self.username,)).fetchall()
+        return {
+            row[0]: [
+                row[0],
+                row[1],
+                float(row[2]),
+                row[3],
+                row[4],
+                row[5],
+                row[6],
+                row[7].strftime("%Y-%m-%d %H:%M:%S"),
+            ]
+            for row in rows
+        }
+
+    def _apply_sheet_row(
+        self,
+        conn: duckdb.DuckDBPyConnection,
+        transaction_id: int,
+        values: tuple[str, ...],
+    ) -> bool:
+        _, when, amount, currency, fund_name, category_name, note = values
+        ids = conn.execute(
+            """
+            SELECT fund.id, category.id FROM fund JOIN category ON category.fund_id = fund.id
+            WHERE fund.fund_name = ? AND category.category_name = ?
+            """,
+            (fund_name, category_name),
+        ).fetchone()
+        if ids is None:
+            return False
+        return update_transaction(
+            conn,
+            transaction_id,
+            {
+                "datetime": when,
+                "amount": Decimal(amount),
+                "currency": currency,
+                "fund_id": ids[0],
+                "category_id": ids[1],
+                "note": note or None,
+            },
+        )
+
+    def _insert_sheet_row(
+        self, conn: duckdb.DuckDBPyConnection, values: tuple[str, ...]
+    ) -> int:
+        _, when, amount, currency, fund_name, category_name, note = values
+        now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        ingest_transactions(
+            conn,
+            [
+                Transaction(
+                    id=0,  # assigned by the ledger sequence
+                    datetime=when,
+                    amount=float(amount),
+                    currency=currency,
+                    fund_name=fund_name,
+                    category_name=category_name,
+                    note=note or None,
+                    created_at=now,
+                    updated_at=now,
+                    by=self.username,
+                )
+            ],
+        )
+        return conn.execute("SELECT currval('transaction_id_seq')").fetchone()[0]
+
+    def _save_state(
+        self,
+        conn: duckdb.DuckDBPyConnection,
+        mapping: dict[int, tuple[int, str]],
+        watermark: datetime.datetime | None = None,
+    ):
+        """Replace the row mapping, and move the watermark when given"""
+        conn.begin()
+        try:
+            conn.execute(
+                "DELETE FROM sheet_row WHERE sheet_id = ? AND tab = ?",
+                (self.sheet_id, self.tab),
+            )
+            if mapping:
+                conn.executemany(
+                    "INSERT INTO sheet_row VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (self.sheet_id, self.tab, tid, row, h)
+                        for tid, (row, h) in mapping.items()
+                    ],
+                )
+            if watermark is not None:
+                conn.execute(
+                    """
+                    INSERT INTO sheet_sync (sheet_id, tab, by, watermark, synced_at)
+                    VALUES (?, ?, ?, ?, now())
+                    ON CONFLICT DO UPDATE SET
+                        watermark = EXCLUDED.watermark, synced_at = EXCLUDED.synced_at
+                    """,
+                    (self.sheet_id, self.tab, self.username, watermark),
+                )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def sync(self) -> SyncReport:
+        report = SyncReport()
+        with self.service.batcher() as batch:
+            # 1. Read the tab, without holding the ledger
+            sheet = batch.read_sheet_values(
+                self.sheet_id, f"{quote_sheet(self.tab)}!A{FIRST_ROW}:{LAST_COLUMN}"
+            )
+            batch.flush()
+            frame = sheet.result()
+            sheet_rows = frame.values.tolist() if not frame.empty else []
+
+            with self.manager.writer() as conn:
+                initialized, watermark, mapping = self._load_state(conn)
+                by_row = {row: tid for tid, (row, _) in mapping.items()}
+
+                # What changed in the sheet
+                edited: dict[int, tuple[tuple[str, ...], str | None]] = {}
+                removed: set[int] = set()
+                added: list[tuple[int, tuple[str, ...]]] = []
+                for offset, row in enumerate(sheet_rows):
+                    row_number = FIRST_ROW + offset
+                    tid = by_row.get(row_number)
+                    if _is_empty(row):
+                        if tid is not None:
+                            removed.add(tid)
+                        continue
+                    try:
+                        values = canonical_row(row)
+                    except ValueError as e:
+                        logger.warning(
+                            "Row %d of %s is invalid: %s", row_number, self.tab, e
+                        )
+                        report.rejected += 1
+                        if tid is not None:
+                            # Overwritten with the ledger's values below
+                            edited[tid] = (None, None)
+                        continue
+                    if tid is None:
+                        if values[0]:
+                            logger.warning(
+                                "Row %d of %s has an unknown id, skipped",
+                                row_number,
+                                self.tab,
+                            )
+                        else:
+                            added.append((row_number, values))
+                    elif row_hash(values) != mapping[tid][1]:
+                        updated_at = row[7] if len(row) > 7 else None
+                        edited[tid] = (values, updated_at)
+                # Rows mapped below the end of the returned values were emptied
+                removed |= {
+                    tid
+                    for row, tid in by_row.items()
+                    if row >= FIRST_ROW + len(sheet_rows)
+                }
+
+                # 2. What changed in the ledger
+                changed = {
+                    tid
+                    for (tid,) in conn.execute(
+                        CHANGED_QUERY,
+                        (
+                            self.sheet_id,
+                            self.tab,
+                            self.username,
+                            watermark or datetime.datetime.min,
+                        ),
+                    ).fetchall()
+                }
+                existing = self._ledger_rows(conn)
+                vanished = set(mapping) - set(existing)
+
+                # 3. Conflicts, then 4. apply sheet changes to the ledger
+                push = set(changed) - vanished
+                for tid, (values, updated_at) in edited.items():
+                    if tid in vanished:
+                        report.conflicts += 1
+                        continue
+                    if values is None:
+                        push.add(tid)
+                        continue
+                    if tid in changed:
+                        report.conflicts += 1
+                        ledger_updated_at = datetime.datetime.fromisoformat(
+                            existing[tid][7]
+                        )
+                        if resolve(updated_at, ledger_updated_at) == "ledger":
+                            continue
+                    if self._apply_sheet_row(conn, tid, values):
+                        report.pulled += 1
+                        mapping[tid] = (mapping[tid][0], row_hash(values))
+                        push.discard(tid)
+                    else:
+                        report.rejected += 1
+                        push.add(tid)
+                for tid in removed - vanished:
+                    if tid in changed:
+                        report.conflicts += 1
+                        continue
+                    delete_transaction(conn, tid)
+                    report.deleted += 1
+                    vanished.add(tid)
+                for row_number, values in added:
+                    try:
+                        tid = self._insert_sheet_row(conn, values)
+                    except ValueError as e:
+                        logger.warning(
+                            "Row %d of %s was not added: %s", row_number, self.tab, e
+                        )
+                        report.rejected += 1
+                        continue
+                    report.inserted += 1
+                    mapping[tid] = (row_number, "")
+                    push.add(tid)
+                for tid in removed & vanished:
+                    mapping.pop(tid, None)
+
+                # What the sheet gets, and the watermark once it has it. The
+                # mapping is saved now so rows added from the sheet keep their
+                # transaction if the push below fails.
+                ledger = self._ledger_rows(conn)
+                (pushed_until,) = conn.execute(
+                    "SELECT MAX(updated_at) FROM transaction WHERE by = ?",
+                    (self.username,),
+                ).fetchone()
+                self._save_state(conn, mapping)
+
+            # 4. Push ledger changes to their rows, without holding the ledger
+            next_row = (
+                max(
+                    [
+                        FIRST_ROW + len(sheet_rows) - 1,
+                        *(row for row, _ in mapping.values()),
+                    ],
+                    default=FIRST_ROW - 1,
+                )
+                + 1
+            )
+            if not initialized:
+                header = [SHEET_COLUMNS]
+                batch.write_sheet_values(
+                    self.sheet_id, self._range(1), pd.DataFrame(header)
+                )
+                report.bytes_sent += _payload_size(header)
+            for tid, values in ledger.items():
+                if tid not in push:
+                    continue
+                if tid in mapping:
+                    row_number = mapping[tid][0]
+                else:
+                    row_number, next_row = next_row, next_row + 1
+                batch.write_sheet_values(
+                    self.sheet_id,
+                    self._range(row_number),
+                    pd.DataFrame([values], dtype=object),
+                )
+                mapping[tid] = (row_number, row_hash(canonical_row(values)))
+                report.pushed += 1
+                report.bytes_sent += _payload_size([values])
+            for tid in vanished - removed:
+                row_number, _ = mapping.pop(tid)
+                batch.delete_sheet_values(self.sheet_id, self._range(row_number))
+                report.deleted += 1
+            batch.flush()
+
+            # 5. Record the pushed rows. Ledger writes made during the push
+            # are after the watermark and go with the next sync.
+            with self.manager.writer() as conn:
+                self._save_state(conn, mapping, pushed_until or datetime.datetime.min)
+
+            report.requests = batch.stats.requests
+            # Reading the tab, clearing it and writing the header and every row
+            report.full_rewrite_requests = 3
+            report.full_rewrite_bytes = _payload_size([SHEET_COLUMNS, *ledger.values()])
+        logger.info("Synced %s!%s: %s", self.sheet_id, self.tab, report)
+        return report
+
+
+def parse_args():
+    parser = ArgumentParser(
+        description="Sync a user's transactions with a Google Sheet tab"
+    )
+    parser.add_argument("db_path", type=str, help="Path to the .duckdb file")
+    parser.add_argument("sheet_url", type=str, help="Google Sheet document URL")
+    parser.add_argument("username", type=str)
+    parser.add_argument("--tab", type=str, default="Ledger")
+    args = parser.parse_args()
+    return vars(args)
+
+
+def main():
+    args = parse_args()
+    service = GoogleSheetService()
+    sheet_id = service.get_sheet_id_from_url(args["sheet_url"])
+    report = SheetSync(
+        args["db_path"], service, sheet_id, args["username"], args["tab"]
+    ).sync()
+    print(report)
+    print(f"saved {report.requests_saved} requests and {report.bytes_saved} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,11 @@ import pandas as pd
 from googleapiclient.discovery import Resource, build
 
 from auth.google import auth_google_installed_app_flow
+from config.settings import settings
+from services.rate_limit import TokenBucket, google_request_builder, rate_limits
+from services.sheet_cache import DRIVE_METADATA_SCOPE, SheetRangeCache, sheet_cache
+from services.sheet_frame import to_sheet_values, to_transaction_frame
+from services.sheets_batch import SheetsBatcher
 
 
 class GoogleSheetService:
@@ -17,15 +22,65 @@ class GoogleSheetService:
 
     SCOPES = [
         "https://www.googleapis.com/auth/spreadsheets",
+        # Revision checks of the read cache
+        DRIVE_METADATA_SCOPE,
     ]
 
-    def __init__(self):
-        self.service = self._init_service()
+    def __init__(
+        self,
+        service: Resource | None = None,
+        drive: Resource | None = None,
+        cache: SheetRangeCache | None = sheet_cache,
+        limiter: TokenBucket | None = rate_limits["sheets"],
+    ):
+        self.limiter = limiter
+        self.service = service or self._init_service()
+        self.cache = cache
+        self._drive = drive
+        # An injected service comes with its own credentials: without an
+        # injected `drive` too, reads skip the cache instead of running the
+        # OAuth flow for Drive
+        self._build_drive = service is None
+
+    @property
+    def drive(self) -> Resource | None:
+        """Drive `files()` of the cache's revision checks, built on first use"""
+        if self._drive is None and self.cache is not None and self._build_drive:
+            self._drive = self._init_drive()
+        return self._drive
+
+    def _build(self, name: str, version: str) -> Resource:
+        creds = auth_google_installed_app_flow(self.SCOPES)
+        if self.limiter is None:
+            return build(name, version, credentials=creds)
+        # Sheets and Drive calls share the per-user Google quota
+        return build(
+            name,
+            version,
+            credentials=creds,
+            requestBuilder=google_request_builder(self.limiter),
+        )
 
     def _init_service(self) -> Resource:
-        creds = auth_google_installed_app_flow(self.SCOPES)
-        builder = build("sheets", "v4", credentials=creds)
-        return builder.spreadsheets()
+        return self._build("sheets", "v4").spreadsheets()
+
+    def _init_drive(self) -> Resource:
+        return self._build("drive", "v3").files()
+
+    def batcher(self) -> SheetsBatcher:
+        """Batch reads, writes and clears into `values.batch*` requests
+
+        Examples:
+            >>> with service.batcher() as batch:
+            ...     first = batch.read_sheet_values(sheet_id, "Sheet1!A1:E10")
+            ...     second = batch.read_sheet_values(sheet_id, "Sheet1!A11:E20")
+            >>> first.result()  # both ranges came from one batchGet of A1:E20
+        """
+        return SheetsBatcher(
+            self.service,
+            max_batch_size=settings.SHEETS_BATCH_SIZE,
+            flush_interval=settings.SHEETS_FLUSH_INTERVAL,
+        )
 
     @staticmethod
     def get_sheet_id_from_url(url: str) -> str | None:
@@ -46,6 +101,17 @@ class GoogleSheetService:
             return matches[0]
         return None
 
+    def _get_values(self: Self, sheet_id: str, range_name: str) -> list[list]:
+        if self.cache is not None and self.drive is not None:
+            return self.cache.read(self.service, self.drive, sheet_id, range_name)
+        # Ref: https://googleapis.github.io/google-api-python-client/docs/dyn/sheets_v4.spreadsheets.values.html#get
+        result: dict = (
+            self.service.values()
+            .get(spreadsheetId=sheet_id, range=range_name)
+            .execute()
+        )
+        return result.get("values", [])
+
     def read_sheet_values(
         self: Self,
         sheet_id: str,
@@ -60,19 +126,28 @@ class GoogleSheetService:
         Returns:
             A pd.DataFrame contains the data
         """
-        # Ref: https://googleapis.github.io/google-api-python-client/docs/dyn/sheets_v4.spreadsheets.values.html#get
-        result: dict = (
-            self.service.values()
-            .get(spreadsheetId=sheet_id, range=range_name)
-            .execute()
-        )
-        values = result.get("values", [])
-
+        values = self._get_values(sheet_id, range_name)
         if not values:
             return pd.DataFrame()
 
         return pd.DataFrame.from_records(values)
 
+    def read_transactions(
+        self: Self,
+        sheet_id: str,
+        range_name: str,
+    ) -> pd.DataFrame:
+        """Get a range of transactions, typed after `db.schema.Transaction`
+
+        Args:
+            sheet_id: ID of the sheet
+            range_name: Range whose first row is the header. Example: Sheet1!A1:H.
+
+        Returns:
+            A pd.DataFrame of the columns named by the header, see `to_transaction_frame`
+        """
+        return to_transaction_frame(self._get_values(sheet_id, range_name))
+
     def write_sheet_values(
         self: Self,
         sheet_id: str,
@@ -91,7 +166,7 @@ class GoogleSheetService:
         data = {
             "majorDimension": "ROWS",
             "range": range_name,
-            "values": values.values.tolist(),
+            "values": to_sheet_values(values),
         }
 
         self.service.values().update(
@@ -100,6 +175,8 @@ class GoogleSheetService:
             body=data,
             valueInputOption="RAW",  # "RAW" or "USER_ENTERED"
         ).execute()
+        if self.cache is not None:
+            self.cache.invalidate(sheet_id)
 
     def delete_sheet_values(
         self: Self,
@@ -117,3 +194,5 @@ class GoogleSheetService:
             spreadsheetId=sheet_id,
             range=range_name,
         ).execute()
+        if self.cache is not None:
+            self.cache.invalidate(sheet_id)
@@ -0,0 +1,241 @@
+import asyncio
+import random
+from dataclasses import dataclass
+from typing import Self
+from urllib.parse import quote
+
+import httpx
+import pandas as pd
+from google.auth.credentials import Credentials
+from google.auth.transport.requests import Request
+
+from auth.google import auth_google_installed_app_flow
+from config.logger import logger
+from services.rate_limit import TokenBucket, rate_limits
+from services.sheet_cache import SheetRangeCache, sheet_cache
+from services.sheet_frame import to_sheet_values, to_transaction_frame
+
+SHEETS_API_URL = "https://sheets.googleapis.com"
+# Throttled or transient failures, worth sending again
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+@dataclass
+class AsyncSheetsStats:
+    requests: int = 0  # HTTP requests sent, retries included
+    retries: int = 0
+    throttled: int = 0  # 429 responses
+    waiting: int = 0  # calls queued behind the concurrency limit
+
+
+class AsyncGoogleSheetService:
+    """asyncio counterpart of `GoogleSheetService`
+
+    Same read, write and clear surface, awaited instead of blocking the event
+    loop. Requests share one keep-alive `httpx.AsyncClient`, at most
+    `max_concurrency` are in flight, and 429/5xx responses or connection
+    errors are retried with full-jitter exponential backoff (a `Retry-After`
+    header is honored when longer).
+
+    >>> async with AsyncGoogleSheetService() as sheets:
+    ...     frame = await sheets.read_sheet_values(sheet_id, "Sheet1!A1:E10")
+
+    It is meant for new asyncio code. The bot's existing sheet I/O keeps the
+    synchronous client off the event loop instead: agno runs the chat agent's
+    `CachedGoogleSheetsTools` in a worker thread, and `SheetSink` runs its
+    `SheetSync` with `asyncio.to_thread`.
+
+    Args:
+        credentials: Google credentials, the installed app flow when omitted,
+            run in a worker thread on the first request
+        base_url: Sheets API endpoint
+        max_concurrency: requests in flight at once
+        max_retries: attempts after the first one
+        backoff: base delay in seconds, doubled per attempt
+        max_backoff: cap of a single delay in seconds
+        timeout: seconds per request
+        cache: sheet range cache to invalidate after writes
+        limiter: rate limit every attempt is spent from, told about 429s
+    """
+
+    SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
+
+    def __init__(
+        self,
+        credentials: Credentials | None = None,
+        base_url: str = SHEETS_API_URL,
+        max_concurrency: int = 8,
+        max_retries: int = 5,
+        backoff: float = 0.5,
+        max_backoff: float = 32.0,
+        timeout: float = 30.0,
+        cache: SheetRangeCache | None = sheet_cache,
+        limiter: TokenBucket | None = rate_limits["sheets"],
+    ):
+        self.credentials = credentials
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.cache = cache
+        self.limiter = limiter
+        self.stats = AsyncSheetsStats()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._refresh_lock = asyncio.Lock()
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=max_concurrency,
+                max_keepalive_connections=max_concurrency,
+            ),
+        )
+
+    async def __aenter__(self) -> Self:
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    async def _headers(self) -> dict[str, str]:
+        if self.credentials is None or not self.credentials.valid:
+            async with self._refresh_lock:
+                if self.credentials is None:
+                    # The installed app flow reads files and may open a browser
+                    self.credentials = await asyncio.to_thread(
+                        auth_google_installed_app_flow, self.SCOPES
+                    )
+                if not self.credentials.valid:
+                    # google-auth refreshes synchronously
+                    await asyncio.to_thread(self.credentials.refresh, Request())
+        headers: dict[str, str] = {}
+        self.credentials.apply(headers)
+        return headers
+
+    @staticmethod
+    def _retry_after(response: httpx.Response | None) -> float | None:
+        retry_after = response.headers.get("Retry-After", "") if response else ""
+        return float(retry_after) if retry_after.isdigit() else None
+
+    def _delay(self, attempt: int, response: httpx.Response | None) -> float:
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+        return max(delay, self._retry_after(response) or 0.0)
+
+    async def _send(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """One attempt, holding one of the `max_concurrency` slots"""
+        if self._semaphore.locked():
+            self.stats.waiting += 1
+        async with self._semaphore:
+            if self.limiter is not None:
+                await self.limiter.acquire_async()
+            self.stats.requests += 1
+            return await self._client.request(
+                method, url, headers=await self._headers(), **kwargs
+            )
+
+    async def _request(self, method: str, url: str, **kwargs) -> dict:
+        for attempt in range(self.max_retries + 1):
+            response = None
+            try:
+                response = await self._send(method, url, **kwargs)
+                if response.status_code not in RETRY_STATUSES:
+                    response.raise_for_status()
+                    if self.limiter is not None:
+                        self.limiter.succeed()
+                    return response.json()
+                if response.status_code == 429:
+                    self.stats.throttled += 1
+                    if self.limiter is not None:
+                        self.limiter.throttle(self._retry_after(response))
+                error: Exception = httpx.HTTPStatusError(
+                    f"{response.status_code} from {url}",
+                    request=response.request,
+                    response=response,
+                )
+            except httpx.TransportError as e:
+                error = e
+            if attempt == self.max_retries:
+                raise error
+            delay = self._delay(attempt, response)
+            logger.warning(
+                "Sheets %s %s failed (%s), retrying in %.2fs",
+                method,
+                url,
+                error,
+                delay,
+            )
+            self.stats.retries += 1
+            # The slot is free while backing off, other requests go ahead
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _values_url(sheet_id: str, range_name: str, suffix: str = "") -> str:
+        return f"/v4/spreadsheets/{quote(sheet_id)}/values/{quote(range_name, safe='')}{suffix}"
+
+    async def _get_values(self, sheet_id: str, range_name: str) -> list[list]:
+        result = await self._request("GET", self._values_url(sheet_id, range_name))
+        return result.get("values", [])
+
+    async def read_sheet_values(self, sheet_id: str, range_name: str) -> pd.DataFrame:
+        """Get Google Sheet Range values
+
+        Args:
+            sheet_id: ID of the sheet
+            range_name: Logical range within a sheet. Example: A1, A1:A4, Sheet1!A1:E4, 'Sheet 2'!A1:E4.
+
+        Returns:
+            A pd.DataFrame contains the data
+        """
+        values = await self._get_values(sheet_id, range_name)
+        if not values:
+            return pd.DataFrame()
+        return pd.DataFrame.from_records(values)
+
+    async def read_transactions(self, sheet_id: str, range_name: str) -> pd.DataFrame:
+        """Get a range of transactions, typed after `db.schema.Transaction`
+
+        Args:
+            sheet_id: ID of the sheet
+            range_name: Range whose first row is the header. Example: Sheet1!A1:H.
+        """
+        return to_transaction_frame(await self._get_values(sheet_id, range_name))
+
+    async def write_sheet_values(
+        self, sheet_id: str, range_name: str, values: pd.DataFrame
+    ) -> dict:
+        """Write Google Sheet Range values
+
+        Args:
+            sheet_id: ID of the sheet
+            range_name: Logical range within a sheet. Example: A1, A1:A4, Sheet1!A1:E4, 'Sheet 2'!A1:E4.
+            values: DataFrame contains data to be written.
+        """
+        result = await self._request(
+            "PUT",
+            self._values_url(sheet_id, range_name),
+            params={"valueInputOption": "RAW"},
+            json={
+                "majorDimension": "ROWS",
+                "range": range_name,
+                "values": to_sheet_values(values),
+            },
+        )
+        if self.cache is not None:
+            self.cache.invalidate(sheet_id)
+        return result
+
+    async def delete_sheet_values(self, sheet_id: str, range_name: str) -> dict:
+        """Clear Google Sheet Range values
+
+        Args:
+            sheet_id: ID of the sheet
+            range_name: Logical range within a sheet. Example: A1, A1:A4, Sheet1!A1:E4, 'Sheet 2'!A1:E4.
+        """
+        result = await self._request(
+            "POST", self._values_url(sheet_id, range_name, ":clear"), json={}
+        )
+        if self.cache is not None:
+            self.cache.invalidate(sheet_id)
+        return result
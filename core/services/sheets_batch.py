@@ -0,0 +1,316 @@
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from functools import cached_property
+from typing import Self
+
+import pandas as pd
+from googleapiclient.discovery import Resource
+
+from config.logger import logger
+from services.a1 import A1Range
+from services.sheet_frame import to_sheet_values
+
+
+@dataclass
+class BatchStats:
+    operations: int = 0  # reads, writes and clears submitted
+    requests: int = 0  # HTTP requests sent
+    ranges: int = 0  # ranges sent, after merging
+    flushes: int = 0
+
+    @property
+    def merged(self) -> int:
+        """Operations folded into another operation's range"""
+        return self.operations - self.ranges
+
+
+@dataclass
+class _Operation:
+    kind: str  # read, write or clear
+    sheet_id: str
+    range_name: str
+    values: list[list] | None = None
+    future: Future = field(default_factory=Future)
+    created_at: float = field(default_factory=time.monotonic)
+
+    @cached_property
+    def a1(self) -> A1Range | None:
+        return A1Range.parse(self.range_name)
+
+
+@dataclass
+class _Group:
+    """Operations sent as one range of a batch request"""
+
+    range: A1Range | None
+    range_name: str
+    operations: list[_Operation]
+
+
+def _trim(rows: list[list]) -> list[list]:
+    # The API leaves out trailing empty rows
+    while rows and not rows[-1]:
+        rows = rows[:-1]
+    return rows
+
+
+def _merge_overlapping(operations: list[_Operation]) -> list[_Group]:
+    """Merge overlapping or adjacent ranges with the same columns
+
+    Only for reads and clears, whose order within a batch does not matter.
+    """
+    groups: list[_Group] = []
+    bounded = [op for op in operations if op.a1 is not None]
+    bounded.sort(
+        key=lambda op: (
+            op.a1.sheet or "",
+            op.a1.start_col,
+            op.a1.end_col,
+            op.a1.start_row,
+        )
+    )
+    for op in bounded:
+        last = groups[-1] if groups else None
+        if last is not None and last.range.touches(op.a1):
+            last.range = last.range.union(op.a1)
+            last.range_name = str(last.range)
+            last.operations.append(op)
+        else:
+            groups.append(_Group(op.a1, op.range_name, [op]))
+    groups += [_Group(None, op.range_name, [op]) for op in operations if op.a1 is None]
+    return groups
+
+
+def _fits(op: _Operation) -> bool:
+    return len(op.values) <= op.a1.rows and all(
+        len(row) <= op.a1.columns for row in op.values
+    )
+
+
+def _merge_appends(operations: list[_Operation]) -> list[_Group]:
+    """Merge writes that continue right below the previous one
+
+    Writes keep their submission order, so a later write to the same cells
+    still wins.
+    """
+    groups: list[_Group] = []
+    for op in operations:
+        last = groups[-1] if groups else None
+        a1 = op.a1
+        if (
+            last is not None
+            and last.range is not None
+            and a1 is not None
+            and last.range.same_columns(a1)
+            and a1.start_row == last.range.end_row + 1
+            and _fits(op)
+            and all(_fits(member) for member in last.operations)
+        ):
+            last.range = last.range.union(a1)
+            last.range_name = str(last.range)
+            last.operations.append(op)
+        else:
+            groups.append(_Group(a1, op.range_name, [op]))
+    return groups
+
+
+class SheetsBatcher:
+    """Collect Sheets value operations and send them as batch requests
+
+    Reads, writes and clears return a `Future` right away. Pending operations
+    are flushed by a background thread once `max_batch_size` are waiting or
+    the oldest has waited `flush_interval` seconds, or by `flush()`. Each
+    spreadsheet's operations are sent in submission order as runs of
+    `values.batchGet`, `values.batchUpdate` and `values.batchClear`, and
+    adjacent A1 ranges with the same columns are merged into one range.
+
+    The Sheets resource is only used from one thread at a time.
+
+    Args:
+        service: `spreadsheets()` resource, e.g. `GoogleSheetService().service`
+        max_batch_size: pending operations that trigger a flush
+        flush_interval: seconds an operation may wait before a flush
+        value_input_option: RAW or USER_ENTERED
+    """
+
+    def __init__(
+        self,
+        service: Resource,
+        max_batch_size: int = 100,
+        flush_interval: float = 0.5,
+        value_input_option: str = "RAW",
+    ):
+        self.service = service
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.value_input_option = value_input_option
+        self.stats = BatchStats()
+        self._pending: list[_Operation] = []
+        self._condition = threading.Condition()
+        self._send_lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(
+            target=self._run, name="sheets-batcher", daemon=True
+        )
+        self._thread.start()
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def read_sheet_values(self, sheet_id: str, range_name: str) -> Future:
+        """Queue a read, the future resolves to a pd.DataFrame"""
+        return self._submit(_Operation("read", sheet_id, range_name))
+
+    def write_sheet_values(
+        self, sheet_id: str, range_name: str, values: pd.DataFrame
+    ) -> Future:
+        """Queue a write of `values` starting at the top left of the range"""
+        return self._submit(
+            _Operation("write", sheet_id, range_name, to_sheet_values(values))
+        )
+
+    def delete_sheet_values(self, sheet_id: str, range_name: str) -> Future:
+        """Queue a clear of the range"""
+        return self._submit(_Operation("clear", sheet_id, range_name))
+
+    def flush(self):
+        """Send everything pending and wait for the responses"""
+        with self._condition:
+            batch, self._pending = self._pending, []
+        self._send(batch)
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+        self.flush()
+
+    def _submit(self, op: _Operation) -> Future:
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("SheetsBatcher is closed")
+            self._pending.append(op)
+            self.stats.operations += 1
+            if len(self._pending) == 1 or len(self._pending) >= self.max_batch_size:
+                self._condition.notify()
+        return op.future
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._closed:
+                    if len(self._pending) >= self.max_batch_size:
+                        break
+                    if self._pending:
+                        waited = time.monotonic() - self._pending[0].created_at
+                        if waited >= self.flush_interval:
+                            break
+                        self._condition.wait(self.flush_interval - waited)
+                    else:
+                        self._condition.wait()
+                if self._closed:
+                    return
+                batch, self._pending = self._pending, []
+            self._send(batch)
+
+    def _send(self, batch: list[_Operation]):
+        if not batch:
+            return
+        with self._send_lock:
+            self.stats.flushes += 1
+            by_sheet: dict[str, list[_Operation]] = {}
+            for op in batch:
+                by_sheet.setdefault(op.sheet_id, []).append(op)
+
+            for sheet_id, operations in by_sheet.items():
+                # Runs of the same kind, e.g. reads after writes see the writes
+                runs: list[list[_Operation]] = []
+                for op in operations:
+                    if runs and runs[-1][0].kind == op.kind:
+                        runs[-1].append(op)
+                    else:
+                        runs.append([op])
+                for run in runs:
+                    try:
+                        if run[0].kind == "read":
+                            self._send_reads(sheet_id, run)
+                        elif run[0].kind == "write":
+                            self._send_writes(sheet_id, run)
+                        else:
+                            self._send_clears(sheet_id, run)
+                    except Exception as e:
+                        logger.warning(
+                            "Sheets batch of %d %ss failed: %s",
+                            len(run),
+                            run[0].kind,
+                            e,
+                        )
+                        for op in run:
+                            if not op.future.done():
+                                op.future.set_exception(e)
+
+    def _send_reads(self, sheet_id: str, operations: list[_Operation]):
+        groups = _merge_overlapping(operations)
+        # Ref: https://googleapis.github.io/google-api-python-client/docs/dyn/sheets_v4.spreadsheets.values.html#batchGet
+        result: dict = (
+            self.service.values()
+            .batchGet(
+                spreadsheetId=sheet_id,
+                ranges=[group.range_name for group in groups],
+                majorDimension="ROWS",
+            )
+            .execute()
+        )
+        self._count(groups)
+        for group, value_range in zip(groups, result.get("valueRanges", [])):
+            values = value_range.get("values", [])
+            for op in group.operations:
+                rows = values
+                if group.range is not None:
+                    offset = op.a1.start_row - group.range.start_row
+                    rows = _trim(values[offset : offset + op.a1.rows])
+                op.future.set_result(
+                    pd.DataFrame.from_records(rows) if rows else pd.DataFrame()
+                )
+
+    def _send_writes(self, sheet_id: str, operations: list[_Operation]):
+        groups = _merge_appends(operations)
+        data = []
+        for group in groups:
+            values = []
+            for op in group.operations[:-1]:
+                # Empty rows leave the cells below a short write untouched
+                values += op.values + [[]] * (op.a1.rows - len(op.values))
+            values += group.operations[-1].values
+            data.append(
+                {"range": group.range_name, "majorDimension": "ROWS", "values": values}
+            )
+        # Ref: https://googleapis.github.io/google-api-python-client/docs/dyn/sheets_v4.spreadsheets.values.html#batchUpdate
+        self.service.values().batchUpdate(
+            spreadsheetId=sheet_id,
+            body={"valueInputOption": self.value_input_option, "data": data},
+        ).execute()
+        self._count(groups)
+        for op in operations:
+            op.future.set_result(None)
+
+    def _send_clears(self, sheet_id: str, operations: list[_Operation]):
+        groups = _merge_overlapping(operations)
+        # Ref: https://googleapis.github.io/google-api-python-client/docs/dyn/sheets_v4.spreadsheets.values.html#batchClear
+        self.service.values().batchClear(
+            spreadsheetId=sheet_id,
+            body={"ranges": [group.range_name for group in groups]},
+        ).execute()
+        self._count(groups)
+        for op in operations:
+            op.future.set_result(None)
+
+    def _count(self, groups: list[_Group]):
+        self.stats.requests += 1
+        self.stats.ranges += len(groups)
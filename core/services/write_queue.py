@@ -0,0 +1,522 @@
+import asyncio
+import datetime
+import sqlite3
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Awaitable, Callable
+
+import duckdb
+import pandas as pd
+
+from agents.expense_parser import local_time
+from agents.schema import Expense
+from config.logger import logger
+from config.settings import settings
+from db.catalog import catalog_cache
+from db.connection import get_manager
+from db.ingest import ingest_transactions
+from db.shards import ShardDirectory, shard_directory
+from services.sheet_sync import SheetSync
+from services.sheets import GoogleSheetService
+
+PENDING, WRITTEN, FAILED = "pending", "written", "failed"
+
+
+@dataclass
+class QueuedExpense:
+    seq: int
+    key: str  # idempotency key, unique in the queue and in the ledger
+    username: str
+    expense: Expense
+    attempts: int
+    enqueued_at: float  # unix time
+
+
+@dataclass
+class WriteQueueStats:
+    enqueued: int = 0
+    duplicates: int = 0  # appends of keys already in the queue
+    written: int = 0
+    batches: int = 0
+    retries: int = 0
+    failed: int = 0  # given up on, kept in the queue as `failed`
+
+
+class WriteQueue:
+    """Durable local log of confirmed expenses waiting to be written
+
+    Entries are appended to a SQLite file and committed with a full sync
+    before `append` returns, so a chat can be answered right away and the
+    expense survives a crash. Each entry has an idempotency key: appending
+    the same key again (e.g. a redelivered Telegram update) is a no-op, and
+    the ledger records the keys it ingested (`applied_write`), so an entry
+    written again after a crash is not duplicated.
+
+    Entries move from `pending` to `written`, or to `failed` after too many
+    attempts; `compact` removes old written ones.
+
+    Args:
+        path: SQLite file of the queue
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.stats = WriteQueueStats()
+
+    def _connect(self) -> sqlite3.Connection:
+        # A connection per call, so any thread can use the queue
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = FULL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entry (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                key TEXT NOT NULL UNIQUE,
+                username TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                enqueued_at REAL NOT NULL,
+                next_attempt_at REAL NOT NULL,
+                written_at REAL,
+                error TEXT
+            )
+            """
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS entry_due_idx ON entry (status, next_attempt_at)"
+        )
+        return conn
+
+    def append(self, username: str, expenses: list[Expense], key: str) -> int:
+        """Queue the expenses of one message
+
+        Args:
+            username: owner of the expenses
+            expenses: expenses to write
+            key: idempotency key of the message, e.g. its chat and message id;
+                the expenses get `key:0`, `key:1`...
+
+        Returns:
+            Number of entries added, 0 if the key was queued before
+        """
+        now = time.time()
+        rows = [
+            (f"{key}:{i}", username, expense.model_dump_json(), PENDING, now, now)
+            for i, expense in enumerate(expenses)
+        ]
+        with self._connect() as conn:
+            before = conn.total_changes
+            conn.executemany(
+                """
+                INSERT OR IGNORE INTO entry (key, username, payload, status, enqueued_at, next_attempt_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                rows,
+            )
+            added = conn.total_changes - before
+        self.stats.enqueued += added
+        self.stats.duplicates += len(rows) - added
+        return added
+
+    def due(self, limit: int, now: float | None = None) -> list[QueuedExpense]:
+        """Pending entries ready to be written, oldest first"""
+        now = time.time() if now is None else now
+        with self._connect() as conn:
+            rows = conn.execute(
+                """
+                SELECT seq, key, username, payload, attempts, enqueued_at
+                FROM entry WHERE status = ? AND next_attempt_at <= ?
+                ORDER BY seq LIMIT ?
+                """,
+                (PENDING, now, limit),
+            ).fetchall()
+        return [
+            QueuedExpense(
+                seq=seq,
+                key=key,
+                username=username,
+                expense=Expense.model_validate_json(payload),
+                attempts=attempts,
+                enqueued_at=enqueued_at,
+            )
+            for seq, key, username, payload, attempts, enqueued_at in rows
+        ]
+
+    def mark_written(self, entries: list[QueuedExpense]):
+        with self._connect() as conn:
+            conn.executemany(
+                "UPDATE entry SET status = ?, written_at = ?, error = NULL WHERE seq = ?",
+                [(WRITTEN, time.time(), entry.seq) for entry in entries],
+            )
+        self.stats.written += len(entries)
+
+    def mark_retry(self, entry: QueuedExpense, error: str, delay: float):
+        with self._connect() as conn:
+            conn.execute(
+                """
+                UPDATE entry SET attempts = attempts + 1, next_attempt_at = ?, error = ?
+                WHERE seq = ?
+                """,
+                (time.time() + delay, error, entry.seq),
+            )
+        self.stats.retries += 1
+
+    def mark_failed(self, entry: QueuedExpense, error: str):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE entry SET status = ?, attempts = attempts + 1, error = ? WHERE seq = ?",
+                (FAILED, error, entry.seq),
+            )
+        self.stats.failed += 1
+
+    def lag(self, now: float | None = None) -> dict:
+        """How far behind the writes are
+
+        Returns:
+            pending entries, the age in seconds of the oldest one, failed
+            entries, and the enqueue-to-write latency of the last hour
+        """
+        now = time.time() if now is None else now
+        with self._connect() as conn:
+            pending, oldest = conn.execute(
+                "SELECT COUNT(1), MIN(enqueued_at) FROM entry WHERE status = ?",
+                (PENDING,),
+            ).fetchone()
+            (failed,) = conn.execute(
+                "SELECT COUNT(1) FROM entry WHERE status = ?", (FAILED,)
+            ).fetchone()
+            latency, worst = conn.execute(
+                """
+                SELECT AVG(written_at - enqueued_at), MAX(written_at - enqueued_at)
+                FROM entry WHERE status = ? AND written_at >= ?
+                """,
+                (WRITTEN, now - 3600),
+            ).fetchone()
+        return {
+            "pending": pending,
+            "oldest_pending_seconds": now - oldest if oldest else 0.0,
+            "failed": failed,
+            "write_latency_seconds": latency or 0.0,
+            "max_write_latency_seconds": worst or 0.0,
+        }
+
+    def compact(self, retention: float) -> int:
+        """Delete entries written more than `retention` seconds ago"""
+        with self._connect() as conn:
+            deleted = conn.execute(
+                "DELETE FROM entry WHERE status = ? AND written_at < ?",
+                (WRITTEN, time.time() - retention),
+            ).rowcount
+        return deleted
+
+
+# Funds and categories are only added, their counts tell a catalog change
+CATALOG_SIZE_QUERY = (
+    "SELECT (SELECT COUNT(1) FROM fund), (SELECT COUNT(1) FROM category)"
+)
+
+# A sink writes a batch of entries somewhere; it must be idempotent by key,
+# a batch is written again when any sink fails
+Sink = Callable[[list[QueuedExpense]], Awaitable[None]]
+
+
+class LedgerSink:
+    """Write queued expenses to each user's ledger shard
+
+    Expenses go to the fund `fund_name`, their category becomes a category
+    of that fund (created if needed, "other" when missing). The batch of a
+    shard is one `ingest_transactions` call keyed by the entry keys.
+
+    Raises:
+        ValueError: for an expense without an amount, it is never retried
+    """
+
+    def __init__(
+        self,
+        directory: ShardDirectory = shard_directory,
+        fund_name: str = "Chi tiêu",
+        default_category: str = "other",
+    ):
+        self.directory = directory
+        self.fund_name = fund_name
+        self.default_category = default_category
+
+    def _frame(self, entries: list[QueuedExpense]) -> pd.DataFrame:
+        rows = []
+        for entry in entries:
+            expense = entry.expense
+            if expense.amount is None:
+                raise ValueError("the expense has no amount")
+            # Ledger timestamps are naive local time
+            date = local_time(
+                expense.date
+                or datetime.datetime.fromtimestamp(entry.enqueued_at, datetime.UTC)
+            )
+            rows.append(
+                {
+                    "datetime": date,
+                    "amount": expense.amount,
+                    "currency": expense.currency or "VND",
+                    "fund_name": self.fund_name,
+                    "category_name": expense.category or self.default_category,
+                    "note": expense.name,
+                    "by": entry.username,
+                    "idempotency_key": entry.key,
+                }
+            )
+        return pd.DataFrame(rows)
+
+    def _write(
+        self,
+        conn: duckdb.DuckDBPyConnection,
+        frame: pd.DataFrame,
+        db_path: Path | None = None,
+    ) -> int:
+        now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        users = frame["by"].unique().tolist()
+        categories = frame["category_name"].unique().tolist()
+        conn.begin()
+        try:
+            before = conn.execute(CATALOG_SIZE_QUERY).fetchone()
+            conn.executemany(
+                "INSERT INTO user (username, name) SELECT ?, ? "
+                "WHERE NOT EXISTS (SELECT 1 FROM user WHERE username = ?)",
+                [(user, user, user) for user in users],
+            )
+            conn.execute(
+                "INSERT INTO fund (fund_name, created_at, updated_at, by) SELECT ?, ?, ?, ? "
+                "WHERE NOT EXISTS (SELECT 1 FROM fund WHERE fund_name = ?)",
+                (self.fund_name, now, now, users[0], self.fund_name),
+            )
+            conn.executemany(
+                """
+                INSERT INTO category (category_name, fund_id, created_at, updated_at, by)
+                SELECT ?, id, ?, ?, ? FROM fund f WHERE fund_name = ? AND NOT EXISTS (
+                    SELECT 1 FROM category c WHERE c.category_name = ? AND c.fund_id = f.id
+                )
+                """,
+                [
+                    (category, now, now, users[0], self.fund_name, category)
+                    for category in categories
+                ],
+            )
+            created = conn.execute(CATALOG_SIZE_QUERY).fetchone() != before
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        if created and db_path is not None:
+            catalog_cache.invalidate(db_path)
+        return ingest_transactions(conn, frame).rows
+
+    async def __call__(self, entries: list[QueuedExpense]):
+        by_shard: dict[Path, list[QueuedExpense]] = defaultdict(list)
+        for entry in entries:
+            by_shard[self.directory.path_for(entry.username)].append(entry)
+        # Shards are independent files, written in parallel
+        await asyncio.gather(
+            *(
+                get_manager(path).run_write(
+                    lambda conn, frame=self._frame(shard_entries), path=path: (
+                        self._write(conn, frame, path)
+                    )
+                )
+                for path, shard_entries in by_shard.items()
+            )
+        )
+
+
+class SheetSink:
+    """Mirror the ledgers of the users in a batch to their sheet tabs
+
+    Runs `SheetSync` for each user, after `LedgerSink` in the same worker.
+    The sync only pushes what changed since its watermark, so running it
+    again for the same entries writes nothing.
+
+    Args:
+        service: Google Sheets service
+        sheet_id: spreadsheet with a tab per user
+        directory: where the users' ledgers are
+        tab_for: tab name of a user
+    """
+
+    def __init__(
+        self,
+        service: GoogleSheetService,
+        sheet_id: str,
+        directory: ShardDirectory = shard_directory,
+        tab_for: Callable[[str], str] = lambda username: username,
+    ):
+        self.service = service
+        self.sheet_id = sheet_id
+        self.directory = directory
+        self.tab_for = tab_for
+
+    async def __call__(self, entries: list[QueuedExpense]):
+        for username in sorted({entry.username for entry in entries}):
+            sync = SheetSync(
+                self.directory.path_for(username),
+                self.service,
+                self.sheet_id,
+                username,
+                self.tab_for(username),
+            )
+            await asyncio.to_thread(sync.sync)
+
+
+class WriteQueueWorker:
+    """Drain a `WriteQueue` into its sinks in the background
+
+    Up to `batch_size` due entries are handed to every sink in order. When a
+    batch fails it is retried entry by entry, so one bad expense does not
+    hold back the others: a `ValueError` fails the entry for good, other
+    errors are retried with exponential backoff until `max_attempts`.
+
+    `notify` wakes the worker after an append, otherwise it polls every
+    `interval` seconds.
+
+    Args:
+        queue: queue to drain
+        sinks: async callables writing a batch, idempotent by entry key
+        batch_size: entries written at once
+        interval: seconds between polls when idle
+        max_attempts: attempts before an entry is failed
+        backoff: seconds before the first retry, doubled on each attempt
+        max_backoff: longest wait between retries
+        retention: seconds written entries are kept, compacted hourly
+    """
+
+    def __init__(
+        self,
+        queue: WriteQueue,
+        sinks: list[Sink],
+        batch_size: int = 100,
+        interval: float = 1.0,
+        max_attempts: int = 8,
+        backoff: float = 1.0,
+        max_backoff: float = 300.0,
+        retention: float = 7 * 86400.0,
+    ):
+        self.queue = queue
+        self.sinks = sinks
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retention = retention
+        self._compacted_at = 0.0
+        self._wake = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    async def _write(self, entries: list[QueuedExpense]):
+        for sink in self.sinks:
+            await sink(entries)
+
+    async def _write_each(self, entries: list[QueuedExpense]):
+        for entry in entries:
+            try:
+                await self._write([entry])
+            except ValueError as e:
+                logger.warning("Dropping queued write %s: %s", entry.key, e)
+                await asyncio.to_thread(self.queue.mark_failed, entry, str(e))
+            except Exception as e:
+                if entry.attempts + 1 >= self.max_attempts:
+                    logger.error("Giving up on queued write %s: %s", entry.key, e)
+                    await asyncio.to_thread(self.queue.mark_failed, entry, repr(e))
+                    continue
+                delay = min(self.backoff * 2**entry.attempts, self.max_backoff)
+                logger.warning(
+                    "Queued write %s failed, retrying in %.1fs: %s", entry.key, delay, e
+                )
+                await asyncio.to_thread(self.queue.mark_retry, entry, repr(e), delay)
+            else:
+                await asyncio.to_thread(self.queue.mark_written, [entry])
+
+    async def drain(self) -> int:
+        """Write the entries that are due now
+
+        Returns:
+            Number of entries handled, written or not
+        """
+        handled = 0
+        while entries := await asyncio.to_thread(self.queue.due, self.batch_size):
+            try:
+                await self._write(entries)
+            except Exception as e:
+                logger.warning("Queued batch of %d failed: %s", len(entries), e)
+                await self._write_each(entries)
+            else:
+                await asyncio.to_thread(self.queue.mark_written, entries)
+            self.queue.stats.batches += 1
+            handled += len(entries)
+        return handled
+
+    def notify(self):
+        self._wake.set()
+
+    async def run(self):
+        while True:
+            try:
+                await self.drain()
+                if time.monotonic() - self._compacted_at > 3600:
+                    await asyncio.to_thread(self.queue.compact, self.retention)
+                    self._compacted_at = time.monotonic()
+            except Exception:
+                # e.g. the queue file is unavailable, try again later
+                logger.exception("Write queue worker failed")
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    def start(self) -> asyncio.Task:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self, drain: bool = True):
+        """Stop the worker, writing what is due first"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if drain:
+            await self.drain()
+
+    def snapshot(self) -> dict:
+        stats = self.queue.stats
+        return {
+            **self.queue.lag(),
+            "enqueued": stats.enqueued,
+            "duplicates": stats.duplicates,
+            "written": stats.written,
+            "batches": stats.batches,
+            "retries": stats.retries,
+        }
+
+
+def create_worker() -> WriteQueueWorker:
+    """The worker of the queue under `DATA_DIR`, writing to the ledger shards,
+    and to `LEDGER_SHEET_ID` when set"""
+    queue = WriteQueue(Path(settings.DATA_DIR) / settings.WRITE_QUEUE_FILE)
+    sinks: list[Sink] = [LedgerSink(fund_name=settings.LEDGER_FUND)]
+    if settings.LEDGER_SHEET_ID:
+        sinks.append(SheetSink(GoogleSheetService(), settings.LEDGER_SHEET_ID))
+    return WriteQueueWorker(
+        queue,
+        sinks,
+        batch_size=settings.WRITE_QUEUE_BATCH_SIZE,
+        interval=settings.WRITE_QUEUE_INTERVAL,
+        max_attempts=settings.WRITE_QUEUE_MAX_ATTEMPTS,
+        retention=settings.WRITE_QUEUE_RETENTION,
+    )
@@ -4,7 +4,7 @@ import pandas as pd
 import asyncio
 import duckdb
 import sys
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import date
 from typing import Annotated, Union
 
@@ -20,6 +20,8 @@ from pydantic_ai import Agent, ModelRetry, RunContext
 from pydantic_ai.format_as_xml import format_as_xml
 from dotenv import load_dotenv  
 
+from db.sandbox import QueryRejected, QuerySandbox
+
 load_dotenv()
 
 
@@ -59,6 +61,21 @@ SQL_EXAMPLES = [
 @dataclass
 class Deps:
     df: pd.DataFrame
+    con: duckdb.DuckDBPyConnection = field(default_factory=duckdb.connect)
+
+    def __post_init__(self):
+        # A table rather than a registered frame, the sandbox queries on cursors
+        self.con.from_df(self.df).create('MYDB')
+        # An in-memory database of its own, its limits can be set here
+        self.sandbox = QuerySandbox(self.con, memory_limit='1GB')
+
+    def explain(self, sql_query: str):
+        """Check and plan the query without running it"""
+        self.sandbox.explain(sql_query)
+
+    def run(self, sql_query: str) -> pd.DataFrame:
+        return self.sandbox.execute_df(sql_query)
+
 
 class Success(BaseModel):
     """Response when SQL could be successfully generated."""
@@ -108,13 +125,18 @@ async def validate_result(ctx: RunContext[Deps], result: Response) -> Response:
     result.sql_query = result.sql_query.replace('\\', '')
     if not result.sql_query.upper().startswith('SELECT'):
         raise ModelRetry('Please create a SELECT query')
-    MYDB = ctx.deps.df #noqa
+    # EXPLAIN catches syntax, table and column errors without scanning the data
     try:
-        query_result = duckdb.sql(result.sql_query).df()
-    except Exception as e:
+        ctx.deps.explain(result.sql_query)
+    except (QueryRejected, duckdb.Error) as e:
         raise ModelRetry(f'Invalid query: {e}') from e
-    else:
-        return Success(sql_query=result.sql_query, query_result=query_result)
+    return result
+
+
+async def generate_sql(prompt: str, deps: Deps) -> Response:
+    """SQL for a prompt, checked with EXPLAIN by the validator"""
+    result = await agent.run(prompt, deps=deps)
+    return result.data
 
 
 async def main():
@@ -123,11 +145,13 @@ async def main():
     else:
         prompt = sys.argv[1]
     from data import data_df
-    MYDB = data_df #noqa
     deps = Deps(data_df)
-    result = await agent.run(prompt, deps=deps)
-    debug(result.data.sql_query)
-    print(duckdb.sql(result.data.sql_query).df())
+    response = await generate_sql(prompt, deps)
+    if isinstance(response, InvalidRequest):
+        print(response.error_message)
+        return
+    debug(response.sql_query)
+    print(deps.run(response.sql_query))
 
 if __name__ == '__main__':
     asyncio.run(main())
\ No newline at end of file
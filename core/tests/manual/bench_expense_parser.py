@@ -0,0 +1,98 @@
+import asyncio
+import time
+from argparse import ArgumentParser
+from datetime import datetime
+
+from agents.expense_parser import parse_expense
+
+NOW = datetime(2025, 3, 15, 12, 0)
+
+# message -> expected (category, amount, currency, day) or None for LLM-only
+CORPUS: dict[str, tuple[str, float, str, int] | None] = {
+    "cafe 45k": ("food", 45_000, "VND", 15),
+    "cà phê 30 nghìn": ("food", 30_000, "VND", 15),
+    "I spent 100$ on lunch": ("food", 100, "USD", 15),
+    "lunch 12.99 usd": ("food", 12.99, "USD", 15),
+    "ăn trưa 35k": ("food", 35_000, "VND", 15),
+    "phở 50000": ("food", 50_000, "VND", 15),
+    "trà sữa 45.000đ": ("food", 45_000, "VND", 15),
+    "Hôm qua đi chợ 500 ngàn": ("grocery", 500_000, "VND", 14),
+    "siêu thị 1tr2": ("grocery", 1_200_000, "VND", 15),
+    "groceries $54.30 yesterday": ("grocery", 54.3, "USD", 14),
+    "grab 65k": ("transport", 65_000, "VND", 15),
+    "đổ xăng 80k hôm kia": ("transport", 80_000, "VND", 13),
+    "taxi 150.000 vnd tối qua": ("transport", 150_000, "VND", 14),
+    "I bought a t-shirt at 300$ yesterday": ("clothing", 300, "USD", 14),
+    "giày 1,5 triệu": ("clothing", 1_500_000, "VND", 15),
+    "netflix 260k": ("entertainment", 260_000, "VND", 15),
+    "tiền điện 1.500.000đ": ("bills", 1_500_000, "VND", 15),
+    "rent 8tr": ("bills", 8_000_000, "VND", 15),
+    "thuốc 120k": ("health", 120_000, "VND", 15),
+    # Left to the LLM
+    "Hello, I'm good": None,
+    "I spent 100$": None,
+    "cafe 45": None,
+    "I bought a t-shirt at 300$ last monday": None,
+    "I bought a t-shirt at 300$ on Oct 12": None,
+    "I will buy a t-shirt at 300$ next monday": None,
+    "How much did I spend on food this month?": None,
+    "ăn trưa 35k với cafe 20k": None,
+    "ngày mai đi chợ 200k": None,
+}
+
+
+def is_correct(message: str, expected) -> bool:
+    expense = parse_expense(message, now=NOW)
+    if expected is None or expense is None:
+        return expense is None
+    category, amount, currency, day = expected
+    return (
+        expense.category == category
+        and abs(expense.amount - amount) < 1e-6
+        and expense.currency == currency
+        and expense.date.day == day
+    )
+
+
+async def time_llm(messages: list[str]) -> float:
+    from agents.expense import create_agent
+
+    agent = create_agent()
+    started = time.perf_counter()
+    for message in messages:
+        await agent.arun(message)
+    return (time.perf_counter() - started) / len(messages)
+
+
+def main():
+    parser = ArgumentParser(
+        description="Rule-based expense parser: hit rate and latency"
+    )
+    parser.add_argument("--repeat", type=int, default=1000)
+    parser.add_argument("--llm", action="store_true", help="also time the LLM path")
+    args = parser.parse_args()
+
+    messages = list(CORPUS)
+    wrong = [m for m, expected in CORPUS.items() if not is_correct(m, expected)]
+    parsed = [m for m in messages if parse_expense(m, now=NOW) is not None]
+
+    started = time.perf_counter()
+    for _ in range(args.repeat):
+        for message in messages:
+            parse_expense(message, now=NOW)
+    per_message = (time.perf_counter() - started) / (args.repeat * len(messages))
+
+    print(f"messages:  {len(messages)}")
+    print(f"fast path: {len(parsed)} ({len(parsed) / len(messages):.0%})")
+    print(f"accuracy:  {1 - len(wrong) / len(messages):.0%}")
+    for message in wrong:
+        print(f"  wrong: {message!r} -> {parse_expense(message, now=NOW)}")
+    print(f"parser:    {per_message * 1e6:8.1f} us/message")
+    if args.llm:
+        llm = asyncio.run(time_llm(parsed))
+        print(f"LLM:       {llm * 1e6:8.1f} us/message")
+        print(f"speedup:   {llm / per_message:8.0f}x")
+
+
+if __name__ == "__main__":
+    main()
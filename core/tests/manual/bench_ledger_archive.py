@@ -0,0 +1,164 @@
+import datetime
+import tempfile
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from db.aggregates import rebuild_monthly_spending
+from db.archive import export_ledger, import_ledger, scan_transactions
+from db.connection import get_manager
+from db.ingest import (
+    TRANSACTION_ID_SEQUENCE,
+    ensure_transaction_sequence,
+    ingest_transactions,
+)
+from db.utils import init_blank_db
+from tests.manual.common import init_test_db
+
+USERS = ["nhtlong", "vinhloiit", "tester"]
+CATEGORIES = [
+    ("Chi tiêu", "ăn uống"),
+    ("Chi tiêu", "di chuyển"),
+    ("Tiết kiệm", "mua xe"),
+]
+
+
+def fake_transactions(rows: int) -> pd.DataFrame:
+    """`rows` transactions of the test users over two years"""
+    rng = np.random.default_rng(0)
+    start = np.datetime64("2023-01-01T00:00:00")
+    seconds = rng.integers(0, 2 * 365 * 86400, rows)
+    picked = rng.integers(0, len(CATEGORIES), rows)
+    now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    return pd.DataFrame(
+        {
+            "datetime": start + seconds.astype("timedelta64[s]"),
+            "amount": rng.integers(1, 500, rows) * 1000.0,
+            "currency": "VND",
+            "fund_name": [CATEGORIES[i][0] for i in picked],
+            "category_name": [CATEGORIES[i][1] for i in picked],
+            "note": None,
+            "created_at": now,
+            "updated_at": now,
+            "by": rng.choice(USERS, rows),
+        }
+    )
+
+
+def fill_ledger(cursor, rows: int):
+    """Insert `rows` transactions of the test users over two years in SQL
+
+    Generated with `range()` inside DuckDB rather than ingested from a
+    DataFrame, so a large fixture takes seconds.
+    """
+    users = ", ".join(f"'{user}'" for user in USERS)
+    ids = [
+        cursor.execute(
+            """
+            SELECT fund.id, category.id FROM category JOIN fund ON fund.id = fund_id
+            WHERE fund_name = ? AND category_name = ?
+            """,
+            pair,
+        ).fetchone()
+        for pair in CATEGORIES
+    ]
+    fund_ids = ", ".join(str(fund_id) for fund_id, _ in ids)
+    category_ids = ", ".join(str(category_id) for _, category_id in ids)
+    ensure_transaction_sequence(cursor)
+    cursor.begin()
+    cursor.execute(
+        f"""
+        INSERT INTO transaction (id, datetime, amount, currency, fund_id, category_id, created_at, updated_at, by)
+        SELECT
+            nextval('{TRANSACTION_ID_SEQUENCE}'),
+            TIMESTAMP '2023-01-01' + to_seconds(CAST(hash(i) % (2 * 365 * 86400) AS BIGINT)),
+            (hash(i + 1) % 499 + 1) * 1000,
+            'VND',
+            [{fund_ids}][k + 1],
+            [{category_ids}][k + 1],
+            current_localtimestamp(),
+            current_localtimestamp(),
+            [{users}][CAST(hash(i + 2) % {len(USERS)} AS BIGINT) + 1]
+        FROM (SELECT range AS i, CAST(hash(range + 3) % {len(CATEGORIES)} AS BIGINT) AS k FROM range({rows}))
+        """
+    )
+    rebuild_monthly_spending(cursor)
+    cursor.commit()
+
+
+def totals(cursor) -> list[tuple]:
+    return cursor.execute("SELECT * FROM monthly_spending ORDER BY ALL").fetchall()
+
+
+def main():
+    parser = ArgumentParser(description="Ledger Parquet export/import throughput")
+    parser.add_argument("--rows", type=int, default=200_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source, target = Path(tmp) / "source.duckdb", Path(tmp) / "target.duckdb"
+        archive = Path(tmp) / "archive"
+        init_test_db(source)
+        with get_manager(source).writer() as cursor:
+            started = time.perf_counter()
+            fill_ledger(cursor, args.rows)
+            print(
+                f"fixture: {args.rows:,} rows in {time.perf_counter() - started:.2f}s"
+            )
+
+        with get_manager(source).reader() as cursor:
+            result = export_ledger(cursor, archive)
+            expected = totals(cursor)
+        files = len(list((archive / "transaction").rglob("*.parquet")))
+        print(
+            f"export: {sum(result.rows.values()):,} rows in {result.seconds:.2f}s "
+            f"({result.rows_per_second:,.0f} rows/s), {result.bytes / 1e6:.1f} MB, "
+            f"{files} transaction files"
+        )
+
+        # One user and month: the other partitions are not opened
+        with get_manager(source).reader() as cursor:
+            for label, kwargs in [
+                ("all", {}),
+                (
+                    "one user-month",
+                    {
+                        "usernames": ["tester"],
+                        "start": datetime.datetime(2024, 3, 1),
+                        "end": datetime.datetime(2024, 4, 1),
+                    },
+                ),
+            ]:
+                started = time.perf_counter()
+                relation = scan_transactions(cursor, archive, **kwargs)
+                count, total = relation.aggregate("count(*), sum(amount)").fetchone()
+                elapsed = time.perf_counter() - started
+                print(f"scan {label:>14}: {count:,} rows in {elapsed * 1000:.1f} ms")
+            query = relation.aggregate("count(*)").sql_query()
+            plan = cursor.sql(f"EXPLAIN ANALYZE {query}").fetchone()[1]
+            scanned = next(
+                line for line in plan.splitlines() if "Scanning Files" in line
+            )
+            print(f"                     {scanned.strip(' │')}")
+            assert f"1/{files}" in scanned
+
+        init_blank_db(target)
+        with get_manager(target).writer() as cursor:
+            result = import_ledger(cursor, archive)
+            print(
+                f"import: {sum(result.rows.values()):,} rows in {result.seconds:.2f}s "
+                f"({result.rows_per_second:,.0f} rows/s)"
+            )
+            assert totals(cursor) == expected
+            again = import_ledger(cursor, archive)
+            assert sum(again.rows.values()) == 0 and totals(cursor) == expected
+            # New rows get ids after the imported ones
+            ingest_transactions(cursor, fake_transactions(10))
+        print("import again: 0 rows, monthly totals identical")
+
+
+if __name__ == "__main__":
+    main()
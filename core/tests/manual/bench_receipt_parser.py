@@ -0,0 +1,171 @@
+import asyncio
+import random
+import time
+from argparse import ArgumentParser
+from datetime import datetime
+
+from agents.receipt_parser import parse_receipt
+from config.settings import settings
+from tests.manual.fake_receipts import ITEMS
+
+NOW = datetime(2025, 3, 15, 20, 0)
+
+PHO_HANOI = """# PHO HANOI
+123 Hang Bong, Ha Noi
+Tel: 0243 826 1234
+
+HÓA ĐƠN THANH TOÁN
+Ngày: 15/03/2025 12:30   Bàn: 5
+
+| STT | Tên món | SL | Đơn giá | Thành tiền |
+|---|---|---|---|---|
+| 1 | Phở bò | 2 | 65.000 | 130.000 |
+| 2 | Trà đá | 2 | 5.000 | 10.000 |
+| 3 | Nem rán | 1 | 45.000 | 45.000 |
+
+Cộng tiền hàng: 185.000
+VAT 8%: 14.800
+**Tổng cộng: 199.800đ**
+Tiền khách đưa: 200.000
+Tiền thừa: 200
+"""
+
+WINMART = """WINMART
+Date 2025-03-14 18:05
+Sua tuoi x2 64,000
+Banh mi 25,000
+Discount -9,000
+TOTAL 80,000
+CASH 100,000
+CHANGE 20,000
+"""
+
+COFFEE = """## Blue Bottle Coffee
+03/14/2025 08:12
+Latte $5.50
+Croissant $4.25
+Total $9.75
+"""
+
+GRAB = """# Grab
+Your ride on 13/03/2025
+Trip fare 62,000
+Platform fee 3,000
+Total paid 65,000 VND
+"""
+
+PHARMACY = """# Pharmacy Long Chau
+14-03-2025
+Paracetamol 500mg x1 25,000
+Vitamin C x2 90,000
+Tổng cộng 115,000
+"""
+
+# Left to the LLM
+BLURRED = """Highlands
+Bạc xỉu 39,000
+...ong ..ng 7.000
+"""
+HANDWRITTEN = """Nhận của anh Nam
+tiền sửa xe
+"""
+PARTIAL = """Coffee House
+Americano 45,000
+Cold brew 55,000
+Tổng cộng 120,000
+"""
+
+# text -> expected (total, items, currency, day) or None for LLM-only
+CORPUS: dict[str, tuple[float, int, str, int] | None] = {
+    PHO_HANOI: (199_800, 3, "VND", 15),
+    WINMART: (80_000, 2, "VND", 14),
+    COFFEE: (9.75, 2, "USD", 14),
+    GRAB: (65_000, 2, "VND", 13),
+    PHARMACY: (115_000, 2, "VND", 14),
+    BLURRED: None,
+    HANDWRITTEN: None,
+    PARTIAL: None,
+}
+
+
+def fake_receipt(seed: int) -> tuple[str, float, int]:
+    """OCR markdown of one of the `fake_receipts` photos, its total and items"""
+    rng = random.Random(seed)
+    rows = []
+    total = 0
+    for _ in range(rng.randint(5, 14)):
+        price = rng.randint(10, 200) * 1000
+        total += price
+        rows.append(f"| {rng.choice(ITEMS)} x1 | {price:,} |")
+    lines = ["# PHO HANOI", "", "| Item | Price |", "|---|---|", *rows]
+    lines += ["", f"TOTAL {total:,} VND"]
+    return "\n".join(lines), total, len(rows)
+
+
+def is_correct(text: str, expected) -> bool:
+    receipt = parse_receipt(text, now=NOW)
+    confident = receipt.confidence >= settings.RECEIPT_MIN_CONFIDENCE
+    if expected is None or not confident:
+        return expected is None and not confident
+    total, items, currency, day = expected
+    expenses = receipt.expenses(now=NOW)
+    return (
+        abs(sum(expense.amount for expense in expenses) - total) < 1e-6
+        and len(expenses) == items
+        and all(expense.currency == currency for expense in expenses)
+        and all(expense.date.day == day for expense in expenses)
+    )
+
+
+async def time_llm(texts: list[str]) -> float:
+    from agents.expense import create_agent
+
+    agent = create_agent()
+    started = time.perf_counter()
+    for text in texts:
+        await agent.arun(f"Extract the expense paid on this receipt:\n\n{text}")
+    return (time.perf_counter() - started) / len(texts)
+
+
+def main():
+    parser = ArgumentParser(
+        description="Rule-based receipt parser: hit rate and latency"
+    )
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--llm", action="store_true", help="also time the LLM path")
+    args = parser.parse_args()
+
+    corpus = dict(CORPUS)
+    for seed in range(20):
+        text, total, items = fake_receipt(seed)
+        corpus[text] = (total, items, "VND", NOW.day)
+    texts = list(corpus)
+    wrong = [
+        text for text, expected in corpus.items() if not is_correct(text, expected)
+    ]
+    parsed = [
+        text
+        for text in texts
+        if parse_receipt(text, now=NOW).confidence >= settings.RECEIPT_MIN_CONFIDENCE
+    ]
+
+    started = time.perf_counter()
+    for _ in range(args.repeat):
+        for text in texts:
+            parse_receipt(text, now=NOW).expenses(now=NOW)
+    per_receipt = (time.perf_counter() - started) / (args.repeat * len(texts))
+
+    print(f"receipts:  {len(texts)}")
+    print(f"fast path: {len(parsed)} ({len(parsed) / len(texts):.0%})")
+    print(f"accuracy:  {1 - len(wrong) / len(texts):.0%}")
+    for text in wrong:
+        print(f"  wrong: {text.splitlines()[0]!r} -> {parse_receipt(text, now=NOW)}")
+    print(f"parser:    {per_receipt * 1e6:8.1f} us/receipt")
+    if args.llm:
+        llm = asyncio.run(time_llm(parsed))
+        print(f"LLM:       {llm * 1e6:8.1f} us/receipt")
+        print(f"speedup:   {llm / per_receipt:8.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import asyncio
+import time
+
+import numpy as np
+
+from services.receipt_image import ReceiptPreprocessor
+from tests.manual.fake_receipts import receipt_photo
+from tools.ocr import OcrPipeline, StubOcrBackend
+
+ANGLES = [-8.0, -5.0, -2.5, 0.0, 1.5, 3.0, 6.0, 9.0]
+UPLINK = 2e6  # bytes per second, shared by the uploads
+NOISE = 6.0  # sensor noise, gives photos of a few MB
+
+
+class UploadBackend(StubOcrBackend):
+    """Stub that first uploads the file through a shared uplink"""
+
+    def __init__(self):
+        super().__init__(default="TOTAL 654,000 VND", latency=0.2)
+        self.received: list[int] = []
+        self.uplink = asyncio.Lock()
+
+    async def parse(self, file, file_name: str) -> str:
+        self.received.append(len(file))
+        async with self.uplink:
+            await asyncio.sleep(len(file) / UPLINK)
+        return await super().parse(file, file_name)
+
+
+def bench_stages(photos: list[bytes]):
+    preprocessor = ReceiptPreprocessor()
+    rows = []
+    for angle, photo in zip(ANGLES, photos):
+        _, stats = preprocessor.process(photo)
+        rows.append(stats)
+        # The photo was turned by `angle`, turning it back levels it
+        assert abs(stats.angle + angle) <= 0.3, (angle, stats.angle)
+        assert stats.size[0] in range(
+            preprocessor.target_width - 2, preprocessor.target_width + 3
+        )
+    stages = rows[0].seconds.keys()
+    print(
+        f"{len(photos)} photos of {np.mean([s.input_bytes for s in rows]) / 1e6:.1f} MB "
+        f"-> {np.mean([s.output_bytes for s in rows]) / 1e3:.0f} kB at "
+        f"{preprocessor.target_dpi} dpi, "
+        f"{np.mean([s.saved_bytes / s.input_bytes for s in rows]):.0%} saved"
+    )
+    print(
+        "per photo: "
+        + ", ".join(
+            f"{stage} {np.mean([s.seconds[stage] for s in rows]) * 1000:.0f} ms"
+            for stage in stages
+        )
+        + f", total {np.mean([sum(s.seconds.values()) for s in rows]) * 1000:.0f} ms"
+    )
+    errors = [abs(s.angle + angle) for s, angle in zip(rows, ANGLES)]
+    print(f"deskew error: max {max(errors):.1f} degrees")
+
+
+async def bench_pipeline(photos: list[bytes]):
+    for preprocess in (None, ReceiptPreprocessor()):
+        backend = UploadBackend()
+        pipeline = OcrPipeline(backend, limiter=None, cache=None, preprocess=preprocess)
+        started = time.perf_counter()
+        results = await pipeline.parse_all(photos)
+        elapsed = time.perf_counter() - started
+        assert all(result.ok for result in results)
+        label = "preprocessed" if preprocess else "as is"
+        print(
+            f"{label:>12}: {len(photos)} receipts in {elapsed:.2f}s at "
+            f"{UPLINK / 1e6:.0f} MB/s, {sum(backend.received) / 1e6:.1f} MB uploaded, "
+            f"{pipeline.stats.saved_bytes / 1e6:.1f} MB saved"
+        )
+
+
+def main():
+    photos = [
+        receipt_photo(seed, angle=angle, noise=NOISE)
+        for seed, angle in enumerate(ANGLES)
+    ]
+    bench_stages(photos)
+    asyncio.run(bench_pipeline(photos))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+from db.connection import get_manager
+from db.migrations import migrate
+
+# Schema before versioned migrations: every timestamp stored as TEXT
+LEGACY_SCHEMA = """
+CREATE TABLE user (username TEXT PRIMARY KEY, name TEXT NOT NULL, note TEXT);
+CREATE TABLE fund (
+    id INTEGER PRIMARY KEY, fund_name TEXT NOT NULL UNIQUE, created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL, by TEXT NOT NULL, note TEXT,
+    FOREIGN KEY(by) REFERENCES user(username)
+);
+CREATE TABLE category (
+    id INTEGER PRIMARY KEY, category_name TEXT NOT NULL UNIQUE, fund_id INTEGER NOT NULL,
+    created_at TEXT NOT NULL, updated_at TEXT NOT NULL, by TEXT NOT NULL, note TEXT,
+    FOREIGN KEY(fund_id) REFERENCES fund(id), FOREIGN KEY(by) REFERENCES user(username)
+);
+CREATE TABLE transaction (
+    id INTEGER PRIMARY KEY, datetime TEXT NOT NULL, amount REAL NOT NULL, currency TEXT NOT NULL,
+    fund_id INTEGER NOT NULL, category_id INTEGER NOT NULL, created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL, by TEXT NOT NULL, note TEXT,
+    FOREIGN KEY(fund_id) REFERENCES fund(id), FOREIGN KEY(category_id) REFERENCES category(id),
+    FOREIGN KEY(by) REFERENCES user(username)
+);
+"""
+
+# What the agents have to write against each schema for "spent this month"
+LEGACY_QUERY = """
+SELECT category_id, SUM(amount)
+FROM transaction
+WHERE by = ? AND CAST(datetime AS TIMESTAMP) >= ? AND CAST(datetime AS TIMESTAMP) < ?
+GROUP BY category_id
+"""
+TYPED_QUERY = """
+SELECT category_id, SUM(amount)
+FROM transaction
+WHERE by = ? AND datetime >= ? AND datetime < ?
+GROUP BY category_id
+"""
+
+
+def build_legacy_db(conn, rows: int, users: int):
+    conn.execute(LEGACY_SCHEMA)
+    conn.execute(
+        "INSERT INTO user SELECT 'user' || i, 'User ' || i, NULL FROM range(?) t(i)",
+        (users,),
+    )
+    conn.execute(
+        "INSERT INTO fund VALUES (0, 'Chi tiêu', '2024-01-01 00:00:00', '2024-01-01 00:00:00', 'user0', NULL)"
+    )
+    conn.execute(
+        """
+        INSERT INTO category
+        SELECT i + 1, 'category ' || i, 0, '2024-01-01 00:00:00', '2024-01-01 00:00:00', 'user0', NULL
+        FROM range(20) t(i)
+        """
+    )
+    # Rows arrive in chat order, i.e. users interleaved over time
+    conn.execute(
+        """
+        INSERT INTO transaction
+        SELECT
+            i + 1,
+            strftime(TIMESTAMP '2023-01-01' + to_seconds(i * 94608000 // ?), '%Y-%m-%d %H:%M:%S'),
+            (i % 1000) * 1000.0,
+            'VND',
+            0,
+            i % 20 + 1,
+            '2024-01-01 00:00:00',
+            '2024-01-01 00:00:00',
+            'user' || (hash(i) % ?),
+            NULL
+        FROM range(?) t(i)
+        """,
+        (rows, users, rows),
+    )
+
+
+def time_query(conn, query: str, repeat: int) -> float:
+    params = ("user7", "2025-03-01 00:00:00", "2025-04-01 00:00:00")
+    conn.execute(query, params).fetchall()  # warm up
+    started = time.perf_counter()
+    for _ in range(repeat):
+        conn.execute(query, params).fetchall()
+    return (time.perf_counter() - started) / repeat
+
+
+def main():
+    parser = ArgumentParser(
+        description="Range aggregation: legacy TEXT vs typed schema"
+    )
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--db", type=str, default="data/bench_schema.duckdb")
+    args = parser.parse_args()
+
+    db_path = Path(args.db)
+    db_path.parent.mkdir(exist_ok=True)
+    db_path.unlink(missing_ok=True)
+
+    with get_manager(db_path).writer() as conn:
+        build_legacy_db(conn, args.rows, args.users)
+        legacy = time_query(conn, LEGACY_QUERY, args.repeat)
+
+        started = time.perf_counter()
+        version = migrate(conn)
+        migrated_in = time.perf_counter() - started
+
+        typed = time_query(conn, TYPED_QUERY, args.repeat)
+
+    print(f"rows={args.rows:,} users={args.users}")
+    print(f"migrated to version {version} in {migrated_in:.2f}s")
+    print(f"legacy TEXT schema: {legacy * 1000:8.2f} ms/query")
+    print(f"typed schema:       {typed * 1000:8.2f} ms/query")
+    print(f"speedup:            {legacy / typed:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,22 @@
 import datetime
 
-import duckdb
-
+from db.connection import get_manager
+from db.ingest import ingest_transactions
+from db.schema import Transaction
 from db.utils import init_blank_db, safe_execute
 
 
 def init_test_db(db_path):
-    conn = duckdb.connect(str(db_path))
-    cursor = conn.cursor()
-
     # Create database tables
     init_blank_db(db_path)
 
+    with get_manager(db_path).writer() as conn:
+        _insert_test_data(conn)
+
+
+def _insert_test_data(conn):
+    cursor = conn.cursor()
+
     users = [("nhtlong", "Long"), ("vinhloiit", "Vinh Loi"), ("tester", "System")]
     # Insert users
     test_user = "tester"
@@ -30,22 +35,21 @@ def init_test_db(db_path):
         ("Tiết kiệm", ["du lịch singapore", "mua nhà", "mua xe"]),
     ]
 
-    # Insert funds
-    for fund_id, (fund_name, categories) in enumerate(default_funds):
+    # Insert funds, ids are drawn from the fund/category sequences
+    for fund_name, categories in default_funds:
         safe_execute(
             conn,
-            "INSERT INTO fund (id, fund_name, created_at, updated_at, by) SELECT ?, ?, ?, ?, ? WHERE NOT EXISTS (SELECT 1 FROM fund WHERE fund_name=?)",
-            (fund_id, fund_name, created_at, updated_at, test_user, fund_name),
+            "INSERT INTO fund (fund_name, created_at, updated_at, by) SELECT ?, ?, ?, ? WHERE NOT EXISTS (SELECT 1 FROM fund WHERE fund_name=?)",
+            (fund_name, created_at, updated_at, test_user, fund_name),
         )
+        fund_id = cursor.execute(
+            "SELECT id FROM fund WHERE fund_name=?", (fund_name,)
+        ).fetchone()[0]
         for category_name in categories:
-            category_id = (
-                cursor.execute("SELECT COUNT(1) FROM category").fetchone()[0] + 1
-            )
             safe_execute(
                 conn,
-                "INSERT INTO category (id, category_name, fund_id, created_at, updated_at, by) SELECT ?, ?, ?, ?, ?, ? WHERE NOT EXISTS (SELECT 1 FROM category WHERE category_name=? AND fund_id=?)",
+                "INSERT INTO category (category_name, fund_id, created_at, updated_at, by) SELECT ?, ?, ?, ?, ? WHERE NOT EXISTS (SELECT 1 FROM category WHERE category_name=? AND fund_id=?)",
                 (
-                    category_id,
                     category_name,
                     fund_id,
                     created_at,
@@ -58,25 +62,18 @@ def init_test_db(db_path):
 
     # Insert default transactions
     default_transactions = [
-        (
-            "2025-04-16 13:05:43",
-            100000.0,
-            "VND",
-            1,
-            1,
-            "Lunch",
-            created_at,
-            updated_at,
-            test_user,
+        Transaction(
+            id=0,  # assigned by the ledger sequence
+            datetime="2025-04-16 13:05:43",
+            amount=100000.0,
+            currency="VND",
+            fund_name="Chi tiêu",
+            category_name="ăn uống",
+            note="Lunch",
+            created_at=created_at,
+            updated_at=updated_at,
+            by=test_user,
         ),
     ]
-    for transaction in default_transactions:
-        transaction_id = (
-            cursor.execute("SELECT COUNT(1) FROM transaction").fetchone()[0] + 1
-        )
-        safe_execute(
-            conn,
-            "INSERT INTO transaction (id, datetime, amount, currency, fund_id, category_id, note, created_at, updated_at, by) SELECT ?, ?, ?, ?, ?, ?, ?, ?, ?, ? WHERE NOT EXISTS (SELECT 1 FROM transaction WHERE id=?)",
-            (transaction_id,) + transaction + (transaction_id,),
-        )
-    conn.close()
+    if cursor.execute("SELECT COUNT(1) FROM transaction").fetchone()[0] == 0:
+        ingest_transactions(conn, default_transactions)
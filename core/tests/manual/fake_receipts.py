@@ -0,0 +1,58 @@
+import io
+import random
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+ITEMS = ["Pho bo", "Tra da", "Nem ran", "Bun cha", "Com tam", "Ca phe sua"]
+TABLE = (60, 50, 40)  # background around the receipt
+
+
+def receipt_image(
+    seed: int,
+    size: tuple[int, int] = (3024, 4032),
+    angle: float = 0.0,
+    noise: float = 0.0,
+) -> Image.Image:
+    """A phone photo of a receipt: paper on a table, `angle` degrees off
+
+    `noise` is the standard deviation of the sensor noise added, real photos
+    compress to a few MB because of it.
+    """
+    rng = random.Random(seed)
+    width, height = size
+    image = Image.new("RGB", size, TABLE)
+    draw = ImageDraw.Draw(image)
+    left, top = width // 6, height // 18
+    right, bottom = width - width // 6, height - height // 18
+    draw.rectangle([left, top, right, bottom], fill=(245, 242, 235))
+    font = ImageFont.load_default(size=height // 50)
+    line = height // 33
+    x, y = left + width // 30, top + line
+    draw.text((x + width // 8, y), "PHO HANOI", fill=(20, 20, 20), font=font)
+    y += 2 * line
+    total = 0
+    for _ in range(rng.randint(5, 14)):
+        price = rng.randint(10, 200) * 1000
+        total += price
+        draw.text((x, y), f"{rng.choice(ITEMS)} x1", fill=(20, 20, 20), font=font)
+        draw.text((x + width // 2, y), f"{price:,}", fill=(20, 20, 20), font=font)
+        y += line
+    draw.text((x, y + line), f"TOTAL {total:,} VND", fill=(20, 20, 20), font=font)
+    if angle:
+        image = image.rotate(angle, resample=Image.Resampling.BICUBIC, fillcolor=TABLE)
+    if noise:
+        pixels = np.asarray(image, dtype=np.float32)
+        pixels += np.random.default_rng(seed).normal(0, noise, pixels.shape)
+        image = Image.fromarray(pixels.clip(0, 255).astype(np.uint8))
+    return image
+
+
+def to_jpeg(image: Image.Image, quality: int = 90) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def receipt_photo(seed: int, **kwargs) -> bytes:
+    return to_jpeg(receipt_image(seed, **kwargs))
@@ -0,0 +1,261 @@
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+import httplib2
+from googleapiclient.discovery import Resource, build
+from googleapiclient.http import HttpRequest
+
+from services.a1 import column_index, column_letters, quote_sheet
+from services.rate_limit import TokenBucket, google_request_builder
+
+DEFAULT_SHEET = "Sheet1"
+RANGE_RE = re.compile(
+    r"(?P<start_col>[A-Z]*)(?P<start_row>\d*)(?::(?P<end_col>[A-Z]*)(?P<end_row>\d*))?"
+)
+
+
+class FakeSheets:
+    """In-memory spreadsheets behind a minimal Sheets v4 values API
+
+    Supports values get/update/clear and their batchGet/batchUpdate/batchClear
+    variants, the Drive `files.get` version of a spreadsheet, and counts
+    requests and bytes per method. Connections are kept alive; `failures`
+    holds statuses to answer the next requests with, `latency` delays every
+    response and above `quota` requests per second the answer is a 429.
+    """
+
+    def __init__(self):
+        self.cells: dict[tuple[str, str, int, int], object] = {}
+        self.versions: dict[str, int] = {}
+        self.failures: list[int] = []
+        self.latency = 0.0
+        self.quota: float | None = None
+        self._recent: list[float] = []
+        self.connections = 0
+        self.calls: dict[str, int] = {}
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    @property
+    def requests(self) -> int:
+        return sum(self.calls.values())
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+
+    def service(self, limiter: TokenBucket | None = None) -> Resource:
+        """A `spreadsheets()` resource talking to this server"""
+        return build(
+            "sheets",
+            "v4",
+            http=httplib2.Http(),
+            client_options={"api_endpoint": self.url},
+            requestBuilder=(
+                google_request_builder(limiter) if limiter is not None else HttpRequest
+            ),
+        ).spreadsheets()
+
+    def drive(self) -> Resource:
+        """A Drive v3 `files()` resource talking to this server"""
+        return build(
+            "drive",
+            "v3",
+            http=httplib2.Http(),
+            client_options={"api_endpoint": self.url},
+        ).files()
+
+    # Cells
+
+    def _bounds(self, spreadsheet_id: str, range_name: str):
+        sheet, _, cells = range_name.rpartition("!")
+        if not sheet and not RANGE_RE.fullmatch(cells.upper()):
+            # A bare sheet name
+            sheet, cells = cells, ""
+        sheet = sheet.strip("'").replace("''", "'") or DEFAULT_SHEET
+        used = [
+            (r, c) for (s, n, r, c) in self.cells if s == spreadsheet_id and n == sheet
+        ]
+        max_row = max((r for r, _ in used), default=1)
+        max_col = max((c for _, c in used), default=1)
+        match = RANGE_RE.fullmatch(cells.upper()) if cells else None
+        if match is None:
+            return sheet, 1, 1, max_row, max_col
+        start_col = (
+            column_index(match.group("start_col")) if match.group("start_col") else 1
+        )
+        start_row = int(match.group("start_row") or 1)
+        if match.group("end_col") is None and match.group("end_row") is None:
+            return sheet, start_row, start_col, start_row, start_col
+        end_col = (
+            column_index(match.group("end_col")) if match.group("end_col") else max_col
+        )
+        end_row = int(match.group("end_row")) if match.group("end_row") else max_row
+        return sheet, start_row, start_col, end_row, end_col
+
+    def get(self, spreadsheet_id: str, range_name: str) -> dict:
+        sheet, r1, c1, r2, c2 = self._bounds(spreadsheet_id, range_name)
+        rows = []
+        for r in range(r1, r2 + 1):
+            row = [
+                self.cells.get((spreadsheet_id, sheet, r, c), "")
+                for c in range(c1, c2 + 1)
+            ]
+            while row and row[-1] == "":
+                row.pop()
+            rows.append(row)
+        while rows and not rows[-1]:
+            rows.pop()
+        result = {
+            "range": f"{quote_sheet(sheet)}!{column_letters(c1)}{r1}:{column_letters(c2)}{r2}",
+            "majorDimension": "ROWS",
+        }
+        if rows:
+            result["values"] = rows
+        return result
+
+    def update(self, spreadsheet_id: str, range_name: str, values: list[list]) -> dict:
+        self.touch(spreadsheet_id)
+        sheet, r1, c1, _, _ = self._bounds(spreadsheet_id, range_name)
+        updated = 0
+        for i, row in enumerate(values):
+            for j, value in enumerate(row):
+                if value is None:
+                    continue
+                self.cells[(spreadsheet_id, sheet, r1 + i, c1 + j)] = value
+                updated += 1
+        return {
+            "spreadsheetId": spreadsheet_id,
+            "updatedRange": range_name,
+            "updatedCells": updated,
+        }
+
+    def clear(self, spreadsheet_id: str, range_name: str) -> dict:
+        self.touch(spreadsheet_id)
+        sheet, r1, c1, r2, c2 = self._bounds(spreadsheet_id, range_name)
+        for key in list(self.cells):
+            s, n, r, c = key
+            if s == spreadsheet_id and n == sheet and r1 <= r <= r2 and c1 <= c <= c2:
+                del self.cells[key]
+        return {"spreadsheetId": spreadsheet_id, "clearedRange": range_name}
+
+    def touch(self, spreadsheet_id: str):
+        """Bump the Drive version, as any edit of the file does"""
+        self.versions[spreadsheet_id] = self.versions.get(spreadsheet_id, 1) + 1
+
+    # HTTP
+
+    def _dispatch(
+        self, http_method: str, path: str, query: dict, body: dict
+    ) -> tuple[str, dict]:
+        file = re.fullmatch(r"/files/([^/]+)", path)
+        if file is not None:
+            spreadsheet_id = file.group(1)
+            version = self.versions.setdefault(spreadsheet_id, 1)
+            return "files.get", {"id": spreadsheet_id, "version": str(version)}
+        match = re.fullmatch(
+            r"/v4/spreadsheets/([^/]+)/values(?::(\w+)|/([^:]+)(?::(\w+))?)", path
+        )
+        if match is None:
+            raise KeyError(path)
+        spreadsheet_id, batch_method, range_name, range_method = match.groups()
+        if batch_method == "batchGet":
+            return batch_method, {
+                "spreadsheetId": spreadsheet_id,
+                "valueRanges": [
+                    self.get(spreadsheet_id, r) for r in query.get("ranges", [])
+                ],
+            }
+        if batch_method == "batchUpdate":
+            return batch_method, {
+                "spreadsheetId": spreadsheet_id,
+                "responses": [
+                    self.update(spreadsheet_id, data["range"], data.get("values", []))
+                    for data in body.get("data", [])
+                ],
+            }
+        if batch_method == "batchClear":
+            for r in body.get("ranges", []):
+                self.clear(spreadsheet_id, r)
+            return batch_method, {
+                "spreadsheetId": spreadsheet_id,
+                "clearedRanges": body.get("ranges", []),
+            }
+        range_name = unquote(range_name)
+        if range_method == "clear":
+            return "clear", self.clear(spreadsheet_id, range_name)
+        if http_method == "PUT":
+            return "update", self.update(
+                spreadsheet_id, range_name, body.get("values", [])
+            )
+        return "get", self.get(spreadsheet_id, range_name)
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive
+
+            def setup(self):
+                super().setup()
+                with fake.lock:
+                    fake.connections += 1
+
+            def _handle(self):
+                url = urlparse(self.path)
+                raw = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                body = json.loads(raw or b"{}")
+                if fake.latency:
+                    time.sleep(fake.latency)
+                with fake.lock:
+                    try:
+                        if fake.quota is not None:
+                            now = time.monotonic()
+                            fake._recent = [t for t in fake._recent if t > now - 1]
+                            if len(fake._recent) >= fake.quota:
+                                fake.failures.insert(0, 429)
+                            else:
+                                fake._recent.append(now)
+                        if fake.failures:
+                            status = fake.failures.pop(0)
+                            method, result = "failed", {"error": {"code": status}}
+                        else:
+                            method, result = fake._dispatch(
+                                self.command, url.path, parse_qs(url.query), body
+                            )
+                            status = 200
+                    except KeyError:
+                        method, result, status = (
+                            "unknown",
+                            {"error": {"code": 404}},
+                            404,
+                        )
+                    fake.calls[method] = fake.calls.get(method, 0) + 1
+                    payload = json.dumps(result).encode()
+                    fake.bytes_in += len(raw)
+                    fake.bytes_out += len(payload)
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_PUT = do_POST = _handle
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
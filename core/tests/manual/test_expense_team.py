@@ -10,12 +10,12 @@ def test():
     db_path = Path(settings.DATA_DIR) / "trackmate.duckdb"
     username = "tester"
 
-    agent = create_agent_v2(db_path, username)
-
     init_test_db(db_path)
     print("Database initialized at", db_path)
     display_db(db_path)
 
+    agent = create_agent_v2(db_path, username)
+
     agent.cli_app(
         exit_on=["bye", "quit", "exit"],
         debug=True,
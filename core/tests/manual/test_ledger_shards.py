@@ -0,0 +1,182 @@
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import time
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+from db.connection import close_all, get_manager
+from db.ingest import ingest_transactions
+from db.shards import ShardDirectory
+from tests.manual.common import init_test_db
+
+USERS = [f"user{i:02d}" for i in range(40)]
+BUCKETS = 4
+WORKERS = 4
+WRITES = 50
+TOTALS = """
+    SELECT by, SUM(amount) AS total, COUNT(1) AS count
+    FROM transaction WHERE by LIKE 'user%' GROUP BY by
+"""
+
+
+def fake_transactions(usernames: list[str], rows: int, seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    start = np.datetime64("2024-01-01T00:00:00")
+    return pd.DataFrame(
+        {
+            "datetime": start + rng.integers(0, 365 * 86400, rows).astype("m8[s]"),
+            "amount": rng.integers(1, 500, rows) * 1000.0,
+            "currency": "VND",
+            "fund_name": "Chi tiêu",
+            "category_name": "ăn uống",
+            "by": rng.choice(usernames, rows),
+        }
+    )
+
+
+def worker(root: str, index: int, writes: int) -> tuple[int, float]:
+    """Write to the users of the shards this worker owns"""
+    shards = ShardDirectory(root, BUCKETS)
+    owned = [user for user in USERS if shards.owner(user, WORKERS) == index]
+    started = time.perf_counter()
+    for i in range(writes if owned else 0):
+        username = owned[i % len(owned)]
+        path = shards.path_for(username)
+        with get_manager(path).writer() as cursor:
+            ingest_transactions(cursor, fake_transactions([username], 1, i))
+    return len(owned), time.perf_counter() - started
+
+
+def ingest(path: str, rows: int) -> tuple[int, int]:
+    """Ingest `rows` fake transactions into a fresh ledger"""
+    init_test_db(path)
+    with get_manager(path).writer() as cursor:
+        result = ingest_transactions(cursor, fake_transactions(["tester"], rows, 0))
+        (threads,) = cursor.execute("SELECT current_setting('threads')").fetchone()
+    return result.rows, threads
+
+
+def test_large_ingest():
+    """More threads than CPUs could hang DuckDB on a registered frame"""
+    os.environ["DUCKDB_THREADS"] = str((os.cpu_count() or 1) + 1)
+    context = multiprocessing.get_context("spawn")
+    try:
+        with tempfile.TemporaryDirectory() as tmp, context.Pool(1) as pool:
+            job = pool.apply_async(ingest, (f"{tmp}/ledger.duckdb", 12_000))
+            rows, threads = job.get(timeout=60)
+    finally:
+        del os.environ["DUCKDB_THREADS"]
+    print(f"ingested {rows} rows with {threads} DuckDB threads")
+    assert rows == 12_000
+    assert threads <= (os.cpu_count() or 1)
+
+
+def totals(frame: pd.DataFrame) -> dict:
+    frame = frame.groupby("by")[["total", "count"]].sum()
+    return {by: (float(row.total), int(row["count"])) for by, row in frame.iterrows()}
+
+
+async def sequential(shards: ShardDirectory) -> pd.DataFrame:
+    frames = [
+        await get_manager(path).run_read(lambda c: c.execute(TOTALS).df())
+        for path in shards.paths()
+    ]
+    return pd.concat(frames, ignore_index=True)
+
+
+def test():
+    with tempfile.TemporaryDirectory() as tmp:
+        shards = ShardDirectory(tmp, BUCKETS)
+        for path in {shards.path_for(user) for user in USERS}:
+            init_test_db(path)
+        for user in USERS:
+            with get_manager(shards.path_for(user)).writer() as cursor:
+                cursor.execute(
+                    "INSERT INTO user (username, name) VALUES (?, ?)", [user, user]
+                )
+        print("shards:", [path.name for path in shards.paths()])
+        assert len(shards.paths()) == BUCKETS
+
+        # Each user's rows only go to their shard
+        ledger = fake_transactions(USERS, 400_000, 0)
+        for path, rows in ledger.groupby(ledger["by"].map(shards.path_for)):
+            with get_manager(path).writer() as cursor:
+                ingest_transactions(cursor, rows)
+        expected = totals(
+            ledger.groupby("by")
+            .agg(total=("amount", "sum"), count=("amount", "size"))
+            .reset_index()
+        )
+
+        # Cross-shard aggregate: one partial per shard, summed here
+        for label, run in [
+            ("sequential", sequential(shards)),
+            ("fan-out", shards.query(TOTALS)),
+        ]:
+            started = time.perf_counter()
+            frame = asyncio.run(run)
+            print(f"{label:>10}: {(time.perf_counter() - started) * 1000:.1f} ms")
+            assert totals(frame) == expected
+
+        # Worker processes own disjoint shards, so none waits on another's lock
+        close_all()
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(WORKERS) as pool:
+            started = time.perf_counter()
+            results = pool.starmap(worker, [(tmp, i, WRITES) for i in range(WORKERS)])
+        elapsed = time.perf_counter() - started
+        for index, (owned, seconds) in enumerate(results):
+            print(f"worker {index}: {owned} users, {WRITES} writes in {seconds:.2f}s")
+        print(f"parallel writers: {elapsed:.2f}s")
+        written = asyncio.run(shards.query(TOTALS))["count"].sum()
+        assert written == len(ledger) + sum(WRITES for owned, _ in results if owned)
+
+        # Two processes on one file is what the shards avoid
+        close_all()
+        with context.Pool(2) as pool:
+            blocked = pool.starmap(_open_writable, [(str(shards.paths()[0]),)] * 2)
+        print("same file, two processes:", blocked)
+        assert blocked.count("locked") == 1
+
+        # A busy user moves to a file of their own, the totals do not change
+        bucket = shards.path_for("user00")
+        retried = fake_transactions(["user00"], 3, 1)
+        retried["idempotency_key"] = [f"user00-{i}" for i in range(3)]
+        with get_manager(bucket).writer() as cursor:
+            ingest_transactions(cursor, retried)
+        before = totals(asyncio.run(shards.query(TOTALS)))
+        target = shards.isolate("user00")
+        print(f"isolate user00: {bucket.name} -> {target.relative_to(tmp)}")
+        assert shards.path_for("user00") == target
+        assert totals(asyncio.run(shards.query(TOTALS))) == before
+        with get_manager(bucket).reader() as cursor:
+            left = cursor.execute(
+                "SELECT COUNT(1) FROM transaction WHERE by = 'user00'"
+            ).fetchone()[0]
+            keys = cursor.execute(
+                "SELECT COUNT(1) FROM applied_write WHERE key LIKE 'user00-%'"
+            ).fetchone()[0]
+        assert left == 0 and keys == 0
+        # The idempotency keys moved too: a retried write adds nothing
+        with get_manager(target).writer() as cursor:
+            assert ingest_transactions(cursor, retried).rows == 0
+        close_all()
+
+
+def _open_writable(path: str) -> str:
+    try:
+        conn = duckdb.connect(path)
+    except duckdb.IOException:
+        return "locked"
+    time.sleep(1)
+    conn.close()
+    return "opened"
+
+
+if __name__ == "__main__":
+    test_large_ingest()
+    test()
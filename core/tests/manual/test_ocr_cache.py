@@ -0,0 +1,113 @@
+import asyncio
+import tempfile
+import time
+
+from services.ocr_cache import OcrResultCache
+from tests.manual.fake_receipts import receipt_image, to_jpeg
+from tools.ocr import OcrPipeline, StubOcrBackend
+
+LATENCY = 0.5  # seconds per parse
+RECEIPTS = 20
+DISTANCE = 40  # near-duplicate lookups are off by default
+
+
+async def test_pipeline(cache_dir: str):
+    images = [receipt_image(seed, size=(1512, 2016)) for seed in range(RECEIPTS)]
+    photos = [to_jpeg(image) for image in images]
+    backend = StubOcrBackend(default="Total: 65,000 VND", latency=LATENCY)
+    pipeline = OcrPipeline(
+        backend,
+        limiter=None,
+        cache=OcrResultCache(cache_dir, max_distance=DISTANCE),
+        max_concurrency=8,
+    )
+    cache = pipeline.cache
+
+    started = time.perf_counter()
+    await pipeline.parse_all(photos)
+    first = time.perf_counter() - started
+    print(f"first send: {RECEIPTS} receipts in {first:.2f}s, {cache.stats}")
+
+    # The same bytes again
+    started = time.perf_counter()
+    results = await pipeline.parse_all(photos)
+    again = time.perf_counter() - started
+    print(f"resend:     {again:.2f}s, {cache.stats}")
+    assert all(result.cached for result in results) and cache.stats.exact_hits == 20
+
+    # Forwarded by the chat app: recompressed, rescaled or cropped
+    width, height = images[0].size
+    edited = [
+        to_jpeg(image.resize((width * 2 // 3, height * 2 // 3)), quality=60)
+        for image in images[:10]
+    ] + [to_jpeg(image.crop((100, 150, width - 80, height))) for image in images[10:]]
+    results = await pipeline.parse_all(edited)
+    print(
+        f"edited:     {sum(r.cached for r in results)}/{RECEIPTS} hits, {cache.stats}"
+    )
+    assert cache.stats.near_hits == RECEIPTS
+
+    # Other receipts of the same shop are not mistaken for cached ones
+    others = [
+        to_jpeg(receipt_image(seed, size=(1512, 2016))) for seed in range(100, 140)
+    ]
+    results = await pipeline.parse_all(others)
+    print(f"others:     {sum(r.cached for r in results)}/40 hits, {cache.stats}")
+    assert not any(result.cached for result in results)
+
+    # Premium mode gives another text, it is cached separately
+    calls = backend.calls
+    backend.options = {"backend": "stub", "premium": True}
+    await pipeline.parse(photos[0])
+    assert backend.calls == calls + 1
+    backend.options = {"backend": "stub"}
+
+    # Non-image files are cached by content only
+    await pipeline.parse(b"%PDF-1.4 fake", "receipt.pdf")
+    result = await pipeline.parse(b"%PDF-1.4 fake", "receipt.pdf")
+    assert result.cached
+
+    # The index is rebuilt from the files
+    reopened = OcrResultCache(cache_dir, max_distance=DISTANCE)
+    assert reopened.get(reopened.key(photos[3], pipeline.options)) is not None
+    print(f"reopened:   {len(reopened.index)} entries")
+
+    # By default only the same bytes hit
+    exact = OcrResultCache(cache_dir)
+    assert exact.get(exact.key(photos[3], pipeline.options)) is not None
+    assert exact.get(exact.key(edited[3], pipeline.options)) is None
+
+
+def test_eviction(cache_dir: str):
+    cache = OcrResultCache(cache_dir, max_bytes=10_000)
+    for i in range(30):
+        cache.put(cache.key(f"receipt {i}".encode(), {}), "x" * 1000)
+        time.sleep(0.01)  # distinct mtimes
+    # The oldest go first
+    assert cache.get(cache.key(b"receipt 0", {})) is None
+    assert cache.get(cache.key(b"receipt 29", {})) is not None
+    print(f"eviction:   {len(cache.index)} entries kept, {cache.stats}")
+    kept = sum(path.stat().st_size for path in cache.cache_dir.glob("*.json"))
+    assert kept <= 10_000 and len(cache.index) + cache.stats.evictions == 30
+
+
+def test_hash_cost():
+    photo = to_jpeg(receipt_image(0))
+    cache = OcrResultCache(tempfile.mkdtemp(), max_distance=DISTANCE)
+    started = time.perf_counter()
+    for _ in range(10):
+        cache.key(photo, {})
+    elapsed = (time.perf_counter() - started) / 10
+    print(f"key of a {len(photo) / 1e6:.1f} MB 12 MP photo: {elapsed * 1000:.0f} ms")
+
+
+def main():
+    with tempfile.TemporaryDirectory() as cache_dir:
+        asyncio.run(test_pipeline(cache_dir))
+    with tempfile.TemporaryDirectory() as cache_dir:
+        test_eviction(cache_dir)
+    test_hash_cost()
+
+
+if __name__ == "__main__":
+    main()
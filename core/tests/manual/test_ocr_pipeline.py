@@ -0,0 +1,176 @@
+import asyncio
+import tempfile
+import threading
+import time
+from contextlib import aclosing
+from http.server import ThreadingHTTPServer
+
+from telegram import Update
+
+from agents.pool import AgentPool
+from agents.receipt_parser import parse_receipt
+from cli.telegram import create_bot, format_expenses
+from config.settings import settings
+from db.shards import ShardDirectory
+from services.write_queue import LedgerSink, WriteQueue, WriteQueueWorker
+from tests.manual.test_sheets_async import heartbeat
+from tests.manual.test_telegram_webhook import FakeTelegram, StubAgent, make_update
+from tools.ocr import OcrPipeline, StubOcrBackend
+
+RECEIPT = "| Item | Price |\n|---|---|\n| Pho bo | 65,000 |\n\nTotal: 65,000 VND"
+
+
+async def test_stream():
+    # 12 receipts of 0.1-0.6s, two too slow for the timeout and one failing
+    latency = {f"r{i:02d}.jpg": 0.1 + (i * 7 % 6) * 0.1 for i in range(12)}
+    backend = StubOcrBackend(default=RECEIPT, latency=latency, failures=["r03.jpg"])
+    pipeline = OcrPipeline(
+        backend, max_concurrency=4, timeout=0.55, limiter=None, cache=None
+    )
+
+    gaps: list[float] = []
+    ticker = asyncio.create_task(heartbeat(gaps))
+    started = time.perf_counter()
+    arrivals = []
+    async for result in pipeline.stream(sorted(latency)):
+        arrivals.append((time.perf_counter() - started, result))
+    elapsed = time.perf_counter() - started
+    ticker.cancel()
+
+    sequential = sum(min(seconds, 0.55) for seconds in latency.values())
+    print(
+        f"stream:    12 receipts in {elapsed:.2f}s (sequential {sequential:.2f}s), "
+        f"at most {backend.max_active} at once, longest loop stall "
+        f"{max(gaps) * 1000:.0f} ms"
+    )
+    print(f"           first result after {arrivals[0][0]:.2f}s, {pipeline.stats}")
+    for at, result in arrivals:
+        status = "ok" if result.ok else result.error
+        print(f"           {at:.2f}s {result.file_name} {status}")
+    assert backend.max_active <= 4 and max(gaps) < 0.05
+    assert pipeline.stats.timeouts == 2 and pipeline.stats.failed == 1
+    assert arrivals[0][0] < 0.2 and elapsed < sequential / 2
+
+    # A consumer that stops early cancels the receipts still running
+    async with aclosing(pipeline.stream(sorted(latency))) as results:
+        async for result in results:
+            break
+    print(f"early stop: {backend.active} parses left running")
+    assert backend.active == 0
+
+
+class BrokenPreprocess:
+    options: dict = {}
+
+    def process(self, data: bytes):
+        raise ValueError("not an image")
+
+
+async def test_prepare_error():
+    """A file failing before the upload is a failed result, not an exception"""
+    backend = StubOcrBackend(default=RECEIPT)
+    pipeline = OcrPipeline(
+        backend, preprocess=BrokenPreprocess(), limiter=None, cache=None
+    )
+    result = await pipeline.parse(b"\x89PNG", "broken.png")
+    print(f"prepare:   {result.file_name} {result.error}, {pipeline.stats}")
+    assert result.error == "not an image" and backend.calls == 0
+    assert pipeline.stats.failed == 1
+
+
+async def test_telegram():
+    """A receipt photo does not hold up the messages sent after it
+
+    The receipt is answered with its expenses, parsed without the LLM, and
+    they are written to the ledger through the write queue.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeTelegram)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/bot"
+    FakeTelegram.files["receipt-big"] = b"\xff\xd8fake jpeg\xff\xd9"
+
+    settings.TELEGRAM_BOT_TOKEN = settings.TELEGRAM_BOT_TOKEN or "123456:fake-token"
+    backend = StubOcrBackend(texts={"receipt-big.jpg": RECEIPT}, latency=1.5)
+    tmp = tempfile.TemporaryDirectory()
+    writes = WriteQueueWorker(
+        WriteQueue(f"{tmp.name}/queue.sqlite"), [LedgerSink(ShardDirectory(tmp.name))]
+    )
+    bot = create_bot(
+        pool=AgentPool(StubAgent),
+        base_url=base_url,
+        ocr=OcrPipeline(backend, limiter=None, cache=None),
+        writes=writes,
+    )
+    await bot.initialize()
+    await bot.post_init(bot)  # as run_polling and run_webhook do
+    await bot.start()
+
+    photo = make_update(1, 42, "")
+    del photo["message"]["text"]
+    photo["message"]["photo"] = [
+        {
+            "file_id": "receipt-small",
+            "file_unique_id": "receipt-small",
+            "width": 90,
+            "height": 90,
+        },
+        {
+            "file_id": "receipt-big",
+            "file_unique_id": "receipt-big",
+            "width": 900,
+            "height": 1600,
+        },
+    ]
+    reply = f"Saved:\n{format_expenses(parse_receipt(RECEIPT).expenses())}"
+    started = time.perf_counter()
+    for update in (photo, make_update(2, 42, "hello there")):
+        await bot.update_queue.put(Update.de_json(update, bot.bot))
+    while reply not in FakeTelegram.texts.values():
+        assert time.perf_counter() - started < 10, FakeTelegram.texts
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - started
+
+    # A photo that cannot be downloaded is answered, not left on the placeholder
+    lost = make_update(3, 42, "")
+    del lost["message"]["text"]
+    lost["message"]["photo"] = [
+        {"file_id": "gone", "file_unique_id": "gone", "width": 90, "height": 90}
+    ]
+    await bot.update_queue.put(Update.de_json(lost, bot.bot))
+    while (
+        "Sorry, the receipt could not be processed." not in FakeTelegram.texts.values()
+    ):
+        assert time.perf_counter() - started < 20, FakeTelegram.texts
+        await asyncio.sleep(0.05)
+
+    await bot.stop()
+    await bot.shutdown()
+    await writes.stop()
+    server.shutdown()
+    assert writes.queue.stats.written == 1
+    tmp.cleanup()
+
+    answered = {
+        text: next(
+            m["at"] - started
+            for m in FakeTelegram.sent
+            if FakeTelegram.texts[int(m["message_id"])] == text
+            and m["method"] == "editMessageText"
+        )
+        for text in ("echo hello there", reply)
+    }
+    print(
+        f"telegram:  text answered after {answered['echo hello there']:.2f}s, "
+        f"receipt after {answered[reply]:.2f}s: {reply!r}"
+    )
+    assert answered["echo hello there"] < answered[reply] <= elapsed
+
+
+def test():
+    asyncio.run(test_stream())
+    asyncio.run(test_prepare_error())
+    asyncio.run(test_telegram())
+
+
+if __name__ == "__main__":
+    test()
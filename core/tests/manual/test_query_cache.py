@@ -0,0 +1,123 @@
+import time
+from datetime import date
+from pathlib import Path
+
+from agents.query_cache import QueryCache, RecordingDuckDbTools, is_ledger_question
+from config.settings import settings
+from db.catalog import catalog_cache
+from db.connection import get_manager
+from db.sandbox import QueryResult, QuerySandbox
+from tests.manual.common import init_test_db
+from tests.manual.test_telegram_webhook import SHEET_REQUESTS
+from tools.ledger import LedgerTools
+
+TODAY = date(2025, 4, 20)
+
+# What the Executor would have run for the first question
+PLANNED_SQL = """
+SELECT SUM(t.amount) AS total, t.currency
+FROM transaction t JOIN category c ON t.category_id = c.id
+WHERE t.by = 'tester' AND c.category_name = 'ăn uống'
+  AND t.datetime >= '2025-04-01' AND t.datetime < '2025-05-01'
+GROUP BY t.currency
+"""
+PARAPHRASES = [
+    "How much did I spend on ăn uống this month?",
+    "this month how much have I spent on ăn uống",
+    "Tháng này tôi chi bao nhiêu cho ăn uống?",
+]
+
+
+def test_routing():
+    for message in PARAPHRASES:
+        assert is_ledger_question(message), message
+    for message in SHEET_REQUESTS:
+        assert not is_ledger_question(message), message
+
+
+def test():
+    db_path = Path(settings.DATA_DIR) / "trackmate.duckdb"
+    username = "tester"
+    init_test_db(db_path)
+    cache = QueryCache(max_size=16, ttl=60)
+    catalog_version = catalog_cache.version(db_path)
+
+    question = PARAPHRASES[0]
+    assert cache.get(db_path, username, question, catalog_version, TODAY) is None
+    ledger_version = cache.ledger_version(db_path, username)
+    # The result the Executor's tool captured is stored, the query is not re-run
+    tool = RecordingDuckDbTools(QuerySandbox(get_manager(db_path).cursor()))
+    tool.run_query(PLANNED_SQL)
+    assert tool.sandbox.stats.executed == 1
+    assert cache.put(
+        db_path,
+        username,
+        question,
+        tool.queries[0],
+        tool.results[0],
+        catalog_version,
+        ledger_version,
+        TODAY,
+    )
+
+    for message in PARAPHRASES:
+        started = time.perf_counter()
+        answer = cache.get(db_path, username, message, catalog_version, TODAY)
+        elapsed = time.perf_counter() - started
+        assert answer is not None, message
+        print(f"{elapsed * 1000:6.2f} ms  {message!r}\n{answer}")
+
+    # A write to the ledger re-runs the cached template
+    before = cache.get(db_path, username, question, catalog_version, TODAY)
+    LedgerTools(db_path, username).add_transaction(
+        "2025-04-19 12:00:00", 50000, "VND", "Chi tiêu", "ăn uống", "Dinner"
+    )
+    after = cache.get(db_path, username, question, catalog_version, TODAY)
+    assert before != after, after
+    print("after a write:\n" + after)
+
+    # Next month the same question covers the new window
+    print(
+        "next month:\n"
+        + cache.get(db_path, username, question, catalog_version, date(2025, 5, 3))
+    )
+
+    # Writes and non-questions are never cached
+    assert not cache.put(
+        db_path,
+        username,
+        "ăn uống 50k",
+        PLANNED_SQL,
+        tool.results[0],
+        catalog_version,
+        ledger_version,
+        TODAY,
+    )
+
+    # Templates are re-run in the sandbox: one reading a file is dropped
+    file_question = "How many times did I spend this month?"
+    file_sql = (
+        "SELECT COUNT(1) AS times FROM read_csv('/etc/passwd') "
+        "WHERE column0 = 'tester' AND column1 >= '2025-04-01'"
+    )
+    ledger_version = cache.ledger_version(db_path, username)
+    assert cache.put(
+        db_path,
+        username,
+        file_question,
+        file_sql,
+        QueryResult(columns=["times"], rows=[(1,)]),
+        catalog_version,
+        ledger_version,
+        TODAY,
+    )
+    LedgerTools(db_path, username).add_transaction(
+        "2025-04-19 13:00:00", 20000, "VND", "Chi tiêu", "ăn uống", "Tea"
+    )
+    assert cache.get(db_path, username, file_question, catalog_version, TODAY) is None
+    print("stats:", cache.stats, f"hit rate {cache.stats.hit_rate:.0%}")
+
+
+if __name__ == "__main__":
+    test_routing()
+    test()
@@ -0,0 +1,104 @@
+import asyncio
+import time
+
+import pandas as pd
+from google.auth.credentials import AnonymousCredentials
+
+from services.rate_limit import TokenBucket
+from services.sheets import GoogleSheetService
+from services.sheets_async import AsyncGoogleSheetService
+from tests.manual.fake_sheets import FakeSheets
+
+SHEET_ID = "fake-spreadsheet"
+QUOTA = 20  # requests per second the fake server accepts
+READS = 120
+
+
+def test_bucket():
+    bucket = TokenBucket("test", rate=10, burst=5)
+    started = time.perf_counter()
+    for _ in range(15):
+        bucket.acquire()
+    elapsed = time.perf_counter() - started
+    # 5 at once, then 10 more at 10/s
+    print(f"bucket:   15 calls in {elapsed:.2f}s, {bucket.stats}")
+    assert 0.9 <= elapsed <= 1.3
+
+    bucket.throttle()
+    bucket.throttle()  # same burst of 429s, within the cooldown
+    assert bucket.rate == 5 and bucket.stats.decreases == 1
+    time.sleep(0.5)
+    bucket.succeed()
+    assert 5.4 <= bucket.rate <= 5.6, bucket.rate
+    time.sleep(5)
+    bucket.succeed()
+    assert bucket.rate == 10
+    print("          throttled to 5/s once, recovered by 1/s per second")
+
+
+async def burst(fake: FakeSheets, limiter: TokenBucket | None) -> str:
+    fake.calls.clear()
+    await asyncio.sleep(1.1)  # empty the server's window
+    async with AsyncGoogleSheetService(
+        credentials=AnonymousCredentials(),
+        base_url=fake.url,
+        max_concurrency=16,
+        max_retries=10,
+        backoff=0.05,
+        cache=None,
+        limiter=limiter,
+    ) as sheets:
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(sheets.read_sheet_values(SHEET_ID, "Sheet1!A1:D1") for _ in range(READS))
+        )
+        elapsed = time.perf_counter() - started
+    line = (
+        f"{READS} reads in {elapsed:.2f}s, {fake.calls.get('failed', 0)} 429s, "
+        f"{sheets.stats.retries} retries"
+    )
+    if limiter is not None:
+        line += f", rate {limiter.rate:.1f}/s, utilization {limiter.utilization():.0%}"
+    return line
+
+
+async def test_adaptive(fake: FakeSheets):
+    print(f"server quota {QUOTA}/s")
+    print(f"no limiter:          {await burst(fake, None)}")
+    # Budget set above the real quota: 429s cut the rate until they stop
+    over = TokenBucket("sheets", rate=2 * QUOTA, burst=QUOTA // 2, cooldown=0.5)
+    print(f"limiter at 2x quota: {await burst(fake, over)}")
+    under = TokenBucket("sheets", rate=0.75 * QUOTA, burst=QUOTA // 4)
+    print(f"limiter under quota: {await burst(fake, under)}")
+    assert under.stats.throttled <= 1 and over.stats.decreases >= 1
+
+
+def test_google_client(fake: FakeSheets):
+    """The sync client reports 429s through the request builder"""
+    limiter = TokenBucket("sheets", rate=50)
+    service = GoogleSheetService(service=fake.service(limiter), cache=None)
+    fake.failures = [429]
+    try:
+        service.read_sheet_values(SHEET_ID, "Sheet1!A1:D1")
+    except Exception as e:
+        print(f"sync:     {type(e).__name__}, rate {limiter.rate}/s")
+    assert limiter.stats.throttled == 1 and limiter.rate == 25
+
+
+def main():
+    test_bucket()
+    fake = FakeSheets().start()
+    try:
+        service = GoogleSheetService(service=fake.service(), cache=None)
+        service.write_sheet_values(
+            SHEET_ID, "Sheet1!A1:D1", pd.DataFrame([["2025-04-01", "1", "VND", "x"]])
+        )
+        test_google_client(fake)
+        fake.quota = QUOTA
+        asyncio.run(test_adaptive(fake))
+    finally:
+        fake.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import shutil
+from pathlib import Path
+
+import pandas as pd
+
+from config.settings import settings
+from services.sheet_cache import SheetRangeCache
+from services.sheets import GoogleSheetService
+from tests.manual.fake_sheets import FakeSheets
+
+SHEET_ID = "fake-spreadsheet"
+RANGE = "Sheet1!A1:D500"
+READS = 20
+
+
+def fill(service: GoogleSheetService, rows: int, tag: str = "note"):
+    frame = pd.DataFrame(
+        [
+            [f"2025-04-{1 + i % 28:02d}", str(1000 * i), "VND", f"{tag} {i}"]
+            for i in range(rows)
+        ]
+    )
+    service.write_sheet_values(SHEET_ID, f"Sheet1!A1:D{rows}", frame)
+
+
+def show(step: str, fake: FakeSheets, cache: SheetRangeCache):
+    stats = cache.stats
+    print(
+        f"{step:<18} requests={fake.requests:<3} get={fake.calls.get('get', 0):<3} "
+        f"files.get={fake.calls.get('files.get', 0):<3} memory={stats.memory_hits} "
+        f"disk={stats.disk_hits} misses={stats.misses} evictions={stats.evictions} "
+        f"hit rate={stats.hit_rate:.0%}"
+    )
+
+
+def test():
+    cache_dir = Path(settings.DATA_DIR) / "test_sheet_cache"
+    shutil.rmtree(cache_dir, ignore_errors=True)
+
+    fake = FakeSheets().start()
+    try:
+        cache = SheetRangeCache(cache_dir)
+        service = GoogleSheetService(
+            service=fake.service(), drive=fake.drive(), cache=cache
+        )
+        fill(service, 500)
+
+        # Unchanged spreadsheet: one fetch, then metadata requests only
+        first = service.read_sheet_values(SHEET_ID, RANGE)
+        for _ in range(READS - 1):
+            assert service.read_sheet_values(SHEET_ID, RANGE).equals(first)
+        show("repeated reads", fake, cache)
+        assert fake.calls["get"] == 1 and cache.stats.memory_hits == READS - 1
+
+        # A new process finds the Parquet copy
+        cache = SheetRangeCache(cache_dir)
+        service = GoogleSheetService(
+            service=fake.service(), drive=fake.drive(), cache=cache
+        )
+        assert service.read_sheet_values(SHEET_ID, RANGE).equals(first)
+        show("fresh cache", fake, cache)
+        assert fake.calls["get"] == 1 and cache.stats.disk_hits == 1
+
+        # A write bumps the version
+        fill(service, 500, tag="edited")
+        edited = service.read_sheet_values(SHEET_ID, RANGE)
+        show("after write", fake, cache)
+        assert fake.calls["get"] == 2 and edited.iloc[0, 3] == "edited 0"
+
+        # An edit made elsewhere is caught by the version check too
+        fake.cells[(SHEET_ID, "Sheet1", 1, 4)] = "typed"
+        fake.touch(SHEET_ID)
+        typed = service.read_sheet_values(SHEET_ID, RANGE)
+        show("edited elsewhere", fake, cache)
+        assert fake.calls["get"] == 3 and typed.iloc[0, 3] == "typed"
+
+        # Disk bounded in bytes
+        size = sum(path.stat().st_size for path in cache_dir.glob("*.parquet"))
+        cache = SheetRangeCache(cache_dir, max_disk_bytes=size * 2)
+        service = GoogleSheetService(
+            service=fake.service(), drive=fake.drive(), cache=cache
+        )
+        for rows in range(10, 500, 50):
+            service.read_sheet_values(SHEET_ID, f"Sheet1!A1:D{rows}")
+        show("eviction", fake, cache)
+        kept = sum(path.stat().st_size for path in cache_dir.glob("*.parquet"))
+        assert cache.stats.evictions > 0 and kept <= size * 2
+
+        # An injected service without Drive reads uncached, with no OAuth flow
+        gets = fake.calls["get"]
+        service = GoogleSheetService(service=fake.service(), cache=cache)
+        assert service.read_sheet_values(SHEET_ID, RANGE).equals(typed)
+        assert service.drive is None and fake.calls["get"] == gets + 1
+    finally:
+        fake.stop()
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    test()
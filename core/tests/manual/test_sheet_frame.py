@@ -0,0 +1,33 @@
+from services.sheet_frame import to_transaction_frame
+
+HEADER = ["Date", "Amount", "Currency"]
+# Cell, currency, amount: dots group thousands in VND and in "1.234.567"
+AMOUNTS = [
+    ("1.234", "VND", 1234.0),
+    ("1.500,5", "VND", 1500.5),
+    ("1.500.000", "VND", 1_500_000.0),
+    ("45,000", "VND", 45000.0),
+    ("1.234", "USD", 1.234),
+    ("0.125", "USD", 0.125),
+    ("0.125", "VND", 0.125),
+    ("12.99", "EUR", 12.99),
+    ("1.234.567", "USD", 1_234_567.0),
+]
+
+
+def test():
+    values = [HEADER] + [
+        ["2025-04-01", cell, currency] for cell, currency, _ in AMOUNTS
+    ]
+    frame = to_transaction_frame(values)
+    for (cell, currency, expected), amount in zip(AMOUNTS, frame["amount"]):
+        print(f"{cell:>10} {currency}: {amount:,.3f}")
+        assert amount == expected, (cell, currency, amount)
+
+    # Without a currency column only unambiguous groupings are thousands
+    frame = to_transaction_frame([["Amount"], ["1.234"], ["1.234.567"], ["0.125"]])
+    assert frame["amount"].tolist() == [1.234, 1_234_567.0, 0.125]
+
+
+if __name__ == "__main__":
+    test()
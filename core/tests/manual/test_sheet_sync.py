@@ -0,0 +1,150 @@
+import datetime
+import threading
+import time
+from pathlib import Path
+
+from config.settings import settings
+from db.connection import get_manager
+from db.ingest import ingest_transactions
+from db.schema import Transaction
+from services.sheet_sync import SheetSync
+from services.sheets import GoogleSheetService
+from tests.manual.common import init_test_db
+from tests.manual.fake_sheets import FakeSheets
+from tools.ledger import LedgerTools
+
+SHEET_ID = "fake-spreadsheet"
+TAB = "Ledger"
+ROWS = 500
+
+
+def add_transactions(db_path: Path, username: str, count: int):
+    now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with get_manager(db_path).writer() as conn:
+        ingest_transactions(
+            conn,
+            [
+                Transaction(
+                    id=0,
+                    datetime=f"2025-04-{1 + i % 28:02d} 12:00:00",
+                    amount=1000.0 * (i + 1),
+                    currency="VND",
+                    fund_name="Chi tiêu",
+                    category_name="ăn uống" if i % 2 else "di chuyển",
+                    note=f"row {i}",
+                    created_at=now,
+                    updated_at=now,
+                    by=username,
+                )
+                for i in range(count)
+            ],
+        )
+
+
+def show(step: str, fake: FakeSheets, report):
+    print(
+        f"{step:<24} pushed={report.pushed} pulled={report.pulled} inserted={report.inserted} "
+        f"deleted={report.deleted} conflicts={report.conflicts} rejected={report.rejected} | "
+        f"requests {report.requests} vs {report.full_rewrite_requests}, "
+        f"bytes {report.bytes_sent} vs {report.full_rewrite_bytes} "
+        f"(saved {report.bytes_saved})"
+    )
+
+
+def cell(fake: FakeSheets, row: int, column: int):
+    return fake.cells.get((SHEET_ID, TAB, row, column))
+
+
+def find_row(fake: FakeSheets, transaction_id: int) -> int:
+    return next(
+        r
+        for (s, t, r, c), value in fake.cells.items()
+        if t == TAB and c == 1 and value == transaction_id
+    )
+
+
+def test():
+    db_path = Path(settings.DATA_DIR) / "test_sheet_sync.duckdb"
+    db_path.unlink(missing_ok=True)
+    username = "tester"
+    init_test_db(db_path)
+    add_transactions(db_path, username, ROWS)
+
+    fake = FakeSheets().start()
+    try:
+        sync = SheetSync(
+            db_path,
+            GoogleSheetService(service=fake.service(), cache=None),
+            SHEET_ID,
+            username,
+            tab=TAB,
+        )
+        report = sync.sync()
+        show("initial", fake, report)
+        assert report.pushed == ROWS + 1
+        assert cell(fake, 1, 1) == "id"
+
+        report = sync.sync()
+        show("no changes", fake, report)
+        assert report.pushed == report.pulled == 0
+
+        # One ledger edit: only its row is written
+        ledger = LedgerTools(db_path, username)
+        ledger.update_transaction(3, amount=123456)
+        report = sync.sync()
+        show("ledger edit", fake, report)
+        assert report.pushed == 1 and cell(fake, find_row(fake, 3), 3) == 123456.0
+
+        # One sheet edit: pulled into the ledger
+        row = find_row(fake, 10)
+        fake.cells[(SHEET_ID, TAB, row, 7)] = "edited in sheet"
+        report = sync.sync()
+        show("sheet edit", fake, report)
+        with get_manager(db_path).reader() as conn:
+            note = conn.execute(
+                "SELECT note FROM transaction WHERE id = 10"
+            ).fetchone()[0]
+        assert report.pulled == 1 and note == "edited in sheet", note
+
+        # Both sides: the ledger wins
+        row = find_row(fake, 20)
+        fake.cells[(SHEET_ID, TAB, row, 7)] = "sheet side"
+        ledger.update_transaction(20, note="ledger side")
+        report = sync.sync()
+        show("conflict", fake, report)
+        assert report.conflicts == 1 and cell(fake, row, 7) == "ledger side"
+
+        # A row typed into the sheet, and a ledger delete
+        last = max(r for (s, t, r, c) in fake.cells if t == TAB)
+        for column, value in enumerate(
+            ["", "2025-04-30 08:00:00", "45000", "vnd", "Chi tiêu", "ăn uống", "typed"],
+            1,
+        ):
+            fake.cells[(SHEET_ID, TAB, last + 1, column)] = value
+        ledger.delete_transaction(30)
+        report = sync.sync()
+        show("sheet insert, delete", fake, report)
+        assert report.inserted == 1 and report.deleted == 1
+        assert cell(fake, last + 1, 1) not in ("", None)
+
+        # Ledger writes do not wait for the Sheets requests of a sync
+        fake.latency = 0.3
+        syncing = threading.Thread(target=sync.sync)
+        syncing.start()
+        time.sleep(0.1)
+        started = time.perf_counter()
+        ledger.update_transaction(40, note="during a sync")
+        waited = time.perf_counter() - started
+        syncing.join()
+        fake.latency = 0.0
+        report = sync.sync()
+        show("write during a sync", fake, report)
+        print(f"ledger write waited {waited * 1000:.0f} ms")
+        assert waited < 0.2
+        assert cell(fake, find_row(fake, 40), 7) == "during a sync"
+    finally:
+        fake.stop()
+
+
+if __name__ == "__main__":
+    test()
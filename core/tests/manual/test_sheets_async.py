@@ -0,0 +1,159 @@
+import asyncio
+import time
+
+import pandas as pd
+from google.auth.credentials import AnonymousCredentials
+
+import services.sheets_async
+from services.sheets import GoogleSheetService
+from services.sheets_async import AsyncGoogleSheetService
+from tests.manual.fake_sheets import FakeSheets
+
+SHEET_ID = "fake-spreadsheet"
+USERS = 40  # concurrent handlers, one read each
+LATENCY = 0.05  # seconds per response
+
+
+async def heartbeat(gaps: list[float], interval: float = 0.01):
+    """Ticks while the handlers run, a blocked loop shows up as a long gap"""
+    last = time.perf_counter()
+    while True:
+        await asyncio.sleep(interval)
+        now = time.perf_counter()
+        gaps.append(now - last - interval)
+        last = now
+
+
+async def run(fake: FakeSheets, read) -> tuple[float, float]:
+    gaps: list[float] = []
+    ticker = asyncio.create_task(heartbeat(gaps))
+    started = time.perf_counter()
+    frames = await asyncio.gather(
+        *(read(SHEET_ID, f"Sheet1!A{i + 1}:D{i + 1}") for i in range(USERS))
+    )
+    elapsed = time.perf_counter() - started
+    ticker.cancel()
+    assert all(frame.iloc[0, 3] == f"note {i}" for i, frame in enumerate(frames))
+    return elapsed, max(gaps, default=elapsed)
+
+
+async def test():
+    fake = FakeSheets().start()
+    try:
+        async with AsyncGoogleSheetService(
+            credentials=AnonymousCredentials(),
+            base_url=fake.url,
+            max_concurrency=8,
+            backoff=0.05,
+            cache=None,
+            limiter=None,
+        ) as sheets:
+            rows = pd.DataFrame(
+                [
+                    ["2025-04-01", str(1000 * i), "VND", f"note {i}"]
+                    for i in range(USERS)
+                ]
+            )
+            await sheets.write_sheet_values(SHEET_ID, f"Sheet1!A1:D{USERS}", rows)
+            fake.latency = LATENCY
+
+            # Blocking client called from handlers: the loop stalls on every call
+            blocking = GoogleSheetService(service=fake.service(), cache=None)
+
+            async def read_blocking(sheet_id: str, range_name: str):
+                return blocking.read_sheet_values(sheet_id, range_name)
+
+            elapsed, stall = await run(fake, read_blocking)
+            print(f"blocking: {elapsed:.2f}s, longest loop stall {stall * 1000:.0f} ms")
+
+            connections = fake.connections
+            elapsed, stall = await run(fake, sheets.read_sheet_values)
+            print(
+                f"async:    {elapsed:.2f}s, longest loop stall {stall * 1000:.0f} ms, "
+                f"{fake.connections - connections} connections for {USERS} reads, "
+                f"{sheets.stats}"
+            )
+            assert stall < LATENCY and fake.connections - connections <= 8
+
+            # Throttled and failing responses are retried
+            fake.failures = [429, 429, 503]
+            frame = await sheets.read_sheet_values(SHEET_ID, "Sheet1!A1:D1")
+            print(f"retried:  {sheets.stats}")
+            assert frame.iloc[0, 3] == "note 0" and sheets.stats.retries == 3
+
+            fake.failures = [500] * 10
+            try:
+                await sheets.delete_sheet_values(SHEET_ID, "Sheet1!A1:D1")
+            except Exception as e:
+                print(f"gave up:  {e!r}")
+            else:
+                raise AssertionError("expected the clear to fail")
+            fake.failures = []
+    finally:
+        fake.stop()
+
+
+class FixedBackoff(AsyncGoogleSheetService):
+    def _delay(self, attempt, response) -> float:
+        return 0.5
+
+
+async def test_backoff_slot():
+    """A request backing off does not keep its slot from the others"""
+    fake = FakeSheets().start()
+    try:
+        async with FixedBackoff(
+            credentials=AnonymousCredentials(),
+            base_url=fake.url,
+            max_concurrency=1,
+            cache=None,
+            limiter=None,
+        ) as sheets:
+            await sheets.write_sheet_values(
+                SHEET_ID,
+                "Sheet1!A1:D1",
+                pd.DataFrame([["2025-04-01", "1", "VND", "x"]]),
+            )
+            fake.latency = LATENCY
+            fake.failures = [503]
+            retried = asyncio.create_task(sheets.read_sheet_values(SHEET_ID, "A1:D1"))
+            await asyncio.sleep(2 * LATENCY)
+            started = time.perf_counter()
+            await sheets.read_sheet_values(SHEET_ID, "A1:D1")
+            elapsed = time.perf_counter() - started
+            await retried
+            print(f"during a 0.5s backoff: other read done in {elapsed:.2f}s")
+            assert elapsed < 0.3
+    finally:
+        fake.stop()
+
+
+def slow_login(scopes: list[str]) -> AnonymousCredentials:
+    time.sleep(0.3)  # like reading the token file or waiting for the browser
+    return AnonymousCredentials()
+
+
+async def test_login_off_loop():
+    """Credentials are loaded in a worker thread, not on the event loop"""
+    fake = FakeSheets().start()
+    login = services.sheets_async.auth_google_installed_app_flow
+    services.sheets_async.auth_google_installed_app_flow = slow_login
+    try:
+        gaps: list[float] = []
+        ticker = asyncio.create_task(heartbeat(gaps))
+        async with AsyncGoogleSheetService(
+            base_url=fake.url, cache=None, limiter=None
+        ) as sheets:
+            await sheets.read_sheet_values(SHEET_ID, "Sheet1!A1:D1")
+        ticker.cancel()
+        print(f"login: longest loop stall {max(gaps) * 1000:.0f} ms")
+        assert max(gaps) < 0.1
+    finally:
+        services.sheets_async.auth_google_installed_app_flow = login
+        fake.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(test())
+    asyncio.run(test_backoff_slot())
+    asyncio.run(test_login_off_loop())
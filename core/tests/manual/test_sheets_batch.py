@@ -0,0 +1,83 @@
+import time
+
+import pandas as pd
+
+from services.sheets import GoogleSheetService
+from tests.manual.fake_sheets import FakeSheets
+
+SHEET_ID = "fake-spreadsheet"
+ROWS = 200
+BLOCK = 10  # rows per operation, as a sync would page through a sheet
+
+
+def make_block(start: int) -> pd.DataFrame:
+    return pd.DataFrame(
+        [
+            [f"2025-04-{1 + i % 28:02d}", str(1000 * i), "VND", f"note {i}"]
+            for i in range(start, start + BLOCK)
+        ]
+    )
+
+
+def run_unbatched(fake: FakeSheets) -> float:
+    service = GoogleSheetService(service=fake.service(), cache=None)
+    started = time.perf_counter()
+    for start in range(1, ROWS + 1, BLOCK):
+        service.write_sheet_values(
+            SHEET_ID, f"Sheet1!A{start}:D{start + BLOCK - 1}", make_block(start)
+        )
+    for start in range(1, ROWS + 1, BLOCK):
+        service.read_sheet_values(SHEET_ID, f"Sheet1!A{start}:D{start + BLOCK - 1}")
+    return time.perf_counter() - started
+
+
+def run_batched(fake: FakeSheets) -> float:
+    service = GoogleSheetService(service=fake.service(), cache=None)
+    started = time.perf_counter()
+    with service.batcher() as batch:
+        writes = [
+            batch.write_sheet_values(
+                SHEET_ID, f"Sheet1!A{start}:D{start + BLOCK - 1}", make_block(start)
+            )
+            for start in range(1, ROWS + 1, BLOCK)
+        ]
+        reads = {
+            start: batch.read_sheet_values(
+                SHEET_ID, f"Sheet1!A{start}:D{start + BLOCK - 1}"
+            )
+            for start in range(1, ROWS + 1, BLOCK)
+        }
+        # Clears of a few cells, merged into one range
+        clears = [
+            batch.delete_sheet_values(SHEET_ID, f"Sheet1!D{row}") for row in (5, 6, 7)
+        ]
+        final = batch.read_sheet_values(SHEET_ID, "Sheet1!A1:D10")
+        batch.flush()
+
+        for future in writes + clears:
+            future.result()
+        # Each caller gets its own slice of the merged range
+        for start, future in reads.items():
+            frame = future.result()
+            assert frame.values.tolist() == make_block(start).values.tolist(), start
+        assert final.result()[3].tolist()[4:7] == [None, None, None], final.result()
+        print("batcher:", batch.stats, f"merged={batch.stats.merged}")
+    return time.perf_counter() - started
+
+
+def test():
+    fake = FakeSheets().start()
+    try:
+        unbatched = run_unbatched(fake)
+        print(f"unbatched: {fake.requests} requests {fake.calls} in {unbatched:.3f}s")
+        fake.cells.clear()
+        fake.calls.clear()
+
+        batched = run_batched(fake)
+        print(f"batched:   {fake.requests} requests {fake.calls} in {batched:.3f}s")
+    finally:
+        fake.stop()
+
+
+if __name__ == "__main__":
+    test()
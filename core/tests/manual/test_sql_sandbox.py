@@ -0,0 +1,74 @@
+import time
+from pathlib import Path
+
+from agents.query_cache import RecordingDuckDbTools
+from config.settings import settings
+from db.connection import get_manager
+from db.sandbox import QueryRejected, QuerySandbox
+from tests.manual.common import init_test_db
+from tools.ledger import LedgerTools
+
+REJECTED = [
+    "INSERT INTO fund VALUES (99, 'x')",
+    "DELETE FROM transaction",
+    "DROP TABLE transaction",
+    "COPY transaction TO '/tmp/leak.csv'",
+    "ATTACH '/tmp/other.duckdb'",
+    "SET threads = 64",
+    "PRAGMA show_tables",
+    "SELECT 1; DELETE FROM transaction",
+    "SELECT * FROM read_csv('/etc/passwd')",
+    "SELECT * FROM '/etc/passwd'",
+    "SELECT * FROM fund WHERE id IN (SELECT 1 FROM read_text('/etc/hosts'))",
+    "WITH t AS (SELECT * FROM glob('/*')) SELECT * FROM t",
+]
+RUNAWAY = "SELECT count(*) FROM range(100000000) a, range(100000000) b"
+
+
+def test():
+    db_path = Path(settings.DATA_DIR) / "trackmate.duckdb"
+    init_test_db(db_path)
+    manager = get_manager(db_path)
+    sandbox = QuerySandbox(manager.cursor(), timeout=0.5, max_rows=3)
+
+    for sql in REJECTED:
+        try:
+            sandbox.execute(sql)
+        except QueryRejected as e:
+            print(f"rejected: {sql[:50]!r}: {e}")
+        else:
+            raise AssertionError(f"ran {sql!r}")
+
+    result = sandbox.execute(
+        "WITH f AS (SELECT * FROM fund) SELECT * FROM f, range(10) r"
+    )
+    assert len(result.rows) == 3 and result.truncated
+    print(result.as_text())
+    print(sandbox.explain("SELECT * FROM transaction")[:200])
+
+    started = time.perf_counter()
+    try:
+        sandbox.execute(RUNAWAY)
+    except TimeoutError as e:
+        print(f"runaway:  {e} after {time.perf_counter() - started:.2f}s")
+    else:
+        raise AssertionError("the cross join finished")
+    assert time.perf_counter() - started < 1.5
+
+    # The agent toolkit answers errors instead of raising
+    tools = RecordingDuckDbTools(sandbox)
+    print("tool:", tools.run_query("DELETE FROM transaction"))
+    assert tools.run_query("SHOW TABLES").startswith("name")
+    assert "Referenced column" in tools.run_query("SELECT nope FROM fund")
+
+    # The ledger is still writable through its own cursors
+    LedgerTools(db_path, "tester").add_transaction(
+        "2025-04-19 12:00:00", 50000, "VND", "Chi tiêu", "ăn uống", "Dinner"
+    )
+    print("stats:", sandbox.stats)
+    assert sandbox.stats.rejected == len(REJECTED) + 1
+    assert sandbox.stats.timeouts == 1 and sandbox.stats.truncated >= 1
+
+
+if __name__ == "__main__":
+    test()
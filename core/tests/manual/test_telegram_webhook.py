@@ -0,0 +1,304 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+import httpx
+from agno.run.response import RunResponse
+from telegram import Update
+
+from agents.pool import AgentPool
+from cli.dispatcher import QueuedUpdateProcessor
+from cli.telegram import create_bot
+from config.settings import settings
+
+WEBHOOK_PORT = 8765
+WEBHOOK_PATH = "telegram"
+SECRET = "manual-test-secret"
+AGENT_DELAY = 0.5  # seconds per answer
+# Questions the ledger route must leave to the chat agent and its Sheets tools
+SHEET_REQUESTS = [
+    "Thêm sheet mới cho tháng 11?",
+    "what is in my google sheet",
+    "list my sheets",
+    "bắt đầu ghi sổ cho tôi nhé",
+]
+
+
+class FakeTelegram(BaseHTTPRequestHandler):
+    """Minimal Bot API: answers every method and records the sent messages"""
+
+    sent: list[dict] = []
+    texts: dict[int, str] = {}  # message_id -> latest text
+    files: dict[str, bytes] = {}  # file_id -> content, for getFile
+    message_id = 0
+
+    def _reply(
+        self, payload: bytes, content_type: str = "application/json", status: int = 200
+    ):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        # File downloads: /bot/file<token>/<file_id>
+        self._reply(FakeTelegram.files[self.path.rsplit("/", 1)[-1]], "image/jpeg")
+
+    def do_POST(self):
+        method = self.path.rsplit("/", 1)[-1]
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode()
+        if self.headers.get("Content-Type", "").startswith("application/json"):
+            params = json.loads(body or "{}")
+        else:
+            params = dict(parse_qsl(body))
+
+        if method == "getMe":
+            result = {
+                "id": 1,
+                "is_bot": True,
+                "first_name": "Trackmate",
+                "username": "trackmate_test_bot",
+            }
+        elif method in ("sendMessage", "editMessageText"):
+            if method == "sendMessage":
+                FakeTelegram.message_id += 1
+                message_id = FakeTelegram.message_id
+            else:
+                message_id = int(params["message_id"])
+            FakeTelegram.sent.append(
+                {
+                    "method": method,
+                    "at": time.perf_counter(),
+                    "message_id": message_id,
+                    **params,
+                }
+            )
+            FakeTelegram.texts[message_id] = params.get("text", "")
+            result = {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": int(params["chat_id"]), "type": "private"},
+                "text": params.get("text", ""),
+            }
+        elif method == "getFile":
+            file_id = params["file_id"]
+            if file_id not in FakeTelegram.files:
+                error = {"ok": False, "error_code": 400, "description": "Bad Request"}
+                self._reply(json.dumps(error).encode(), status=400)
+                return
+            result = {
+                "file_id": file_id,
+                "file_unique_id": file_id,
+                "file_size": len(FakeTelegram.files[file_id]),
+                "file_path": file_id,
+            }
+        else:
+            result = True
+
+        self._reply(json.dumps({"ok": True, "result": result}).encode())
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubAgent:
+    def __init__(self, chat_id: str):
+        self.chat_id = chat_id
+
+    async def arun(
+        self, message: str, user_id: str | None = None, stream: bool = False
+    ) -> RunResponse:
+        if stream:
+            return self._stream(message)
+        await asyncio.sleep(AGENT_DELAY)
+        return RunResponse(content=f"echo {message}")
+
+    async def _stream(self, message: str):
+        if message == "fail":
+            raise RuntimeError("agent failed")
+        words = [] if message == "silent" else ["echo", *message.split()]
+        for i, word in enumerate(words):
+            await asyncio.sleep(AGENT_DELAY / len(words))
+            yield RunResponse(content=word if i == 0 else f" {word}")
+
+
+def make_update(update_id: int, chat_id: int, text: str) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": f"user{chat_id}"},
+            "text": text,
+        },
+    }
+
+
+async def run(chats: int, messages_per_chat: int):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeTelegram)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/bot"
+
+    # The fake server accepts any token
+    settings.TELEGRAM_BOT_TOKEN = settings.TELEGRAM_BOT_TOKEN or "123456:fake-token"
+    pool = AgentPool(StubAgent)
+    bot = create_bot(pool=pool, base_url=base_url)
+    await bot.initialize()
+    await bot.start()
+    await bot.updater.start_webhook(
+        listen="127.0.0.1",
+        port=WEBHOOK_PORT,
+        url_path=WEBHOOK_PATH,
+        webhook_url=f"http://127.0.0.1:{WEBHOOK_PORT}/{WEBHOOK_PATH}",
+        secret_token=SECRET,
+    )
+
+    updates = [
+        make_update(chat * 1000 + i, chat, f"message {i}")
+        for i in range(messages_per_chat)
+        for chat in range(1, chats + 1)
+    ]
+    # An agent that fails or says nothing
+    failing = chats + 1
+    updates += [
+        make_update(failing * 1000 + i, failing, text)
+        for i, text in enumerate(["fail", "silent"])
+    ]
+    # Requests about sheets, even phrased as questions, reach the chat agent
+    sheets = chats + 2
+    updates += [
+        make_update(sheets * 1000 + i, sheets, text)
+        for i, text in enumerate(SHEET_REQUESTS)
+    ]
+    started = time.perf_counter()
+    async with httpx.AsyncClient() as client:
+        await asyncio.gather(
+            *(
+                client.post(
+                    f"http://127.0.0.1:{WEBHOOK_PORT}/{WEBHOOK_PATH}",
+                    json=update,
+                    headers={"X-Telegram-Bot-Api-Secret-Token": SECRET},
+                )
+                for update in updates
+            )
+        )
+    processor = bot.update_processor
+    while processor.metrics.processed + processor.metrics.failed < len(updates):
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - started
+
+    await bot.updater.stop()
+    await bot.stop()
+    await bot.shutdown()
+    server.shutdown()
+
+    sequential = len(updates) * AGENT_DELAY
+    print(
+        f"{len(updates)} updates answered in {elapsed:.2f}s (sequential: {sequential:.2f}s)"
+    )
+    print("dispatcher:", bot.update_processor.snapshot())
+    print("pool:", pool.stats)
+
+    # Each chat must be answered in the order its messages were sent
+    for chat in range(1, chats + 1):
+        replies = [
+            FakeTelegram.texts[m["message_id"]]
+            for m in FakeTelegram.sent
+            if m["method"] == "sendMessage" and int(m["chat_id"]) == chat
+        ]
+        assert replies == [f"echo message {i}" for i in range(messages_per_chat)], (
+            replies
+        )
+    print("per-chat ordering: ok")
+
+    replies = [
+        FakeTelegram.texts[m["message_id"]]
+        for m in FakeTelegram.sent
+        if m["method"] == "sendMessage" and int(m["chat_id"]) == failing
+    ]
+    assert replies == ["Sorry, I could not answer that."] * 2, replies
+
+    replies = [
+        FakeTelegram.texts[m["message_id"]]
+        for m in FakeTelegram.sent
+        if m["method"] == "sendMessage" and int(m["chat_id"]) == sheets
+    ]
+    assert replies == [f"echo {text}" for text in SHEET_REQUESTS], replies
+    print("sheet requests answered by the chat agent: ok")
+
+    placeholders = [m["at"] for m in FakeTelegram.sent if m["method"] == "sendMessage"]
+    edits = sum(m["method"] == "editMessageText" for m in FakeTelegram.sent)
+    print(f"first placeholder after {placeholders[0] - started:.3f}s, {edits} edits")
+
+
+async def head_of_line(backlog: int = 6):
+    """A chat with a backlog holds one worker, the other chats keep going"""
+    processor = QueuedUpdateProcessor(workers=2)
+    await processor.initialize()
+    pool = AgentPool(StubAgent)
+    finished: dict[int, list[tuple[int, float]]] = {}
+
+    async def handle(chat: int, message_id: int):
+        async with pool.acquire(str(chat)):
+            await asyncio.sleep(AGENT_DELAY / 5)
+        finished.setdefault(chat, []).append((message_id, time.perf_counter()))
+
+    started = time.perf_counter()
+    for message_id, chat in enumerate([1] * backlog + [2, 3]):
+        update = Update.de_json(make_update(message_id, chat, "busy"), None)
+        await processor.do_process_update(update, handle(chat, message_id))
+    await processor.shutdown()
+
+    others = max(at for chat in (2, 3) for _, at in finished[chat]) - started
+    busy = finished[1][-1][1] - started
+    print(f"head of line: other chats done after {others:.2f}s, busy chat {busy:.2f}s")
+    assert [message_id for message_id, _ in finished[1]] == list(range(backlog))
+    assert others < 2 * AGENT_DELAY / 5 + 0.05 < busy
+
+
+async def pool_waiters():
+    """An entry with a message waiting for its lock is not evicted"""
+    pool = AgentPool(StubAgent, max_size=1)
+    agents: list[StubAgent] = []
+    release = asyncio.Event()
+
+    async def first():
+        async with pool.acquire("1") as agent:
+            agents.append(agent)
+            await release.wait()
+        # The lock is free but the waiter has not run yet: other chats sweep
+        async with pool.acquire("2"):
+            pass
+
+    async def waiting():
+        async with pool.acquire("1") as agent:
+            agents.append(agent)
+            await asyncio.sleep(AGENT_DELAY / 5)
+
+    tasks = [asyncio.create_task(first())]
+    await asyncio.sleep(0)
+    tasks.append(asyncio.create_task(waiting()))
+    await asyncio.sleep(0)
+    release.set()
+    await asyncio.sleep(0.01)
+    # Arrives while the waiter holds the lock, it must wait for the same agent
+    async with pool.acquire("1") as agent:
+        agents.append(agent)
+    await asyncio.gather(*tasks)
+    print(f"pool waiters: {pool.stats}")
+    assert all(agent is agents[0] for agent in agents)
+
+
+def test():
+    asyncio.run(run(chats=8, messages_per_chat=3))
+    asyncio.run(head_of_line())
+    asyncio.run(pool_waiters())
+
+
+if __name__ == "__main__":
+    test()
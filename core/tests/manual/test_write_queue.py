@@ -0,0 +1,158 @@
+import asyncio
+import statistics
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+from agents.schema import Expense
+from db.catalog import catalog_cache
+from db.connection import close_all, get_manager
+from db.ingest import ingest_transactions
+from db.shards import ShardDirectory
+from services.write_queue import (
+    FAILED,
+    LedgerSink,
+    QueuedExpense,
+    WriteQueue,
+    WriteQueueWorker,
+)
+
+USERS = ["nhtlong", "vinhloiit", "tester"]
+MESSAGES = 300
+
+
+def expense(i: int) -> Expense:
+    return Expense(
+        date=datetime(2025, 4, 1 + i % 28, 12),
+        category=["food", "grocery", "transport"][i % 3],
+        name=f"item {i}",
+        amount=1000.0 * (i + 1),
+        currency="VND",
+    )
+
+
+class FlakySink:
+    """Fails its first calls like a throttled Sheets API"""
+
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.calls = 0
+
+    async def __call__(self, entries: list[QueuedExpense]):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ConnectionError("503 from the sheet")
+
+
+class CrashAfterLedger(LedgerSink):
+    """Writes the ledger, then dies before the queue marks the batch"""
+
+    crashed = False
+
+    async def __call__(self, entries: list[QueuedExpense]):
+        await super().__call__(entries)
+        if not self.crashed:
+            self.crashed = True
+            raise KeyboardInterrupt
+
+
+def ledger_rows(shards: ShardDirectory) -> int:
+    total = 0
+    for path in shards.paths():
+        with get_manager(path).reader() as cursor:
+            total += cursor.execute("SELECT COUNT(1) FROM transaction").fetchone()[0]
+    return total
+
+
+async def run(tmp: Path):
+    shards = ShardDirectory(tmp / "shards")
+    queue = WriteQueue(tmp / "queue.sqlite")
+    flaky = FlakySink(failures=2)
+    worker = WriteQueueWorker(
+        queue, [LedgerSink(shards), flaky], batch_size=50, interval=0.05, backoff=0.05
+    )
+
+    # A reply waits for a durable append, not for the ledger
+    for user in USERS:
+        shards.path_for(user)
+    append = []
+    for i in range(MESSAGES):
+        started = time.perf_counter()
+        queue.append(USERS[i % 3], [expense(i)], f"chat-{i}")
+        append.append(time.perf_counter() - started)
+    sink, direct = LedgerSink(shards), []
+    for i in range(20):
+        started = time.perf_counter()
+        with get_manager(shards.path_for("tester")).writer() as cursor:
+            frame = sink._frame(
+                [QueuedExpense(0, f"direct-{i}", "tester", expense(i), 0, time.time())]
+            )
+            sink._write(cursor, frame)
+        direct.append(time.perf_counter() - started)
+    print(
+        f"reply after: append p50 {statistics.median(append) * 1000:.2f} ms, "
+        f"direct ledger write p50 {statistics.median(direct) * 1000:.2f} ms"
+    )
+
+    # A redelivered message is not queued twice, an expense without amount fails
+    assert queue.append("tester", [expense(0)], "chat-0") == 0
+    queue.append(
+        "tester", [Expense(**{**expense(0).model_dump(), "amount": None})], "bad"
+    )
+    print("lag before:", queue.lag())
+
+    generations = {
+        user: catalog_cache.version(shards.path_for(user))[0] for user in USERS
+    }
+    worker.start()
+    started = time.perf_counter()
+    while queue.lag()["pending"]:
+        await asyncio.sleep(0.05)
+    drained = time.perf_counter() - started
+    await worker.stop()
+    lag = queue.lag()
+    print(f"drained {MESSAGES} entries in {drained:.2f}s:", worker.snapshot())
+    assert lag["failed"] == 1 and queue.stats.retries > 0
+    # Retried batches were ingested once
+    assert ledger_rows(shards) == MESSAGES + len(direct)
+    # The categories created on the way invalidated the cached catalogs, the
+    # direct writes above had already created those of tester
+    for user in USERS[:2]:
+        assert catalog_cache.version(shards.path_for(user))[0] > generations[user]
+
+    # Crash between the ledger commit and the queue update: written again, once
+    crash = WriteQueueWorker(queue, [CrashAfterLedger(shards)])
+    queue.append("nhtlong", [expense(1000), expense(1001)], "chat-crash")
+    try:
+        await crash.drain()
+    except KeyboardInterrupt:
+        print("crashed after the ledger write, entries still pending:", queue.lag())
+    assert queue.lag()["pending"] == 2
+    await WriteQueueWorker(queue, [LedgerSink(shards)]).drain()
+    assert queue.lag()["pending"] == 0
+    assert ledger_rows(shards) == MESSAGES + len(direct) + 2
+
+    # Keys also guard ingest on its own
+    with get_manager(shards.path_for("nhtlong")).writer() as cursor:
+        again = sink._frame(
+            [QueuedExpense(0, "chat-crash:0", "nhtlong", expense(1000), 0, 0)]
+        )
+        assert ingest_transactions(cursor, again).rows == 0
+
+    with queue._connect() as conn:
+        (error,) = conn.execute(
+            "SELECT error FROM entry WHERE status = ?", (FAILED,)
+        ).fetchone()
+    print("failed entry:", error)
+    assert queue.compact(retention=0) == MESSAGES + 2
+
+
+def test():
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(run(Path(tmp)))
+        close_all()
+
+
+if __name__ == "__main__":
+    test()
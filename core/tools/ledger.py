@@ -0,0 +1,206 @@
+import datetime as datetime_
+import json
+
+from agno.tools import Toolkit
+
+from db.aggregates import spending_summary
+from db.catalog import catalog_cache
+from db.connection import get_manager
+from db.ingest import ingest_transactions
+from db.ledger import delete_transaction, update_transaction
+from db.schema import Transaction
+
+
+class LedgerTools(Toolkit):
+    """Ledger operations that keep the `monthly_spending` totals up to date"""
+
+    def __init__(self, db_path: str, username: str, **kwargs):
+        super().__init__(name="ledger_tools", **kwargs)
+        self.manager = get_manager(db_path)
+        self.username = username
+
+        self.register(self.get_monthly_spending)
+        self.register(self.add_transaction)
+        self.register(self.update_transaction)
+        self.register(self.delete_transaction)
+        self.register(self.add_category)
+
+    def get_monthly_spending(self, month: str, category_name: str | None = None) -> str:
+        """Get the user's spending totals of a month from the pre-aggregated summary.
+        Use this instead of aggregating the transaction table.
+
+        Args:
+            month: any date of the month, in YYYY-MM-DD format
+            category_name: optional category to filter on
+
+        Returns:
+            JSON list of fund_name, category_name, currency, total, transaction_count
+        """
+        with self.manager.reader() as cursor:
+            rows = spending_summary(
+                cursor,
+                self.username,
+                datetime_.date.fromisoformat(month),
+                category_name,
+            )
+        columns = [
+            "fund_name",
+            "category_name",
+            "currency",
+            "total",
+            "transaction_count",
+        ]
+        return json.dumps(
+            [dict(zip(columns, row)) for row in rows], default=str, ensure_ascii=False
+        )
+
+    def add_transaction(
+        self,
+        datetime: str,
+        amount: float,
+        currency: str,
+        fund_name: str,
+        category_name: str,
+        note: str | None = None,
+    ) -> str:
+        """Record a new transaction of the user.
+
+        Args:
+            datetime: timestamp of the transaction, in YYYY-MM-DD HH:MM:SS format
+            amount: positive amount
+            currency: currency code, e.g. VND, USD
+            fund_name: name of an existing fund
+            category_name: name of an existing category of that fund
+            note: optional note
+
+        Returns:
+            Confirmation message
+        """
+        now = datetime_.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        transaction = Transaction(
+            id=0,  # assigned by the ledger sequence
+            datetime=datetime,
+            amount=amount,
+            currency=currency,
+            fund_name=fund_name,
+            category_name=category_name,
+            note=note,
+            created_at=now,
+            updated_at=now,
+            by=self.username,
+        )
+        with self.manager.writer() as cursor:
+            try:
+                ingest_transactions(cursor, [transaction])
+            except ValueError as e:
+                return str(e)
+        return "Transaction recorded"
+
+    def update_transaction(
+        self,
+        transaction_id: int,
+        datetime: str | None = None,
+        amount: float | None = None,
+        currency: str | None = None,
+        fund_name: str | None = None,
+        category_name: str | None = None,
+        note: str | None = None,
+    ) -> str:
+        """Update a transaction of the user, only the given fields change.
+
+        Args:
+            transaction_id: ID of the transaction
+            datetime: new timestamp, in YYYY-MM-DD HH:MM:SS format
+            amount: new positive amount
+            currency: new currency code, e.g. VND, USD
+            fund_name: name of an existing fund
+            category_name: name of an existing category
+            note: new note
+
+        Returns:
+            Confirmation message
+        """
+        changes = {
+            column: value
+            for column, value in [
+                ("datetime", datetime),
+                ("amount", amount),
+                ("currency", currency),
+                ("note", note),
+            ]
+            if value is not None
+        }
+        with self.manager.writer() as cursor:
+            owner = cursor.execute(
+                "SELECT by FROM transaction WHERE id = ?", (transaction_id,)
+            ).fetchone()
+            if owner is None or owner[0] != self.username:
+                return f"Transaction {transaction_id} not found"
+            for table, name in [("fund", fund_name), ("category", category_name)]:
+                if name is None:
+                    continue
+                row = cursor.execute(
+                    f"SELECT id FROM {table} WHERE {table}_name = ?", (name,)
+                ).fetchone()
+                if row is None:
+                    return f"{table.capitalize()} {name} not found"
+                changes[f"{table}_id"] = row[0]
+            if not changes:
+                return "Nothing to update"
+            try:
+                update_transaction(cursor, transaction_id, changes)
+            except ValueError as e:
+                return str(e)
+        return f"Transaction {transaction_id} updated"
+
+    def delete_transaction(self, transaction_id: int) -> str:
+        """Delete a transaction of the user.
+
+        Args:
+            transaction_id: ID of the transaction
+
+        Returns:
+            Confirmation message
+        """
+        with self.manager.writer() as cursor:
+            owner = cursor.execute(
+                "SELECT by FROM transaction WHERE id = ?", (transaction_id,)
+            ).fetchone()
+            if owner is None or owner[0] != self.username:
+                return f"Transaction {transaction_id} not found"
+            delete_transaction(cursor, transaction_id)
+        return f"Transaction {transaction_id} deleted"
+
+    def add_category(
+        self, category_name: str, fund_name: str, note: str | None = None
+    ) -> str:
+        """Create a new category in an existing fund.
+
+        Args:
+            category_name: name of the new category
+            fund_name: name of an existing fund
+            note: optional note
+
+        Returns:
+            Confirmation message
+        """
+        now = datetime_.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self.manager.writer() as cursor:
+            fund = cursor.execute(
+                "SELECT id FROM fund WHERE fund_name = ?", (fund_name,)
+            ).fetchone()
+            if fund is None:
+                return f"Fund {fund_name} not found"
+            exists = cursor.execute(
+                "SELECT 1 FROM category WHERE category_name = ?", (category_name,)
+            ).fetchone()
+            if exists is not None:
+                return f"Category {category_name} already exists"
+            cursor.execute(
+                "INSERT INTO category (category_name, fund_id, created_at, updated_at, by, note) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (category_name, fund[0], now, now, self.username, note),
+            )
+        # Prompts embed the catalog, the next question sees the new category
+        catalog_cache.invalidate(self.manager.db_path)
+        return f"Category {category_name} created"
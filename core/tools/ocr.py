@@ -1,41 +1,396 @@
 # https://github.com/run-llama/llama_cloud_services/blob/main/parse.md
 
-import os
+import asyncio
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, Iterable, Protocol
+
+import httpx
 import rich
-import nest_asyncio
 from llama_cloud_services import LlamaParse
 
-from dotenv import load_dotenv
-load_dotenv()
-nest_asyncio.apply()
+from config.logger import logger
+from config.settings import settings
+from services.ocr_cache import OcrCacheKey, OcrResultCache, ocr_cache
+from services.rate_limit import TokenBucket, rate_limits
+from services.receipt_image import PreprocessStats, ReceiptPreprocessor
 
-def ocr_single(filepath, premium=False, verbose=False):
-    parser = LlamaParse(
-        api_key=os.getenv('LLAMA_CLOUD_API_KEY'),
-        result_type="markdown",  # "markdown" and "text" are available
-        num_workers=4, # if multiple files passed, split in `num_workers` API calls
-        verbose=verbose,
-        premium_mode=premium, # https://docs.cloud.llamaindex.ai/llamaparse/parsing/parsing_modes
-        language="en",  # Optionally you can define a language, default=en
+OcrInput = str | Path | bytes
+
+
+def _file_name(file: OcrInput, index: int = 0) -> str:
+    return f"receipt-{index}.jpg" if isinstance(file, bytes) else Path(file).name
+
+
+def _read(file: OcrInput) -> bytes:
+    return file if isinstance(file, bytes) else Path(file).read_bytes()
+
+
+def _rate_limited(error: BaseException | None) -> bool:
+    """Whether an error, or the error it was raised from, is an HTTP 429"""
+    while error is not None:
+        if (
+            isinstance(error, httpx.HTTPStatusError)
+            and error.response.status_code == 429
+        ):
+            return True
+        error = error.__cause__
+    return False
+
+
+class OcrBackend(Protocol):
+    """Turns one receipt image or document into text"""
+
+    # Everything that changes the text of a file, part of the cache key
+    options: dict
+
+    async def parse(self, file: OcrInput, file_name: str) -> str: ...
+
+    async def aclose(self) -> None: ...
+
+
+class LlamaParseBackend:
+    """LlamaParse with one parser and HTTP client kept for every parse
+
+    The parser is created on first use, so the backend can be built at import
+    time without an API key.
+
+    Args:
+        api_key: LlamaParse API key, defaults to `LLAMA_CLOUD_API_KEY`
+        premium: use the premium parsing mode
+            (https://docs.cloud.llamaindex.ai/llamaparse/parsing/parsing_modes)
+        result_type: "markdown" or "text"
+        language: language of the documents
+    """
+
+    def __init__(
+        self,
+        api_key: str | None = None,
+        premium: bool = False,
+        result_type: str = "markdown",
+        language: str = "en",
+    ):
+        self.api_key = api_key
+        self.premium = premium
+        self.result_type = result_type
+        self.language = language
+        self._client: httpx.AsyncClient | None = None
+        self._parser = None
+
+    @property
+    def options(self) -> dict:
+        return {
+            "backend": "llamaparse",
+            "premium": self.premium,
+            "result_type": self.result_type,
+            "language": self.language,
+        }
+
+    @property
+    def parser(self):
+        if self._parser is None:
+            self._client = httpx.AsyncClient()
+            self._parser = LlamaParse(
+                api_key=self.api_key or settings.LLAMA_CLOUD_API_KEY,
+                result_type=self.result_type,
+                premium_mode=self.premium,
+                language=self.language,
+                custom_client=self._client,
+                show_progress=False,
+            )
+        return self._parser
+
+    async def parse(self, file: OcrInput, file_name: str) -> str:
+        documents = await self.parser.aload_data(
+            file, extra_info={"file_name": file_name}
+        )
+        return "\n\n".join(document.text_resource.text for document in documents)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+        self._client = None
+        self._parser = None
+
+
+class StubOcrBackend:
+    """Offline backend answering canned text after a delay, for tests
+
+    Args:
+        texts: file name -> text, files not listed get `default`
+        default: text of unlisted files
+        latency: seconds per parse, or file name -> seconds
+        failures: file names whose parse raises
+    """
+
+    def __init__(
+        self,
+        texts: dict[str, str] | None = None,
+        default: str = "",
+        latency: float | dict[str, float] = 0.0,
+        failures: Iterable[str] = (),
+    ):
+        self.texts = texts or {}
+        self.default = default
+        self.latency = latency
+        self.failures = set(failures)
+        self.options = {"backend": "stub"}
+        self.calls = 0
+        self.active = 0
+        self.max_active = 0
+
+    async def parse(self, file: OcrInput, file_name: str) -> str:
+        self.calls += 1
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            latency = (
+                self.latency.get(file_name, 0.0)
+                if isinstance(self.latency, dict)
+                else self.latency
+            )
+            await asyncio.sleep(latency)
+            if file_name in self.failures:
+                raise RuntimeError(f"Failed to parse {file_name}")
+            return self.texts.get(file_name, self.default)
+        finally:
+            self.active -= 1
+
+    async def aclose(self):
+        pass
+
+
+@dataclass
+class OcrResult:
+    file_name: str
+    text: str | None = None
+    error: str | None = None
+    seconds: float = 0.0
+    cached: bool = False
+    preprocess: PreprocessStats | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+@dataclass
+class OcrStats:
+    parsed: int = 0
+    failed: int = 0
+    timeouts: int = 0
+    cache_hits: int = 0
+    seconds: float = 0.0  # parsing, summed over files
+    uploaded_bytes: int = 0  # sent to the backend after preprocessing
+    saved_bytes: int = 0  # by preprocessing
+    preprocess_seconds: float = 0.0
+
+
+class OcrPipeline:
+    """Parse receipts concurrently through a shared backend
+
+    Files already in `cache`, or near-duplicates of a cached photo, are answered
+    without calling the backend. Photos of the others go through `preprocess`,
+    in a worker thread, before being uploaded. At most `max_concurrency` other files are
+    parsed at once, the others queue; once started, a file has `timeout`
+    seconds to finish and spends a token of `limiter`. Failures and timeouts
+    are returned as results instead of raised, so one bad receipt does not
+    sink a batch.
+
+    Args:
+        backend: OCR backend, e.g. `LlamaParseBackend` or `StubOcrBackend`
+        max_concurrency: files parsed at once
+        timeout: seconds per file, waiting for the rate limit included
+        limiter: budget of the backend's API, None to not limit
+        cache: texts of files parsed before, None to always parse
+        preprocess: shrinks photos before the upload, None to send them as is
+    """
+
+    def __init__(
+        self,
+        backend: OcrBackend,
+        max_concurrency: int = 4,
+        timeout: float = 120.0,
+        limiter: TokenBucket | None = rate_limits["llamaparse"],
+        cache: OcrResultCache | None = ocr_cache,
+        preprocess: ReceiptPreprocessor | None = None,
+    ):
+        self.backend = backend
+        self.timeout = timeout
+        self.limiter = limiter
+        self.cache = cache
+        self.preprocess = preprocess
+        self.stats = OcrStats()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _call(self, file: OcrInput, file_name: str) -> str:
+        if self.limiter is not None:
+            await self.limiter.acquire_async()
+        try:
+            text = await self.backend.parse(file, file_name)
+        except Exception as e:
+            if self.limiter is not None and _rate_limited(e):
+                self.limiter.throttle()
+            raise
+        if self.limiter is not None:
+            self.limiter.succeed()
+        return text
+
+    async def parse(self, file: OcrInput, file_name: str | None = None) -> OcrResult:
+        """Parse one file, never raises"""
+        file_name = file_name or _file_name(file)
+        result = OcrResult(file_name)
+        key: OcrCacheKey | None = None
+        if self.cache is not None or self.preprocess is not None:
+            # Hashing, cache files and image processing stay off the event loop
+            try:
+                key, result.text, file, result.preprocess = await asyncio.to_thread(
+                    self._prepare, file
+                )
+            except Exception as e:
+                result.error = str(e) or type(e).__name__
+                self.stats.failed += 1
+                logger.warning("OCR of %s failed: %s", file_name, result.error)
+                return result
+            if result.text is not None:
+                result.cached = True
+                self.stats.cache_hits += 1
+                return result
+            if result.preprocess is not None:
+                self.stats.saved_bytes += result.preprocess.saved_bytes
+                self.stats.preprocess_seconds += sum(result.preprocess.seconds.values())
+                if result.preprocess.saved_bytes:
+                    file_name = f"{Path(file_name).stem}.jpg"
+        if isinstance(file, bytes):
+            self.stats.uploaded_bytes += len(file)
+        async with self._semaphore:
+            started = time.perf_counter()
+            try:
+                result.text = await asyncio.wait_for(
+                    self._call(file, file_name), self.timeout
+                )
+                self.stats.parsed += 1
+            except asyncio.TimeoutError:
+                result.error = f"timed out after {self.timeout:g}s"
+                self.stats.timeouts += 1
+            except Exception as e:
+                result.error = str(e) or type(e).__name__
+                self.stats.failed += 1
+            result.seconds = time.perf_counter() - started
+        self.stats.seconds += result.seconds
+        if result.error:
+            logger.warning("OCR of %s failed: %s", file_name, result.error)
+        elif key is not None:
+            try:
+                await asyncio.to_thread(self.cache.put, key, result.text)
+            except Exception as e:
+                logger.warning("Cannot cache the OCR of %s: %s", file_name, e)
+        return result
+
+    @property
+    def options(self) -> dict:
+        """Everything that changes the text of a file"""
+        return {
+            **self.backend.options,
+            "preprocess": self.preprocess.options if self.preprocess else None,
+        }
+
+    def _prepare(
+        self, file: OcrInput
+    ) -> tuple[OcrCacheKey | None, str | None, bytes, PreprocessStats | None]:
+        """Cache key and cached text of a file, else the bytes to upload"""
+        data = _read(file)
+        key = None
+        if self.cache is not None:
+            key = self.cache.key(data, self.options)
+            text = self.cache.get(key)
+            if text is not None:
+                return key, text, data, None
+        if self.preprocess is None:
+            return key, None, data, None
+        data, stats = self.preprocess.process(data)
+        logger.debug(
+            "Preprocessed receipt: %d -> %d bytes, %.1f degrees, %s",
+            stats.input_bytes,
+            stats.output_bytes,
+            stats.angle,
+            {
+                stage: f"{seconds * 1000:.0f} ms"
+                for stage, seconds in stats.seconds.items()
+            },
+        )
+        return key, None, data, stats
+
+    async def stream(self, files: Iterable[OcrInput]) -> AsyncIterator[OcrResult]:
+        """Parse files concurrently, yielding each result as soon as it is done
+
+        Results come in completion order, not input order. Files still running
+        are cancelled when the generator is closed, consume it within
+        `contextlib.aclosing` to stop early.
+        """
+        tasks = [
+            asyncio.ensure_future(self.parse(file, _file_name(file, i)))
+            for i, file in enumerate(files)
+        ]
+        try:
+            for done in asyncio.as_completed(tasks):
+                yield await done
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def parse_all(self, files: Iterable[OcrInput]) -> list[OcrResult]:
+        """Parse files concurrently, results in input order"""
+        return await asyncio.gather(
+            *(self.parse(file, _file_name(file, i)) for i, file in enumerate(files))
+        )
+
+    async def aclose(self):
+        await self.backend.aclose()
+
+
+def create_pipeline(premium: bool = False) -> OcrPipeline:
+    """LlamaParse pipeline configured by the settings"""
+    return OcrPipeline(
+        LlamaParseBackend(premium=premium),
+        max_concurrency=settings.OCR_MAX_CONCURRENCY,
+        timeout=settings.OCR_TIMEOUT,
+        preprocess=(
+            ReceiptPreprocessor(target_dpi=settings.OCR_TARGET_DPI)
+            if settings.OCR_PREPROCESS
+            else None
+        ),
     )
-    
-    documents = parser.load_data(filepath)
+
+
+async def _run(filepaths: list[OcrInput], premium: bool) -> list[OcrResult]:
+    pipeline = create_pipeline(premium)
+    try:
+        return await pipeline.parse_all(filepaths)
+    finally:
+        await pipeline.aclose()
+
+
+def ocr_single(filepath, premium=False, verbose=False):
+    """Blocking OCR of one file, for scripts; use `OcrPipeline` from async code"""
+    (result,) = asyncio.run(_run([filepath], premium))
+    if not result.ok:
+        raise RuntimeError(result.error)
     if verbose:
-        rich.print(documents[0].text_resource.text)
-    return documents[0].text_resource.text
+        rich.print(result.text)
+    return result.text
+
 
 def ocr_batch(filepaths, premium=False, verbose=False):
-    parser = LlamaParse(
-        api_key=os.getenv('LLAMA_CLOUD_API_KEY'),
-        result_type="markdown",  # "markdown" and "text" are available
-        num_workers=4, # if multiple files passed, split in `num_workers` API calls
-        verbose=verbose,
-        premium_mode=premium, # https://docs.cloud.llamaindex.ai/llamaparse/parsing/parsing_modes
-        language="en",  # Optionally you can define a language, default=en
-    )
-    
-    documents = parser.load_data(filepaths)
-    return [document.text_resource.text for document in documents]
+    """Blocking OCR of several files in parallel, failed files give None"""
+    results = asyncio.run(_run(list(filepaths), premium))
+    if verbose:
+        for result in results:
+            rich.print(result)
+    return [result.text for result in results]
+
 
-if __name__ == '__main__':
-    ocr_single("./img.jpg")
\ No newline at end of file
+if __name__ == "__main__":
+    ocr_single("./img.jpg", verbose=True)
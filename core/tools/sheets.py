@@ -0,0 +1,76 @@
+import json
+from typing import Optional
+
+from agno.tools.googlesheets import GoogleSheetsTools, authenticate
+from googleapiclient.discovery import build
+
+from services.rate_limit import TokenBucket, google_request_builder, rate_limits
+from services.sheet_cache import DRIVE_METADATA_SCOPE, SheetRangeCache, sheet_cache
+
+
+class CachedGoogleSheetsTools(GoogleSheetsTools):
+    """GoogleSheetsTools whose reads go through the local sheet range cache
+
+    The chat agent reads the same range on almost every turn; unchanged
+    spreadsheets are then served locally after one Drive metadata request.
+    Every request, cached reads or not, spends the `sheets` rate limit.
+    """
+
+    def __init__(
+        self,
+        cache: SheetRangeCache = sheet_cache,
+        limiter: TokenBucket = rate_limits["sheets"],
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.cache = cache
+        self.limiter = limiter
+        self.drive = None
+        if DRIVE_METADATA_SCOPE not in self.scopes:
+            self.scopes.append(DRIVE_METADATA_SCOPE)
+
+    def _auth(self) -> None:
+        super()._auth()
+        if self.service is None and self.creds is not None:
+            self.service = build(
+                "sheets",
+                "v4",
+                credentials=self.creds,
+                requestBuilder=google_request_builder(self.limiter),
+            )
+
+    @authenticate
+    def read_sheet(
+        self,
+        spreadsheet_id: Optional[str] = None,
+        spreadsheet_range: Optional[str] = None,
+    ) -> str:
+        """
+        Read values from a Google Sheet. Prioritizes instance attributes over method parameters.
+
+        Args:
+            spreadsheet_id: Fallback spreadsheet ID if instance attribute is None
+            spreadsheet_range: Fallback range if instance attribute is None
+
+        Returns:
+            JSON of list of rows, where each row is a list of values
+        """
+        sheet_id = self.spreadsheet_id or spreadsheet_id
+        sheet_range = self.spreadsheet_range or spreadsheet_range
+        if not sheet_id or not sheet_range:
+            return "Spreadsheet ID and range must be provided either in constructor or method call"
+
+        try:
+            if self.drive is None:
+                self.drive = build(
+                    "drive",
+                    "v3",
+                    credentials=self.creds,
+                    requestBuilder=google_request_builder(self.limiter),
+                ).files()
+            values = self.cache.read(
+                self.service.spreadsheets(), self.drive, sheet_id, sheet_range
+            )
+            return json.dumps(values)
+        except Exception as e:
+            return f"Error reading Google Sheet: {e}"
@@ -0,0 +1,36 @@
+import duckdb
+from agno.tools.duckdb import DuckDbTools
+
+from db.sandbox import QueryRejected, QueryResult, QuerySandbox
+
+
+class SandboxedDuckDbTools(DuckDbTools):
+    """DuckDbTools whose queries all run through a `QuerySandbox`
+
+    Only the read tools are offered: show/describe/summarize tables and
+    run_query. Rejected, failed and interrupted queries are answered with
+    the error so the model can rewrite them.
+    """
+
+    def __init__(self, sandbox: QuerySandbox, **kwargs):
+        super().__init__(
+            connection=sandbox.connection,
+            create_tables=False,
+            export_tables=False,
+            **kwargs,
+        )
+        self.sandbox = sandbox
+
+    def run_query(self, query: str) -> str:
+        """Function that runs a read-only query and returns the result.
+
+        :param query: a single SELECT query
+        :return: Result of the query, or why it was not run
+        """
+        try:
+            return self._execute(query.replace("`", "")).as_text()
+        except (QueryRejected, TimeoutError, duckdb.Error) as e:
+            return str(e)
+
+    def _execute(self, query: str) -> QueryResult:
+        return self.sandbox.execute(query)